@@ -1,11 +1,32 @@
+import time
+# 应用模块开始加载的时间，用于启动耗时报告
+APP_LOAD_STARTED = time.perf_counter()
+import asyncio
+import hashlib
+import os
+import sys
+import random
+import threading
 from datetime import datetime
-import pandas as pd
-import matplotlib.pyplot as plt
 
-from shiny import App, reactive, render, ui
+from shiny import App, reactive, render, run_app, ui
 
-from sim import run_simulation
-from report import  generate_pdf_report
+from cache import SimulationCache, SingleFlight
+from designs import DESIGNS
+from browser import browser_manager
+from jobs import SessionJobs, run_job, executor as job_executor
+from metrics import metrics, profile_call, with_metrics
+from startup import IMPORT_TIMES, prewarm, timed_import
+# 依赖 NumPy 与 pandas 的模块（sim、plots、store 及各分析模块）在首次使用时才以 timed_import 导入，
+# 应用启动与首个页面不必等待
+
+# 默认用于校准的真实数据（仓库中的 Rwork/real_ca.xlsx）
+DEFAULT_REAL_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Rwork", "real_ca.xlsx")
+# 磁盘结果库目录（可用环境变量 SHINYTB_STORE 指定，batch.py --store 写入的结果也可在此浏览）
+RESULT_STORE_DIR = os.environ.get("SHINYTB_STORE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "results"))
+
+# 长期模拟的天数上限（100 年）
+MAX_SIM_DAYS = 365 * 100
 
 # 定义 Shiny Tool的 UI
 app_ui = ui.page_navbar( 
@@ -63,16 +84,38 @@ app_ui = ui.page_navbar(
                 ui.input_numeric("init_recovered", "Initial Recovered", value=0, min=0),
                 ui.input_numeric("init_death", "Initial Death", value=0, min=0),
                 ui.input_numeric("basic_repro", "Basic reproduction number (R₀)", value=1.5, min=0, step=0.01),
-                ui.input_numeric("sim_days", "Simulation Days", value=365, min=1, max=365),
-                ui.input_action_button("simulate", "Simulation")
+                ui.input_numeric("sim_days", "Simulation Days (up to 100 years)", value=365, min=1, max=MAX_SIM_DAYS),
+                ui.input_select("aggregation", "Aggregation", {"calendar_month": "Calendar month", "daily": "Daily", "weekly": "Weekly", "yearly": "Yearly"}),
+                ui.input_select("engine", "Engine", {"continuous": "Continuous (daily update)", "binomial": "Stochastic binomial chain (integer counts)", "ode": "Deterministic ODE (mean rates)", "metapopulation": "Multi-region (mixing matrix)", "age": "Age-structured (contact matrix)"}),
+                ui.input_numeric("replicates", "Replicates (all engines except ODE; more than one shows median and 50%/90% intervals)", value=1, min=1, step=1),
+                ui.panel_conditional(
+                    "input.engine === 'metapopulation'",
+                    ui.input_file("regions_file", "Regions (.xlsx/.csv): Region, Population, Infected, Clinical, Recovered, Death", accept=[".xlsx", ".csv"]),
+                    ui.input_file("mixing_file", "Mixing matrix (.xlsx/.csv): region names in the first column and header", accept=[".xlsx", ".csv"]),
+                    ui.input_numeric("n_regions", "Regions without a file (cases start in region 1)", value=10, min=1, step=1),
+                    ui.input_numeric("mixing_strength", "Between-region mixing without a file", value=0.1, min=0, max=1, step=0.05),
+                ),
+                ui.panel_conditional(
+                    "input.engine === 'age'",
+                    ui.input_file("ages_file", "Age groups (.xlsx/.csv): Age group, Population, Infected, Clinical, Recovered, Death, optional rate multipliers s, i, c, r1, r2, d", accept=[".xlsx", ".csv"]),
+                    ui.input_file("contacts_file", "Contact matrix (.xlsx/.csv): age groups in the first column and header", accept=[".xlsx", ".csv"]),
+                    ui.input_numeric("n_age_groups", "Five-year age groups without a file", value=16, min=1, step=1),
+                    ui.input_numeric("contact_width", "Contact spread across age groups without a file", value=2, min=0.1, step=0.5),
+                ),
+                ui.input_numeric("seed", "Random Seed (leave empty for a random run)", value=2025, min=0, step=1),
+                ui.input_checkbox("profile", "Profile this run (cProfile)", value=False),
+                ui.input_task_button("simulate", "Simulation"),
+                ui.input_action_button("cancel_sim", "Cancel")
             ),
-            ui.output_plot("sim_plot")
+            ui.output_plot("sim_plot"),
+            ui.output_text("sim_timing"),
+            ui.output_ui("sim_profile")
         ),
     ),
 
     ui.nav_panel(
         "Data Table",
-        ui.tags.h5('Here is the monthly statistics in your simulation ', ui.HTML("&#128075;")),
+        ui.tags.h5('Here is the aggregated statistics in your simulation ', ui.HTML("&#128075;")),
         ui.output_data_frame("sim_table"),
         ),
         
@@ -80,17 +123,92 @@ app_ui = ui.page_navbar(
     ui.nav_panel(
     "Report",
     ui.tags.h5('Here is a preview of Simulation Report, you can export the results ', ui.HTML("&#128075;")),
-    ui.tags.span("Exporting results may error due to browser or network reasons, please see the preview below", style="color: #666; font-size: 0.9em;"),
+    ui.tags.span("The native PDF needs no browser; the Chromium export reproduces the preview below and may error due to browser or network reasons", style="color: #666; font-size: 0.9em;"),
     ui.layout_sidebar(
         ui.sidebar(
-                ui.input_text("add","Please enter the address of the browser running this page if cannot export report",placeholder="Optional"),
-                ui.tags.span("Make sure the path points to the browser executable (e.g., chrome.exe/msedge.exe)", style="color: #666; font-size: 0.9em;"),
-                ui.download_button("download_pdf", "Export PDF Report")
+                ui.input_select("pdf_backend", "PDF export", {"native": "Native (vector, no browser)", "chromium": "Chromium (same layout as preview)"}),
+                ui.panel_conditional(
+                    "input.pdf_backend === 'chromium'",
+                    ui.input_text("add","Please enter the address of the browser running this page if cannot export report",placeholder="Optional"),
+                    ui.tags.span("Make sure the path points to the browser executable (e.g., chrome.exe/msedge.exe)", style="color: #666; font-size: 0.9em;"),
+                ),
+                ui.input_select("image_format", "Figure format", {"png": "PNG", "png_compressed": "PNG (compressed)", "svg": "SVG (vector)"}),
+                ui.input_numeric("image_dpi", "Figure DPI", value=100, min=50, max=300, step=10),
+                ui.download_button("download_pdf", "Export PDF Report"),
+                ui.tags.hr(),
+                ui.tags.h6("Batch export"),
+                ui.input_select("batch_source", "Reports for", {"sweep": "R₀ sweep (inputs from the Simulation page)", "stored": "Stored results"}),
+                ui.panel_conditional(
+                    "input.batch_source === 'sweep'",
+                    ui.input_text("batch_r0", "R₀ values ('start:stop:step' or comma-separated)", value="0.5:2.5:0.5"),
+                ),
+                ui.panel_conditional(
+                    "input.batch_source === 'stored'",
+                    ui.input_selectize("batch_stored", "Stored results", choices=[], multiple=True),
+                ),
+                ui.input_numeric("batch_pages", "Reports rendered at once", value=browser_manager.max_pages, min=1, max=browser_manager.max_pages, step=1),
+                ui.download_button("download_zip", "Export ZIP of Reports")
             ),
         ui.output_ui("report_preview")
     ),
     ),
 
+    ui.nav_panel(
+        "Calibration",
+        ui.tags.h5('Fit R₀ (and optionally the transition rates) to real-world data ', ui.HTML("&#128075;")),
+        ui.layout_sidebar(
+            ui.sidebar(
+                ui.input_file("real_file", "Real-world data (.xlsx/.csv), defaults to Rwork/real_ca.xlsx", accept=[".xlsx", ".csv"]),
+                ui.input_select("calib_method", "Method", {"r0": "R₀ only (golden-section search)", "abc": "R₀ + transition rates (ABC)"}),
+                ui.input_select("calib_engine", "Model", {"ensemble": "Stochastic ensemble", "ode": "Deterministic ODE (mean rates, fast)"}),
+                ui.input_numeric("calib_r0_min", "R₀ lower bound", value=0.1, min=0, step=0.1),
+                ui.input_numeric("calib_r0_max", "R₀ upper bound", value=3.0, min=0, step=0.1),
+                ui.input_checkbox_group("calib_rates", "Rates to fit (ABC only)", ["s", "c", "r1", "r2", "d"], selected=["s", "c", "r1", "r2", "d"], inline=True),
+                ui.input_numeric("calib_samples", "ABC samples", value=200, min=10, step=10),
+                ui.input_numeric("calib_replicates", "Replicates per evaluation", value=2, min=1),
+                ui.input_numeric("calib_seed", "Random Seed", value=2025, min=0, step=1),
+                ui.input_task_button("calibrate", "Calibrate"),
+                ui.input_action_button("cancel_calib", "Cancel")
+            ),
+            ui.output_ui("calib_summary"),
+            ui.output_plot("calib_plot", height="600px")
+        ),
+    ),
+
+    ui.nav_panel(
+        "Sensitivity",
+        ui.tags.h5('Find which parameters drive the outcomes (uses the population, initial states and days from the Simulation page) ', ui.HTML("&#128075;")),
+        ui.layout_sidebar(
+            ui.sidebar(
+                ui.input_select("sens_design", "Sampling design", DESIGNS),
+                ui.input_select("sens_engine", "Model", {"ode": "Deterministic ODE (fast)", "continuous": "Continuous (daily update)", "binomial": "Stochastic binomial chain (slow)"}),
+                ui.input_checkbox_group("sens_params", "Parameters to vary", ["R0", "s", "c", "r1", "r2", "d"], selected=["R0", "s", "c", "r1", "r2", "d"], inline=True),
+                ui.input_numeric("sens_r0_min", "R₀ lower bound", value=0.5, min=0, step=0.1),
+                ui.input_numeric("sens_r0_max", "R₀ upper bound", value=3.0, min=0, step=0.1),
+                ui.input_numeric("sens_samples", "Base samples N (runs = N × (parameters + 2); powers of 2 for Sobol)", value=128, min=8, step=8),
+                ui.input_numeric("sens_seed", "Random Seed", value=2025, min=0, step=1),
+                ui.input_task_button("sensitivity", "Run analysis"),
+                ui.input_action_button("cancel_sens", "Cancel")
+            ),
+            ui.output_ui("sens_summary"),
+            ui.output_plot("sens_plot", height="600px")
+        ),
+    ),
+
+    ui.nav_panel(
+        "Stored Results",
+        ui.tags.h5('Browse simulations saved in the result store without re-running them ', ui.HTML("&#128075;")),
+        ui.layout_sidebar(
+            ui.sidebar(
+                ui.input_select("stored_run", "Stored result", choices=[]),
+                ui.input_numeric("stored_replicate", "Replicate to show (empty for the aggregated result)", value=None, min=0, step=1),
+                ui.input_action_button("load_stored", "Show in Simulation"),
+                ui.input_action_button("refresh_store", "Refresh")
+            ),
+            ui.output_data_frame("stored_runs")
+        ),
+    ),
+
     ui.nav_panel(
         "About",
         ui.output_image('logo',inline=True),
@@ -112,6 +230,214 @@ app_ui = ui.page_navbar(
 )
 
 
+# 进程级模拟结果缓存：相同输入与种子的结果在所有会话间复用
+simulation_cache = SimulationCache(max_entries=64, max_bytes=128 * 1024 * 1024)
+# 合并各会话同时发起的相同模拟：后来者等待正在运行的那一次，不重复计算
+single_flight = SingleFlight()
+# 磁盘结果库：模拟结果（及多轨迹引擎的全部轨迹）按场景哈希保存，会话结束或应用重启后仍可读取
+# 每次交互运行都会写入结果库：超过条数或大小上限时淘汰最久未使用的结果
+_result_store = None
+_result_store_lock = threading.Lock()
+
+
+def result_store():
+    """进程级的结果库，首次使用时创建"""
+    global _result_store
+    with _result_store_lock:
+        if _result_store is None:
+            _result_store = timed_import("store").ResultStore(
+                RESULT_STORE_DIR, max_runs=int(os.environ.get("SHINYTB_STORE_MAX_RUNS", 500)),
+                max_bytes=int(float(os.environ.get("SHINYTB_STORE_MAX_MB", 1024)) * 1024 * 1024))
+        return _result_store
+
+
+# 每个会话可同时运行的后台作业（模拟、校准）数量上限
+MAX_SESSION_JOBS = 1
+# 流式模拟每次推送至少 12 条记录（月度聚合约一年），且整个模拟最多推送约 STREAM_MAX_CHUNKS 次，减少逐批构建 DataFrame 的开销
+STREAM_CHUNK_RECORDS = 12
+STREAM_MAX_CHUNKS = 100
+
+# 运行指标：活动会话数、模拟缓存与共享 Chromium 的状态（在 /metrics 抓取时读取）
+active_sessions = {"count": 0}
+metrics.register_gauge("shinytb_active_sessions", "Open Shiny sessions.", lambda: active_sessions["count"])
+for _name, _kind, _help in [
+    ("entries", "gauge", "Entries in the simulation cache."),
+    ("bytes", "gauge", "Approximate bytes held by the simulation cache."),
+    ("hits", "counter", "Simulation cache hits."),
+    ("misses", "counter", "Simulation cache misses."),
+    ("evictions", "counter", "Simulation cache evictions."),
+]:
+    metrics.register_gauge(f"shinytb_sim_cache_{_name}" + ("_total" if _kind == "counter" else ""), _help,
+                           lambda _name=_name: simulation_cache.stats()[_name], kind=_kind)
+# 报告模块在首次预览时才导入，此前报告缓存为空
+metrics.register_gauge("shinytb_report_cache_bytes", "Approximate bytes of encoded report figures and tables.",
+                       lambda: sys.modules["report"].artifact_cache.stats()["bytes"] if "report" in sys.modules else 0)
+metrics.register_gauge("shinytb_sim_inflight", "Distinct simulations currently running.", single_flight.in_flight)
+metrics.register_gauge("shinytb_sim_coalesced_total", "Simulation requests that waited on an identical running simulation.",
+                       lambda: single_flight.coalesced, kind="counter")
+metrics.register_gauge("shinytb_browser_launches_total", "Chromium launches.", lambda: browser_manager.stats()["launches"], kind="counter")
+metrics.register_gauge("shinytb_browser_idle_pages", "Idle Chromium pages in the pool.", lambda: browser_manager.stats()["idle_pages"])
+
+
+def summarize_replicates(data, params):
+    """多条轨迹的结果：数据取每个记录日（及每组）的轨迹均值，参数取轨迹均值，并给出最后一天感染与临床人数均为 0 的轨迹比例"""
+    np, states = timed_import("numpy"), timed_import("sim").STATES
+    replicates = data["Replicate"].nunique()
+    final = data[data["Days"] == data["Days"].max()].groupby("Replicate")[["Infected", "Clinical"]].sum()
+    extinction = float(((final["Infected"] + final["Clinical"]) == 0).mean())
+    if replicates == 1:
+        data = data.drop(columns="Replicate")
+    else:
+        keys = [column for column in data.columns if column not in states and column != "Replicate"]
+        data = data.groupby(keys, as_index=False, sort=False)[states].mean()
+    params = {key: float(np.mean(value)) for key, value in params.items()}
+    params["Replicates"] = replicates
+    params["Extinction probability"] = extinction
+    return data, params
+
+
+def file_digest(path):
+    """上传文件内容的哈希（上传的临时路径每次不同，结果库以内容区分场景）"""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def store_scenario(inputs, seed, aggregation, engine, replicates, structure):
+    """结果库中的场景描述：与 batch.py 相同的字段名；ode 引擎与种子无关，不含种子"""
+    scenario = dict(zip(["population", "init_infected", "init_clinical", "init_recovered", "init_death",
+                         "basic_repro", "sim_days"], inputs))
+    scenario.update(seed=seed, replicates=replicates, engine=engine, aggregation=aggregation)
+    if engine == "ode":
+        del scenario["seed"]
+    if structure is not None:
+        scenario["structure"] = [file_digest(item) if isinstance(item, str) else item for item in structure]
+    return scenario
+
+
+def save_result(scenario, result, trajectories=None):
+    """将结果写入结果库（多轨迹时同时保存全部轨迹的长表与不确定性区间表），返回场景哈希；写入失败只记录日志"""
+    try:
+        with result_store().writer(scenario) as entry:
+            entry.table("data", result["data"])
+            if "bands" in result:
+                entry.table("bands", result["bands"])
+            if trajectories is not None and trajectories["Replicate"].nunique() > 1:
+                entry.table("trajectories", trajectories)
+            return entry.commit(result["params"])
+    except OSError as e:
+        print(f"Result store write failed: {e}", flush=True)
+        return None
+
+
+def load_stored_result(key, replicate=None):
+    """读取结果库中的结果字典；读取汇总结果且保存了不确定性区间表时一并读取"""
+    data, params = result_store().load_result(key, replicate)
+    result = {"data": data, "params": params}
+    if replicate is None and "bands" in result_store().meta(key)["tables"]:
+        result["bands"] = result_store().load_table(key, "bands")
+    return result
+
+
+def simulate_cached(inputs, seed, aggregation="calendar_month", engine="continuous", replicates=1, structure=None,
+                    callback=None, on_chunk=None):
+    """在工作线程中运行：命中缓存直接返回结果；相同输入与种子的模拟正在其他会话中运行时等待并共享其结果；
+    否则读取结果库中已保存的结果，或运行模拟并写入缓存与结果库。
+
+    continuous 引擎单条轨迹时以流式方式运行：每得到一批记录即调用 on_chunk(chunk) 推送给界面；
+    多条轨迹时分块运行集合模拟，只保留均值与分位数草图，内存不随轨迹数增长；
+    binomial 引擎同时模拟 replicates 条整数值轨迹，结果为其均值；ode 引擎以均值转换率积分确定性方程；
+    metapopulation 引擎按地区模拟，structure 为 (地区表路径, 混合矩阵路径, 无地区表时的地区数, 无混合矩阵时的地区间混合比例)；
+    age 引擎按年龄组模拟，structure 为 (年龄组表路径, 接触矩阵路径, 无年龄组表时的年龄组数, 无接触矩阵时的接触范围)。
+    多条轨迹的结果另含 bands：各记录日各状态的中位数及 50%/90% 区间（quantiles.band_table）。
+    """
+    if engine == "ode":
+        replicates = 1
+    key = (*inputs, seed, aggregation, engine, replicates, structure)
+    result = simulation_cache.get(key)
+    if result is None:
+        result = single_flight.run(
+            key, lambda report, publish: compute_simulation(key, inputs, seed, aggregation, engine, replicates, structure,
+                                                            report, publish),
+            callback=callback, on_chunk=on_chunk, retry_on=(timed_import("sim").SimulationCancelled,))
+    return result
+
+
+def compute_simulation(key, inputs, seed, aggregation, engine, replicates, structure, callback=None, on_chunk=None):
+    """simulate_cached 未命中缓存时的计算（同一键同时只有一个线程运行）：读取结果库或运行模拟，并写入缓存与结果库"""
+    # 进入 single_flight 之前，同一键的上一次计算可能刚刚完成（只在存在时读取，不重复计入未命中）
+    result = simulation_cache.get(key) if key in simulation_cache else None
+    scenario = store_scenario(inputs, seed, aggregation, engine, replicates, structure) if result is None else None
+    stored = result_store().find(scenario) if result is None else None
+    if stored is not None:
+        with metrics.span("load_stored_result"):
+            result = load_stored_result(stored)
+        simulation_cache.put(key, result)
+    if result is None:
+        sim, structured, sweep = timed_import("sim"), timed_import("structured"), timed_import("sweep")
+        trajectories = bands = None
+        with metrics.span("run_simulation", engine=engine):
+            if engine == "binomial":
+                trajectories, params = sim.run_binomial(*inputs, replicates=replicates, seed=seed, aggregation=aggregation, callback=callback)
+                data, params = summarize_replicates(trajectories, params)
+            elif engine == "continuous" and replicates > 1:
+                data, params, bands = timed_import("quantiles").run_ensemble_bands(*inputs, replicates, seed=seed,
+                                                                                   aggregation=aggregation, callback=callback)
+            elif engine == "ode":
+                data, params = sim.run_ode(*inputs, aggregation=aggregation)
+            elif engine == "metapopulation":
+                regions_file, mixing_file, n_regions, strength = structure
+                regions = sweep.read_table(regions_file) if regions_file else structured.default_regions(*inputs[:5], n_regions)
+                mixing = structured.read_mixing(mixing_file, regions["Region"]) if mixing_file else structured.uniform_mixing(len(regions), strength)
+                trajectories, params = structured.run_metapopulation(regions, mixing, inputs[5], inputs[6], replicates=replicates,
+                                                                     seed=seed, aggregation=aggregation, callback=callback)
+                data, params = summarize_replicates(trajectories, params)
+            elif engine == "age":
+                ages_file, contacts_file, n_age_groups, width = structure
+                ages = sweep.read_table(ages_file) if ages_file else structured.default_age_groups(*inputs[:5], n_age_groups)
+                contacts = structured.read_mixing(contacts_file, ages["Age group"]) if contacts_file else structured.age_contact_matrix(len(ages), width)
+                trajectories, params = structured.run_age_structured(ages, contacts, inputs[5], inputs[6], replicates=replicates,
+                                                                     seed=seed, aggregation=aggregation, callback=callback)
+                data, params = summarize_replicates(trajectories, params)
+            else:
+                # 运行模拟
+                sim_days = inputs[-1]
+                chunk_records = max(STREAM_CHUNK_RECORDS, len(sim.record_days(sim_days, aggregation=aggregation)) // STREAM_MAX_CHUNKS)
+                chunks = []
+                for chunk, params in sim.iter_simulation(*inputs, seed=seed, chunk_records=chunk_records, aggregation=aggregation):
+                    chunks.append(chunk)
+                    if on_chunk is not None:
+                        on_chunk(chunk)
+                    if callback is not None:
+                        callback(int(chunk["Days"].iloc[-1]), sim_days)
+                data = timed_import("pandas").concat(chunks, ignore_index=True)
+            if trajectories is not None and replicates > 1:
+                bands = timed_import("quantiles").trajectory_bands(trajectories)
+        params["Engine"] = engine
+        params["Random seed"] = seed
+        params["Aggregation"] = sim.AGGREGATIONS[aggregation]
+        # 保存模拟结果（数据、参数与多轨迹的不确定性区间，图形在展示时才绘制）
+        result = {"data": data, "params": params}
+        if bands is not None:
+            result["bands"] = bands
+        simulation_cache.put(key, result)
+        with metrics.span("save_result"):
+            save_result(scenario, result, trajectories)
+    return result
+
+
+def calibrate(real, method, bounds, rates, samples, replicates, seed, engine="ensemble", callback=None):
+    """在工作线程中运行校准，返回用于展示的结果字典"""
+    calibration = timed_import("calibrate")
+    if method == "abc":
+        fit = calibration.calibrate_abc(real, fit_rates=rates, r0_bounds=bounds, samples=samples,
+                            replicates=replicates, seed=seed, callback=callback, engine=engine)
+        summary = fit["summary"]
+    else:
+        fit = calibration.calibrate_r0(real, bounds=bounds, replicates=replicates, seed=seed, callback=callback, engine=engine)
+        summary = timed_import("pandas").DataFrame({"Parameter": ["R0", "Loss"], "Value": [fit["r0"], fit["loss"]]})
+    return {"real": real, "table": fit["table"], "summary": summary}
+
+
 # 定义 Shiny 应用的 Server
 
 def server(input, output, session):
@@ -119,7 +445,18 @@ def server(input, output, session):
     r=0.1
     # 新增会话初始化逻辑
     simulation_result = reactive.Value(None)  # 将响应式变量移至会话作用域内
+    partial_data = reactive.Value(None)  # 模拟进行中已得到的月度数据
+    streamed_chunks = []  # 同上，按 chunk 保存（扩展任务中不能读取响应式值）
+    timing_message = reactive.Value("")
+    calibration_result = reactive.Value(None)
+    sensitivity_result = reactive.Value(None)
     session.on_ended(lambda: simulation_result.set(None))  # 会话结束时自动清理
+    # 后台作业：限制本会话并发数，会话结束时停止仍在运行的作业
+    jobs = SessionJobs(max_jobs=MAX_SESSION_JOBS)
+    session.on_ended(jobs.cancel_all)
+    active_sessions["count"] += 1
+    session.on_ended(lambda: active_sessions.update(count=active_sessions["count"] - 1))
+    profile_report = reactive.Value("")
     
     
     @reactive.effect
@@ -133,7 +470,9 @@ def server(input, output, session):
                 2. Simulation & Dynamic figure \n 
                 3. Monthly Data Table \n
                 4. Report & PDF export \n
-                5. About & References \n
+                5. Calibration against real-world data \n
+                6. Sensitivity analysis of the model parameters \n
+                7. About & References \n
                 """),
             title=ui.h3("Qinghao Meng's Final Year Project"),  
             easy_close=True,
@@ -152,12 +491,66 @@ def server(input, output, session):
         img_path = "wlap.png"  
         return {"src": img_path, "width": "280px", "style": "display: block; margin: 0 auto 10px auto; padding: 0;"}
 
+    def start_job(name):
+        job = jobs.start(name)
+        if job is None:
+            ui.notification_show("Another job is still running in this session, please wait or cancel it.", type="warning")
+        return job
+
+    def show_job_status(task, name):
+        """任务失败或被取消时提示用户，成功时返回结果"""
+        status = task.status()
+        if status == "success":
+            return task.result()
+        if status == "error":
+            ui.notification_show(f"{name} failed: {task.error.get()}", type="error")
+        elif status == "cancelled":
+            ui.notification_show(f"{name} cancelled.", type="warning")
+        return None
+
+    async def show_partial(chunks):
+        """将工作线程推送的月度数据追加到部分结果，并立即刷新图表与数据表"""
+        streamed_chunks.extend(chunks)
+        async with reactive.lock():
+            partial_data.set(timed_import("pandas").concat(streamed_chunks, ignore_index=True))
+            await reactive.flush()
+
+    # 模拟在线程池中运行，不阻塞事件循环；结果按月流式推送到界面
+    @ui.bind_task_button(button_id="simulate")
+    @reactive.extended_task
+    async def sim_task(inputs, seed, options, job, profile=False):
+        try:
+            with metrics.span("run_sim", engine=options[1]):
+                if profile:
+                    # 在工作线程中以 cProfile 运行，附带耗时最多的函数列表
+                    result, report = await run_job(job, profile_call, simulate_cached, inputs, seed, *options,
+                                                   message="Running simulation...", on_partial=show_partial)
+                else:
+                    result = await run_job(job, simulate_cached, inputs, seed, *options, message="Running simulation...",
+                                           on_partial=show_partial)
+                    report = ""
+            return result, job.timings(), report
+        finally:
+            jobs.finish(job)
+
     # 当用户点击“Run Simulation”按钮时运行模拟
     @reactive.Effect
     @reactive.event(input.simulate)
     def run_sim():
         print("Run Simulation Pushed", flush=True)
+        job = start_job("simulation")
+        if job is None:
+            return
         simulation_result.set(None)
+        partial_data.set(None)
+        streamed_chunks.clear()
+        timing_message.set("")
+        profile_report.set("")
+        inputs, seed, options = simulation_inputs()
+        sim_task(inputs, seed, options, job, profile=bool(input.profile()))
+
+    def simulation_inputs():
+        """读取 Simulation 页的输入，返回 simulate_cached 的 (inputs, seed, options)"""
         # 获取用户输入参数
         pop = input.population()
         init_inf = input.init_infected()
@@ -166,73 +559,162 @@ def server(input, output, session):
         init_death = input.init_death()
         basic_repro = input.basic_repro()
         sim_days = input.sim_days()
-        # 运行模拟
-        data, fig, params = run_simulation(pop, init_inf, init_cli,init_rec,init_death, basic_repro, sim_days)
-        # 保存模拟结果
-        simulation_result.set({"data": data, "fig": fig, "params": params})
+        seed = input.seed()
+        # 未填写种子时随机生成一个，并记录在参数中以便复现
+        if seed is None:
+            seed = random.randrange(2**31)
+        seed = int(seed)
+        structure = None
+        if input.engine() == "metapopulation":
+            regions_files, mixing_files = input.regions_file(), input.mixing_file()
+            structure = (regions_files[0]["datapath"] if regions_files else None,
+                         mixing_files[0]["datapath"] if mixing_files else None,
+                         int(input.n_regions() or 1), float(input.mixing_strength() or 0))
+        elif input.engine() == "age":
+            ages_files, contacts_files = input.ages_file(), input.contacts_file()
+            structure = (ages_files[0]["datapath"] if ages_files else None,
+                         contacts_files[0]["datapath"] if contacts_files else None,
+                         int(input.n_age_groups() or 1), float(input.contact_width() or 1))
+        options = (input.aggregation(), input.engine(), int(input.replicates() or 1), structure)
+        return (pop, init_inf, init_cli, init_rec, init_death, basic_repro, sim_days), seed, options
+
+    @reactive.Effect
+    @reactive.event(input.cancel_sim)
+    def cancel_sim():
+        sim_task.cancel()
+        jobs.cancel("simulation")
+
+    # 模拟完成后保存结果，并报告首个结果耗时与总耗时
+    @reactive.Effect
+    def collect_sim():
+        outcome = show_job_status(sim_task, "Simulation")
+        if outcome is None:
+            return
+        result, (first, total), report = outcome
+        simulation_result.set(result)
+        partial_data.set(None)
+        streamed_chunks.clear()
+        if first is None:
+            timing = f"Completed in {total * 1000:.0f} ms"
+        else:
+            timing = f"First result after {first * 1000:.0f} ms, completed in {total * 1000:.0f} ms"
+        print(f"Simulation timing: {timing}", flush=True)
+        timing_message.set(timing)
+        profile_report.set(report)
 
     
     # 绘制模拟结果图（堆叠区域图）
     @output
     @render.plot
+    @metrics.timed()
     def sim_plot():
         print("Rendering plot...", flush=True)
+        plots = timed_import("plots")
         
         # Get the simulation result
         result = simulation_result.get()
 
         if result is None:
-            fig, ax = plt.subplots()
-            ax.axis('off')
-            ax.text(0.5, 0.5, "No simulation data available, Please run a simulation.",
-                    ha="center", va="center", fontsize=15)
-            return fig
+            # 模拟进行中时展示已得到的部分结果
+            partial = partial_data.get()
+            if partial is None:
+                return plots.plot_placeholder("No simulation data available, Please run a simulation.")
+            return plots.plot_simulation(partial)
         
-        return result["fig"]
+        if "bands" in result:
+            # 多条轨迹：各状态的中位数与 50%/90% 区间
+            return plots.plot_fan_chart(result["bands"])
+        return plots.plot_simulation(result["data"])
+
+    @render.text
+    def sim_timing():
+        return timing_message.get()
+    
+    @render.ui
+    def sim_profile():
+        report = profile_report.get()
+        if not report:
+            return None
+        return ui.tags.pre(report, style="font-size: 0.8em; max-height: 400px; overflow: auto;")
     
     # 显示每月数据表
     @output
     @render.data_frame
+    @metrics.timed()
     def sim_table():
         print("Rendering table...", flush=True)
         result = simulation_result.get()
         if result is None:
-            return pd.DataFrame(columns=["Day", "Susceptible", "Infected", "Clinical", "Recovered", "Death"])
+            partial = partial_data.get()
+            if partial is not None:
+                return partial
+            return timed_import("pandas").DataFrame(columns=["Day", "Susceptible", "Infected", "Clinical", "Recovered", "Death"])
         return result["data"]
     
     # PDF 导出：点击下载按钮时生成 PDF 报告
     @render.download(
         filename=lambda: f"TB_Simulation_Report_{datetime.now().strftime('%Y%m%d%H%M')}.pdf"
     )
+    @metrics.timed()
     async def download_pdf(): 
         result = simulation_result.get()
         browser_path = input.add().strip()
         if result is None:
             return
         
-        pdf_bytes = await generate_pdf_report({
-            "params": result["params"],
-            "fig": result["fig"],
-            "data": result["data"]
-        },browser_path=browser_path)
+        # 直接传入模拟结果：native 直接生成矢量 PDF；chromium 复用预览时已缓存的图像与表格（报告模块与 Playwright 在首次导出时才导入）
+        pdf_bytes = await timed_import("report").generate_pdf_report(
+            result, browser_path=browser_path, image_format=input.image_format(), dpi=input.image_dpi() or 100,
+            sensitivity=sensitivity_result.get(), backend=input.pdf_backend())
         
         yield pdf_bytes
 
+    # 批量导出：R0 扫描或选中的已保存结果，报告并发生成并以 ZIP 流式下载
+    @render.download(
+        filename=lambda: f"TB_Simulation_Reports_{datetime.now().strftime('%Y%m%d%H%M')}.zip",
+        media_type="application/zip"
+    )
+    @metrics.timed()
+    async def download_zip():
+        if input.batch_source() == "stored":
+            def load(key):
+                result = load_stored_result(key)
+                result["params"]["Stored result"] = key
+                return result
+            items = [(f"{key}.pdf", lambda key=key: load(key)) for key in input.batch_stored()]
+        else:
+            try:
+                r0_values = timed_import("sweep").parse_r0_grid(input.batch_r0())
+            except (ValueError, ZeroDivisionError) as e:
+                ui.notification_show(f"Invalid R₀ values: {e}", type="error")
+                return
+            inputs, seed, options = simulation_inputs()
+            # 每个 R0 与单次模拟使用相同的种子与引擎，命中缓存与结果库时不重新运行
+            items = [(f"TB_Simulation_Report_R0_{r0:g}.pdf",
+                      lambda r0=r0: simulate_cached((*inputs[:5], r0, inputs[6]), seed, *options)) for r0 in r0_values]
+        if not items:
+            ui.notification_show("No scenarios selected for the batch export.", type="warning")
+            return
+        print(f"Batch export of {len(items)} reports...", flush=True)
+        # 浏览器页面池最多同时打开 max_pages 个页面，输入框的上限只是提示，在此同样限制
+        concurrency = min(max(1, int(input.batch_pages() or 1)), browser_manager.max_pages)
+        async for chunk in timed_import("report").stream_report_zip(
+                items, backend=input.pdf_backend(), browser_path=input.add().strip(), image_format=input.image_format(),
+                dpi=input.image_dpi() or 100, concurrency=concurrency):
+            yield chunk
+
     # 在服务器逻辑添加新的输出（约第255行）
     @output
     @render.ui
+    @metrics.timed()
     def report_preview():
         result = simulation_result.get()
         if result is None:
             return ui.tags.div("No simulation data available, Please run a simulation.", style="color: #666; text-align: center; padding: 100px;")
 
-        # 复用report模块生成HTML内容
-        from report import generate_html_template
-        report_html = generate_html_template({
-            "params": result["params"],
-            "fig": result["fig"],
-            "data": result["data"]
-        })
+        # 复用report模块生成HTML内容（首次预览时才导入）
+        report_html = timed_import("report").generate_html_template(result, image_format=input.image_format(), dpi=input.image_dpi() or 100,
+                                                                    sensitivity=sensitivity_result.get())
         
         # 移除PDF专用样式，添加响应式样式
         responsive_html = report_html.replace(
@@ -247,10 +729,182 @@ def server(input, output, session):
         
         return ui.HTML(responsive_html)
 
+    @ui.bind_task_button(button_id="calibrate")
+    @reactive.extended_task
+    async def calib_task(args, job):
+        try:
+            return await run_job(job, calibrate, *args, message="Calibrating...")
+        finally:
+            jobs.finish(job)
+
+    # 校准：点击 Calibrate 按钮时以真实数据拟合参数
+    @reactive.Effect
+    @reactive.event(input.calibrate)
+    def run_calibration():
+        print("Calibration Pushed", flush=True)
+        job = start_job("calibration")
+        if job is None:
+            return
+        calibration_result.set(None)
+        files = input.real_file()
+        real = timed_import("sweep").read_table(files[0]["datapath"] if files else DEFAULT_REAL_DATA)
+        bounds = (input.calib_r0_min(), input.calib_r0_max())
+        seed = int(input.calib_seed() or 0)
+        calib_task((real, input.calib_method(), bounds, tuple(input.calib_rates()),
+                    input.calib_samples(), input.calib_replicates(), seed, input.calib_engine()), job)
+
+    @reactive.Effect
+    @reactive.event(input.cancel_calib)
+    def cancel_calibration():
+        calib_task.cancel()
+        jobs.cancel("calibration")
+
+    @reactive.Effect
+    def collect_calibration():
+        result = show_job_status(calib_task, "Calibration")
+        if result is not None:
+            calibration_result.set(result)
+
+    @ui.bind_task_button(button_id="sensitivity")
+    @reactive.extended_task
+    async def sens_task(args, options, job):
+        try:
+            return await run_job(job, timed_import("sensitivity").run_sensitivity, *args, **options, message="Running sensitivity analysis...")
+        finally:
+            jobs.finish(job)
+
+    # 敏感性分析：以模拟页的人口、初始状态与天数，在各参数范围内抽样评估结局
+    @reactive.Effect
+    @reactive.event(input.sensitivity)
+    def run_sensitivity_analysis():
+        print("Sensitivity Pushed", flush=True)
+        parameters = tuple(input.sens_params())
+        if not parameters:
+            ui.notification_show("Select at least one parameter to vary.", type="warning")
+            return
+        job = start_job("sensitivity")
+        if job is None:
+            return
+        sensitivity_result.set(None)
+        args = (input.population(), input.init_infected(), input.init_clinical(), input.init_recovered(),
+                input.init_death(), input.sim_days())
+        options = {"basic_repro": input.basic_repro(), "parameters": parameters,
+                   "r0_bounds": (input.sens_r0_min(), input.sens_r0_max()), "samples": int(input.sens_samples() or 8),
+                   "design": input.sens_design(), "engine": input.sens_engine(), "seed": int(input.sens_seed() or 0)}
+        sens_task(args, options, job)
+
+    @reactive.Effect
+    @reactive.event(input.cancel_sens)
+    def cancel_sensitivity():
+        sens_task.cancel()
+        jobs.cancel("sensitivity")
+
+    @reactive.Effect
+    def collect_sensitivity():
+        result = show_job_status(sens_task, "Sensitivity analysis")
+        if result is not None:
+            sensitivity_result.set(result)
+
+    @output
+    @render.ui
+    def sens_summary():
+        result = sensitivity_result.get()
+        if result is None:
+            return ui.tags.div("No sensitivity analysis available, Please run an analysis.", style="color: #666; text-align: center; padding: 20px;")
+        return ui.HTML(f"<p>{result['evaluations']} model runs ({DESIGNS[result['design']]}, {result['engine']} engine).</p>"
+                       + result["indices"].to_html(index=False, classes="data-table", float_format=lambda x: f"{x:.3f}"))
+
+    @output
+    @render.plot
+    def sens_plot():
+        result = sensitivity_result.get()
+        if result is None:
+            return timed_import("plots").plot_placeholder("No sensitivity analysis available.")
+        return timed_import("plots").plot_sensitivity(result["indices"])
+
+    # 结果库：列出已保存的结果，并可将其（或其中一条轨迹）载入模拟页展示。
+    # 只在打开 Stored Results 页、批量导出选择已保存的结果或点击 Refresh 时在工作线程中列出（首次列出时才创建结果库）
+    stored_listing = reactive.Value(None)
+
+    @reactive.effect
+    @reactive.event(input.page, input.batch_source, input.refresh_store)
+    async def list_stored_runs():
+        if input.page() != "Stored Results" and not (input.page() == "Report" and input.batch_source() == "stored"):
+            return
+        stored_listing.set(await asyncio.to_thread(lambda: result_store().runs()))
+
+    @render.data_frame
+    def stored_runs():
+        return stored_listing.get()
+
+    @reactive.effect
+    def update_stored_choices():
+        listing = stored_listing.get()
+        if listing is None:
+            return
+        runs = listing.to_dict("records")
+        choices = {run["Hash"]: f"{run['Hash']} · {run.get('engine')} · R0 {run.get('basic_repro')} · "
+                                f"{run.get('sim_days')} days · {run.get('replicates')} replicates" for run in runs}
+        ui.update_select("stored_run", choices=choices)
+        with reactive.isolate():
+            selected = input.batch_stored()
+        ui.update_selectize("batch_stored", choices=choices, selected=selected)
+
+    @reactive.effect
+    @reactive.event(input.load_stored)
+    def load_stored():
+        key = input.stored_run()
+        if not key:
+            ui.notification_show("No stored result selected.", type="warning")
+            return
+        replicate = input.stored_replicate()
+        try:
+            result = load_stored_result(key, None if replicate is None else int(replicate))
+        except (OSError, KeyError, ValueError) as e:
+            ui.notification_show(f"Cannot load stored result: {e}", type="error")
+            return
+        result["params"]["Stored result"] = key
+        simulation_result.set(result)
+        timing_message.set(f"Loaded stored result {key}")
+        ui.update_navs("page", selected="Simulation")
+
+    @output
+    @render.ui
+    def calib_summary():
+        result = calibration_result.get()
+        if result is None:
+            return ui.tags.div("No calibration available, Please run a calibration.", style="color: #666; text-align: center; padding: 20px;")
+        return ui.HTML(result["summary"].to_html(index=False, classes="data-table", float_format=lambda x: f"{x:.4f}"))
+
+    @output
+    @render.plot
+    def calib_plot():
+        result = calibration_result.get()
+        if result is None:
+            return timed_import("plots").plot_placeholder("No calibration available.")
+        return timed_import("plots").plot_calibration(result["table"], result["real"])
+
     
 
 # 创建并运行 Shiny 
-app = App(app_ui, server)
+shiny_app = App(app_ui, server)
+# 应用关闭时退出共享的 Chromium
+shiny_app.on_shutdown(browser_manager.shutdown)
+shiny_app.on_shutdown(lambda: job_executor.shutdown(wait=False, cancel_futures=True))
+# 共享进程池只在导入 sweep 模块后才可能存在
+shiny_app.on_shutdown(lambda: "sweep" in sys.modules and sys.modules["sweep"].shutdown_pool())
+# 在应用旁挂载 /metrics（Prometheus 文本格式）与 /metrics/spans（最近的计时记录）
+app = with_metrics(shiny_app)
+
+# 启动耗时：应用模块的加载时间，以及之后首次使用时才导入的模块（各模块的详细导入耗时见 python startup.py）
+APP_LOAD_SECONDS = time.perf_counter() - APP_LOAD_STARTED
+metrics.register_gauge("shinytb_startup_seconds", "Time to import and build the app module.", lambda: APP_LOAD_SECONDS)
+metrics.register_gauge("shinytb_lazy_import_seconds", "Total time spent importing modules on first use.",
+                       lambda: sum(IMPORT_TIMES.values()))
+print(f"App module loaded in {APP_LOAD_SECONDS * 1000:.0f} ms", flush=True)
+# SHINYTB_PREWARM=1 时在后台预先导入模拟模块（及 NumPy、pandas）、matplotlib、报告模块与 Playwright，首个绘图或导出请求不必等待
+if os.environ.get("SHINYTB_PREWARM", "").lower() in ("1", "true", "yes"):
+    prewarm()
 
 if __name__ == "__main__":
-    app.run()
\ No newline at end of file
+    run_app(app)
\ No newline at end of file
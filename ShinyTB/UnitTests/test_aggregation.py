@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+import sim
+from sim import record_days, run_ensemble, run_simulation, replicate_seeds
+
+ARGS = (1000, 10, 5, 0, 0, 1.5)
+
+
+def test_record_days():
+    assert list(record_days(20, aggregation="weekly")) == [7, 14, 20]
+    assert list(record_days(3, aggregation="daily")) == [1, 2, 3]
+    assert list(record_days(730, aggregation="yearly")) == [365, 730]
+    months = record_days(365 * 2, aggregation="calendar_month")
+    assert len(months) == 24 and list(months[:3]) == [31, 59, 90] and months[12] == 365 + 31
+    assert list(record_days(100)) == [31, 62, 93, 100]
+    with pytest.raises(ValueError):
+        record_days(10, aggregation="hourly")
+
+
+# 分块生成随机参数后，跨块的结果仍与整体抽取（_draw_uniforms）一致
+def test_rate_blocks_match_single_draw(monkeypatch):
+    sim_days = 50
+    rng = np.random.default_rng(4)
+    expected = sim._draw_annual_rates(sim._draw_uniforms(rng, sim_days))
+    blocks = list(sim._iter_annual_rates([4], sim_days, block_days=7))
+    for name, values in expected.items():
+        assert np.array_equal(np.concatenate([block[name][0] for block in blocks]), values)
+
+    # 轨迹很多时集合模拟使用更小的块，结果仍与单轨迹一致
+    monkeypatch.setattr(sim, "RATE_BLOCK_VALUES", 9)
+    data, _ = run_ensemble(*ARGS, 400, replicates=3, seed=8, aggregation="yearly")
+    for k, child in enumerate(replicate_seeds(8, 3)):
+        scalar, _ = run_simulation(*ARGS, 400, seed=child, aggregation="yearly")
+        assert np.array_equal(data[data["Replicate"] == k].drop(columns="Replicate").to_numpy(), scalar.to_numpy())
+
+
+def test_long_horizon_yearly():
+    data, _ = run_simulation(*ARGS, 365 * 60, seed=1, aggregation="yearly")
+    assert len(data) == 60
+    assert data["Days"].iloc[-1] == 365 * 60
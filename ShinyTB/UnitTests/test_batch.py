@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import pytest
+import batch
+from sim import STATES, run_ensemble
+
+SCENARIO = {"population": 10_000, "init_infected": 10, "init_clinical": 5, "init_recovered": 0, "init_death": 0,
+            "basic_repro": 1.5, "sim_days": 730}
+
+
+# 轨迹拆分到多个任务后的均值与整体运行 run_ensemble 的均值相同，且与拆分方式无关
+def test_split_replicates_match_ensemble():
+    scenarios = [{**SCENARIO, "name": "base", "seed": 7, "replicates": 7}]
+    split = batch.run_batch(scenarios, processes=1, block=3)
+    whole = batch.run_batch(scenarios, processes=1, block=100)
+    data, _ = run_ensemble(*(SCENARIO[f] for f in batch.SCENARIO_FIELDS), replicates=7, seed=7,
+                           aggregation="calendar_month")
+    expected = data.groupby("Days")[STATES].mean().to_numpy()
+    assert np.allclose(split[STATES].to_numpy(), expected)
+    assert np.allclose(split[STATES].to_numpy(), whole[STATES].to_numpy())
+    assert (split["Replicates"] == 7).all()
+
+
+def test_cli_reads_csv_and_writes_csv(tmp_path):
+    scenarios = pd.DataFrame([{**SCENARIO, "name": "a", "replicates": 3},
+                              {**SCENARIO, "name": "b", "engine": "ode", "aggregation": "yearly"}])
+    scenarios.to_csv(tmp_path / "scenarios.csv", index=False)
+    batch.main([str(tmp_path / "scenarios.csv"), "--out", str(tmp_path / "out.csv"), "--processes", "1", "--seed", "1"])
+    out = pd.read_csv(tmp_path / "out.csv")
+    assert list(out.groupby("Scenario").size()) == [24, 2]
+    assert set(out["Engine"]) == {"ensemble", "ode"}
+
+    with pytest.raises(ValueError):
+        batch.run_batch([{"population": 100}])
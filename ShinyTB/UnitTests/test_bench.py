@@ -0,0 +1,33 @@
+import json
+
+import pandas as pd
+
+import bench
+
+
+def test_benchmark_results_are_json_records():
+    results = bench.run_benchmarks("quick", only=["run_simulation"], repeat=1)
+    assert results["meta"]["sweep"] == "quick"
+    assert {entry["name"] for entry in results["results"]} == {"run_simulation"}
+    for entry in results["results"]:
+        assert entry["seconds"] > 0 and entry["peak_bytes"] > 0
+        assert set(entry["params"]) == {"population", "sim_days"}
+
+
+# 超过容差且超过噪声下限的变化记为回归，基准中没有的用例不比较
+def test_compare_flags_regressions():
+    entry = {"name": "run_simulation", "params": {"sim_days": 365}, "seconds": 0.1, "peak_bytes": 10 << 20}
+    baseline = {"results": [entry]}
+    slower = {"results": [{**entry, "seconds": 0.2},
+                          {**entry, "params": {"sim_days": 730}, "seconds": 9.0}]}
+    assert bench.compare(slower, baseline) == [("run_simulation sim_days=365", "seconds", 0.1, 0.2)]
+    noisy = {"results": [{**entry, "seconds": 0.104, "peak_bytes": (10 << 20) + 1000}]}
+    assert bench.compare(noisy, baseline) == []
+    assert bench.uncompared(slower, baseline) == ["run_simulation sim_days=730"]
+
+
+# 表格渲染用例只使用 Shiny 的公开接口
+def test_render_table_payload():
+    payload = json.loads(bench.render_table(pd.DataFrame({"Days": [0, 1], "Infected": [5, 7]})))
+    assert payload["columns"] == ["Days", "Infected"]
+    assert payload["data"] == [[0, 5], [1, 7]]
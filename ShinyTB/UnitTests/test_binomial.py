@@ -0,0 +1,27 @@
+import numpy as np
+from sim import STATES, run_binomial, run_ensemble
+
+
+def test_counts_are_conserved_integers():
+    data, params = run_binomial(100_000, 50, 20, 0, 0, 1.5, 400, replicates=20, seed=3)
+    assert len(data) == 20 * 13
+    assert all(data[state].dtype == np.int64 for state in STATES)
+    assert (data[STATES] >= 0).all().all()
+    assert (data[STATES].sum(axis=1) == 100_000).all()
+    # 转换率与相同种子的集合模拟相同
+    _, ensemble_params = run_ensemble(100_000, 50, 20, 0, 0, 1.5, 400, replicates=20, seed=3)
+    for key, value in params.items():
+        assert np.array_equal(value, ensemble_params[key])
+
+
+def test_small_outbreaks_can_die_out():
+    data, _ = run_binomial(1000, 0, 2, 0, 0, 0.5, 365 * 5, replicates=200, seed=1, aggregation="yearly")
+    final = data[data["Days"] == 365 * 5]
+    extinct = (final["Infected"] + final["Clinical"]) == 0
+    assert 0 < extinct.mean() < 1
+
+
+def test_seed_reproducible():
+    first, _ = run_binomial(5000, 10, 5, 0, 0, 1.5, 100, replicates=4, seed=9)
+    second, _ = run_binomial(5000, 10, 5, 0, 0, 1.5, 100, replicates=4, seed=9)
+    assert first.equals(second)
@@ -0,0 +1,37 @@
+import asyncio
+import pytest
+from browser import BrowserManager
+
+HTML = "<html><body><h1>TB Transmission Simulation Report</h1></body></html>"
+
+
+@pytest.fixture
+def manager():
+    manager = BrowserManager(max_pages=2)
+    try:
+        asyncio.run(manager.render_pdf(HTML))
+    except Exception as e:
+        manager.shutdown()
+        pytest.skip(f"Chromium is not available: {e}")
+    yield manager
+    manager.shutdown()
+
+
+# 多次导出复用同一个浏览器进程
+def test_browser_launched_once(manager):
+    async def export_many():
+        return await asyncio.gather(*(manager.render_pdf(HTML) for _ in range(5)))
+
+    pdfs = asyncio.run(export_many())
+    assert all(pdf.startswith(b"%PDF-") for pdf in pdfs)
+    assert manager.stats()["launches"] == 1
+    assert manager.stats()["idle_pages"] <= 2
+
+
+# 浏览器崩溃后下次导出自动重启
+def test_browser_restarts_after_crash(manager):
+    browser = next(iter(manager._browsers.values()))
+    manager.submit(browser.close()).result(10)
+    pdf = asyncio.run(manager.render_pdf(HTML))
+    assert pdf.startswith(b"%PDF-")
+    assert manager.stats()["launches"] == 2
@@ -0,0 +1,94 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+from cache import SimulationCache, SingleFlight, estimate_size
+from sim import SimulationCancelled
+
+
+def make_result(rows):
+    return {"data": pd.DataFrame({"Days": range(rows), "Death": [0.0] * rows}), "params": {"seed": 1}}
+
+
+def test_lru_eviction_and_counters():
+    cache = SimulationCache(max_entries=2)
+    cache.put("a", make_result(3))
+    cache.put("b", make_result(3))
+    assert cache.get("a") is not None  # a 变为最近使用
+    cache.put("c", make_result(3))       # 淘汰最久未使用的 b
+    assert "b" not in cache
+    assert cache.get("b") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["entries"]) == (1, 1, 1, 2)
+
+
+def test_memory_cap():
+    one = estimate_size(make_result(1000))
+    cache = SimulationCache(max_entries=100, max_bytes=int(one * 2.5))
+    for k in range(5):
+        cache.put(k, make_result(1000))
+    assert len(cache) == 2
+    assert cache.stats()["bytes"] <= cache.max_bytes
+    # 超过上限的单个结果不会被缓存
+    cache.put("huge", make_result(10000))
+    assert "huge" not in cache
+
+
+
+# 同时发起的相同计算只运行一次，等待者收到同一结果及全部部分结果
+def test_single_flight_coalesces():
+    flight = SingleFlight(poll=0.01)
+    release = threading.Event()
+    calls = []
+
+    def compute(report, publish):
+        calls.append(1)
+        publish("first")
+        release.wait(10)
+        publish("second")
+        return {"value": 42}
+
+    chunks = [[] for _ in range(4)]
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(flight.run, "key", compute, None, chunks[k].append) for k in range(4)]
+        while flight.coalesced < 3:
+            threading.Event().wait(0.01)
+        release.set()
+        results = [future.result(timeout=10) for future in futures]
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert all(received == ["first", "second"] for received in chunks)
+    assert flight.in_flight() == 0
+
+
+# leader 被取消时由等待者接替计算，已转发的部分结果不重复推送
+def test_single_flight_leader_cancelled():
+    flight = SingleFlight(poll=0.01)
+    started = threading.Event()
+    follower_waiting = threading.Event()
+    attempts = []
+
+    def compute(report, publish):
+        attempts.append(1)
+        publish("first")
+        if len(attempts) == 1:
+            started.set()
+            follower_waiting.wait(10)
+            raise SimulationCancelled("leader")
+        publish("second")
+        return "done"
+
+    received = []
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(flight.run, "key", compute, None, None, (SimulationCancelled,))
+        assert started.wait(10)
+        follower = pool.submit(flight.run, "key", compute, None, received.append, (SimulationCancelled,))
+        while flight.coalesced < 1:
+            threading.Event().wait(0.01)
+        follower_waiting.set()
+        with pytest.raises(SimulationCancelled):
+            leader.result(timeout=10)
+        assert follower.result(timeout=10) == "done"
+    assert received == ["first", "second"]
+    assert flight.leaders == 2
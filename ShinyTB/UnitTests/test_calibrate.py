@@ -0,0 +1,34 @@
+import pandas as pd
+from calibrate import calibrate_r0, calibrate_abc, evaluation_cache
+from sweep import initial_state, simulate_yearly
+
+INIT = pd.DataFrame({
+    "Year": [2005], "Susceptible": [90000], "Infection": [9000], "Clinical": [800],
+    "Recovered": [150], "Death": [50], "Population": [100000],
+})
+
+
+def synthetic_real(basic_repro, years=(2005, 2006, 2007, 2008)):
+    """以已知 R0 和校准所用的同一种子生成“真实”数据"""
+    table = simulate_yearly(basic_repro, initial_state(INIT), list(years), 2, 0)
+    return table.drop(columns="R0")
+
+
+def test_calibrate_r0_recovers_known_value():
+    real = synthetic_real(1.2)
+    fit = calibrate_r0(real, bounds=(0.2, 3.0), replicates=2, seed=0)
+    assert abs(fit["r0"] - 1.2) < 0.05
+    assert fit["loss"] < 1e-6
+    # 再次校准全部命中缓存
+    hits = evaluation_cache.stats()["hits"]
+    calibrate_r0(real, bounds=(0.2, 3.0), replicates=2, seed=0)
+    assert evaluation_cache.stats()["hits"] > hits
+
+
+def test_calibrate_abc_summary():
+    real = synthetic_real(1.2)
+    fit = calibrate_abc(real, fit_rates=("c",), samples=20, accept_fraction=0.25, seed=1, processes=1)
+    assert len(fit["posterior"]) == 5
+    assert list(fit["summary"]["Parameter"]) == ["R0", "c"]
+    assert fit["posterior"]["Loss"].is_monotonic_increasing
+    assert 0.01 <= fit["best"]["c"] <= 0.05
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from sim import run_simulation, run_ensemble, replicate_seeds
+
+ARGS = (1000, 10, 5, 0, 0, 1.5, 365)
+
+
+# 集合模拟每条轨迹应与相同种子下的单轨迹结果完全一致
+def test_ensemble_matches_scalar_path():
+    replicates = 8
+    data, params = run_ensemble(*ARGS, replicates=replicates, seed=2025)
+    assert len(data) == replicates * 12
+    assert list(data.columns) == ["Replicate", "Days", "Susceptible", "Infected", "Clinical", "Recovered", "Death"]
+
+    for k, child in enumerate(replicate_seeds(2025, replicates)):
+        scalar_data, scalar_params = run_simulation(*ARGS, seed=child)
+        trajectory = data[data["Replicate"] == k].drop(columns="Replicate").reset_index(drop=True)
+        assert np.array_equal(trajectory.to_numpy(), scalar_data.to_numpy())
+        for key, value in scalar_params.items():
+            if key != "Basic Reproduction number (R0)":
+                assert params[key][k] == value
+
+
+def test_seed_reproducible():
+    first, _ = run_ensemble(*ARGS, replicates=3, seed=1)
+    second, _ = run_ensemble(*ARGS, replicates=3, seed=1)
+    assert first.equals(second)
+
+
+def test_ensemble_rejects_invalid_replicates():
+    with pytest.raises(ValueError):
+        run_ensemble(*ARGS, replicates=0)
@@ -0,0 +1,46 @@
+import threading
+import pytest
+from jobs import SessionJobs, executor
+from sim import SimulationCancelled, run_simulation
+
+
+def test_session_job_cap():
+    jobs = SessionJobs(max_jobs=1)
+    job = jobs.start("simulation")
+    assert job is not None
+    assert jobs.start("calibration") is None
+    jobs.finish(job)
+    assert jobs.start("calibration") is not None
+
+
+# 取消后工作线程在下一次 callback 时停止，作业在 finish 之后才释放并发名额
+def test_cancel_stops_worker():
+    jobs = SessionJobs()
+    job = jobs.start("simulation")
+    started = threading.Event()
+
+    def callback(day, sim_days):
+        started.set()
+        job.report(day, sim_days)
+
+    future = executor.submit(run_simulation, 1000, 10, 5, 0, 0, 1.5, 10_000_000, seed=1, callback=callback)
+    assert started.wait(30)
+    jobs.cancel("simulation")
+    # 工作线程返回并调用 finish 之前，已取消的作业仍占用并发名额
+    assert len(jobs) == 1 and jobs.start("calibration") is None
+    with pytest.raises(SimulationCancelled):
+        future.result(timeout=30)
+    assert 0 < job.progress < 1
+    jobs.finish(job)
+    assert jobs.start("calibration") is not None
+
+
+def test_published_chunks_and_timings():
+    job = SessionJobs().start("simulation")
+    assert job.timings() == (None, None)
+    job.publish("a")
+    job.publish("b")
+    assert job.take_chunks() == ["a", "b"]
+    assert job.take_chunks() == []
+    first, total = job.timings()
+    assert first >= 0 and total is None
@@ -0,0 +1,59 @@
+import asyncio
+import pytest
+from metrics import Metrics, profile_call, with_metrics
+
+
+def test_spans_render_as_prometheus_histograms():
+    metrics = Metrics(buckets=(0.1, 1))
+    with metrics.span("run_sim", engine="ode"):
+        with metrics.span("run_simulation"):
+            pass
+    with pytest.raises(RuntimeError):
+        with metrics.span("run_sim", engine="ode"):
+            raise RuntimeError("boom")
+    metrics.register_gauge("shinytb_active_sessions", "Open sessions.", lambda: 3)
+
+    text = metrics.render_prometheus()
+    assert 'shinytb_span_seconds_bucket{span="run_sim",engine="ode",le="0.1"} 2' in text
+    assert 'shinytb_span_seconds_count{span="run_sim",engine="ode"} 2' in text
+    assert "shinytb_active_sessions 3.0" in text
+    inner, outer, failed = metrics.recent
+    assert inner["parent"] == "run_sim" and outer["parent"] is None
+    assert failed["error"] == "RuntimeError"
+
+
+# 装饰器保留函数名（Shiny 以函数名作为输出 id），并支持异步生成器
+def test_timed_decorator_and_profile():
+    metrics = Metrics()
+
+    @metrics.timed()
+    async def download_pdf():
+        yield b"%PDF-"
+
+    async def collect():
+        return [chunk async for chunk in download_pdf()]
+
+    assert download_pdf.__name__ == "download_pdf"
+    assert asyncio.run(collect()) == [b"%PDF-"]
+    assert metrics.snapshot()[("download_pdf", ())][0] == 1
+
+    result, report = profile_call(sorted, [3, 1, 2])
+    assert result == [1, 2, 3] and "function calls" in report
+
+
+def test_metrics_endpoint_mounted_beside_app():
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 204, "headers": []})
+
+    async def request(path):
+        messages = []
+        async def send(message):
+            messages.append(message)
+        await with_metrics(app)({"type": "http", "path": path}, None, send)
+        return messages
+
+    metrics_response = asyncio.run(request("/metrics"))
+    assert metrics_response[0]["status"] == 200
+    assert b"shinytb_span_seconds" in metrics_response[1]["body"]
+    assert asyncio.run(request("/metrics/spans"))[1]["body"].startswith(b"[")
+    assert asyncio.run(request("/"))[0]["status"] == 204
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from ode import dormand_prince
+from sim import STATES, run_ode
+
+
+def test_solver_matches_analytic_solution():
+    t = np.linspace(0, 10, 37)
+    values, stats = dormand_prince(lambda t, y: np.array([-0.5 * y[0], np.cos(t)]), (0, 10), [2.0, 0.0], t,
+                                   rtol=1e-8, atol=1e-10)
+    assert np.allclose(values[:, 0], 2 * np.exp(-0.5 * t), atol=1e-7)
+    assert np.allclose(values[:, 1], np.sin(t), atol=1e-6)
+    # 自适应步长：步数远少于输出点间的固定小步
+    assert stats["steps"] < 100
+
+
+def test_solver_rejects_points_outside_span():
+    with pytest.raises(ValueError):
+        dormand_prince(lambda t, y: -y, (0, 1), [1.0], [0.5, 2.0])
+
+
+def test_ode_engine_on_any_grid():
+    grid = np.array([0, 0.5, 10.25, 365, 365 * 60])
+    data, params = run_ode(1_000_000, 1000, 500, 0, 0, 1.5, 365 * 60, t_eval=grid)
+    assert list(data["Days"]) == list(grid)
+    assert np.allclose(data[STATES].sum(axis=1), 1_000_000)
+    assert data.loc[0, "Clinical"] == 500
+    # 默认按记录天输出，与更严格容差的解一致
+    yearly, _ = run_ode(1_000_000, 1000, 500, 0, 0, 1.5, 365 * 60, aggregation="yearly")
+    precise, _ = run_ode(1_000_000, 1000, 500, 0, 0, 1.5, 365 * 60, aggregation="yearly", rtol=1e-10, atol=1e-8)
+    assert len(yearly) == 60
+    assert np.allclose(yearly[STATES], precise[STATES], rtol=1e-4, atol=1e-2)
+    assert params["ODE solver steps"] > 0
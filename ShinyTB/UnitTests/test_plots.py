@@ -0,0 +1,18 @@
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from sim import run_simulation
+from plots import plot_simulation
+
+
+# 数值计算不应创建任何 Matplotlib 图形，绘图只在调用 plot_simulation 时发生
+def test_simulation_creates_no_figure():
+    plt.close("all")
+    data, params = run_simulation(1000, 10, 5, 0, 0, 1.5, 365, seed=3)
+    assert plt.get_fignums() == []
+
+    fig = plot_simulation(data)
+    ax = fig.axes[0]
+    assert ax.xaxis.label.get_text() == "Days"
+    assert len(ax.collections) == 5
+    plt.close(fig)
@@ -0,0 +1,64 @@
+import tracemalloc
+import numpy as np
+import batch
+from quantiles import BAND_QUANTILES, QuantileSketch, run_ensemble_bands, trajectory_values
+from sim import STATES, run_ensemble
+
+ARGS = (10_000, 10, 5, 0, 0, 1.5, 365)
+
+
+# 分块加入后合并的草图与一次加入的结果相同，估计值与精确次序统计量的误差不超过 1% · min(v, N - v)
+def test_sketch_accuracy_and_merge():
+    rng = np.random.default_rng(3)
+    values = np.stack([rng.lognormal(5, 1.5, 2000), 1000 - rng.lognormal(3, 1, 2000), rng.integers(0, 3, 2000)], axis=1)
+    values = np.clip(values, 0, 1000)
+    whole = QuantileSketch((3,), 1000)
+    whole.add(values)
+    merged = QuantileSketch((3,), 1000)
+    for part in np.array_split(values, 7):
+        sketch = QuantileSketch((3,), 1000)
+        sketch.add(part)
+        merged.merge(sketch)
+    for q in BAND_QUANTILES.values():
+        exact = np.quantile(values, q, axis=0, method="lower")
+        estimate = merged.quantile(q)
+        assert np.array_equal(estimate, whole.quantile(q))
+        assert np.all(np.abs(estimate - exact) <= 0.01 * np.minimum(exact, 1000 - exact) + 1e-9)
+
+
+# 流式集合模拟的均值与整体运行 run_ensemble 相同，且与分块大小无关；批量运行合并各任务的草图
+def test_ensemble_bands_match_ensemble():
+    data, _ = run_ensemble(*ARGS, replicates=6, seed=5, aggregation="calendar_month")
+    values, _ = trajectory_values(data)
+    mean, params, bands = run_ensemble_bands(*ARGS, replicates=6, seed=5, aggregation="calendar_month", block=4)
+    assert np.allclose(mean[STATES].to_numpy(), values.mean(axis=0))
+    assert params["Replicates"] == 6
+    _, _, whole = run_ensemble_bands(*ARGS, replicates=6, seed=5, aggregation="calendar_month")
+    assert bands.equals(whole)
+
+    scenario = dict(zip(batch.SCENARIO_FIELDS, ARGS), seed=5, replicates=6)
+    table = batch.run_batch([scenario], processes=1, block=2, quantiles=True)
+    assert np.allclose(table[[f"{state} Median" for state in STATES]].to_numpy(), bands.pivot(
+        index="Days", columns="State", values="Median")[STATES].to_numpy())
+
+
+# 长期逐日记录（20 年）：少量轨迹时只保存原始值；观测增多后桶计数不超过内存上限，误差不超过放大后的精度
+def test_sketch_memory_long_horizon():
+    tracemalloc.start()
+    try:
+        _, _, bands = run_ensemble_bands(1_000_000, 10, 5, 0, 0, 1.5, 7300, 2, seed=1, aggregation="daily")
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert len(bands) == 7300 * len(STATES) and peak < 64 * 1024 * 1024
+
+    shape = (7300, len(STATES))
+    sketch = QuantileSketch(shape, 1_000_000, max_bytes=8 * 1024 * 1024)
+    assert sketch.relative_accuracy > 0.01
+    values = np.random.default_rng(1).lognormal(8, 1, (sketch.buckets + 20, *shape))
+    sketch.add(values[:2])
+    assert np.array_equal(sketch.quantile(0.5), np.quantile(values[:2], 0.5, axis=0, method="lower"))
+    sketch.add(values[2:])
+    assert sketch.nbytes <= 8 * 1024 * 1024 + sketch.minimum.nbytes + sketch.maximum.nbytes
+    exact = np.quantile(values, 0.5, axis=0, method="lower")
+    assert np.all(np.abs(sketch.quantile(0.5) - exact) <= sketch.relative_accuracy * exact + 1e-9)
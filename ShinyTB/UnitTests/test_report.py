@@ -0,0 +1,123 @@
+import asyncio
+import io
+import re
+import time
+import zipfile
+import pytest
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import report
+from sim import run_simulation
+
+
+def make_result():
+    data, params = run_simulation(1000, 10, 5, 0, 0, 1.5, 365, seed=5)
+    return {"data": data, "params": params}
+
+
+# 同一结果多次生成报告时只绘图编码一次；编码结果计入报告缓存，共享的结果字典不被修改
+def test_artifacts_are_memoized(monkeypatch):
+    report.artifact_cache.clear()
+    result = make_result()
+    calls = []
+    original = report.fig_to_base64
+    monkeypatch.setattr(report, "fig_to_base64", lambda fig, **kw: calls.append(kw) or original(fig, **kw))
+
+    first = report.generate_html_template(result)
+    second = report.generate_html_template(result)
+    assert len(calls) == 1
+    assert first.count("data:image/png;base64,") == 1
+    assert report.report_artifacts(result)["data_table"] in second
+    assert plt.get_fignums() == []
+    assert set(result) == {"data", "params"}
+    assert report.artifact_cache.stats()["bytes"] > 0
+    # 内容相同的另一个结果字典（如从结果库读取）复用同一份编码
+    report.generate_html_template(make_result())
+    assert len(calls) == 1
+
+    svg = report.generate_html_template(result, image_format="svg")
+    assert "data:image/svg+xml;base64," in svg
+    assert len(calls) == 2
+
+
+def test_compressed_png_is_smaller():
+    result = make_result()
+    plain = report.report_artifacts(result, "png", dpi=100)["plot_base64"]
+    compressed = report.report_artifacts(result, "png_compressed", dpi=100)["plot_base64"]
+    assert len(compressed) < len(plain)
+
+
+# native 后端不需要浏览器：生成矢量 PDF（参数页、动态图、数据表各一页），不留下未关闭的图
+def test_native_pdf_without_browser(monkeypatch):
+    monkeypatch.setattr(report.browser_manager, "render_pdf", None)
+    result = make_result()
+    pdf = asyncio.run(report.generate_pdf_report(result))
+    assert pdf.startswith(b"%PDF-")
+    assert len(re.findall(rb"/Type\s*/Page\b", pdf)) == 3
+    assert b"/Subtype /Image" not in pdf
+    assert plt.get_fignums() == []
+    with pytest.raises(ValueError):
+        asyncio.run(report.generate_pdf_report(result, backend="html"))
+
+
+
+
+# HTML 预览（及 Chromium PDF）的数据表与 native PDF 相同，长期结果按记录日抽取并加以说明
+def test_html_report_long_result():
+    data, params = run_simulation(1000, 10, 5, 0, 0, 1.5, 3650, seed=5, aggregation="daily")
+    table = report.report_artifacts({"data": data, "params": params})["data_table"]
+    assert table.count("<tr") <= report.MAX_TABLE_ROWS + 1
+    assert "one in every 10 recorded days" in table
+    assert "<p>" not in report.report_artifacts(make_result())["data_table"]
+
+# 长期逐日结果：数据表按记录日抽取（保留最后一天），PDF 在工作线程中生成，期间事件循环仍可运行
+def test_native_pdf_long_result():
+    data, params = run_simulation(1000, 10, 5, 0, 0, 1.5, 3650, seed=5, aggregation="daily")
+    table, note = report._sampled_days(data)
+    assert len(table) <= report.MAX_TABLE_ROWS and table["Days"].iloc[-1] == data["Days"].iloc[-1]
+    assert note is not None and report._sampled_days(table)[1] is None
+
+    async def main():
+        ticks = []
+
+        async def ticker():
+            while True:
+                ticks.append(time.perf_counter())
+                await asyncio.sleep(0.01)
+
+        task = asyncio.ensure_future(ticker())
+        pdf = await report.generate_pdf_report({"data": data, "params": params})
+        task.cancel()
+        return pdf, ticks
+
+    pdf, ticks = asyncio.run(main())
+    assert len(re.findall(rb"/Type\s*/Page\b", pdf)) <= 14
+    assert len(ticks) > 10 and max(b - a for a, b in zip(ticks, ticks[1:])) < 0.5
+    assert plt.get_fignums() == []
+
+# 批量导出：每份报告完成后即产出一段 ZIP，同时处理的场景不超过 concurrency，重复的文件名加后缀，失败的场景记入 errors.txt
+def test_stream_report_zip():
+    running, peak = [0], [0]
+
+    def load(fail=False):
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        running[0] -= 1
+        if fail:
+            raise ValueError("no data")
+        return make_result()
+
+    # 如 R0 为 1.0000001 与 1.0000002 时，按 :g 格式化的文件名相同
+    items = [(f"report_{k % 3}.pdf", load) for k in range(4)] + [("broken.pdf", lambda: load(fail=True))]
+
+    async def collect():
+        return [chunk async for chunk in report.stream_report_zip(items, concurrency=2)]
+
+    chunks = asyncio.run(collect())
+    assert len(chunks) == 5 and peak[0] <= 2
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    assert sorted(archive.namelist()) == ["errors.txt", "report_0 (2).pdf", "report_0.pdf", "report_1.pdf", "report_2.pdf"]
+    assert archive.read("report_0.pdf").startswith(b"%PDF-")
+    assert b"broken.pdf: ValueError" in archive.read("errors.txt")
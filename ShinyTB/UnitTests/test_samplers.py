@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from samplers import sample_truncated_exponential, sample_truncated_gamma, truncated_mean, truncated_ppf
+from sim import ANNUAL_RATE_DISTRIBUTIONS
+
+
+# 原 run_simulation 中的拒绝采样实现，作为参考分布
+def rejection_exponential(rng, low, high, mean, size):
+    out = []
+    while len(out) < size:
+        candidate = rng.exponential(scale=mean)
+        if low <= candidate <= high:
+            out.append(candidate)
+    return np.array(out)
+
+
+def rejection_gamma(rng, low, high, shape, scale, size):
+    out = []
+    while len(out) < size:
+        candidate = rng.gamma(shape, scale)
+        if low <= candidate <= high:
+            out.append(candidate)
+    return np.array(out)
+
+
+def ks_statistic(a, b):
+    """双样本 Kolmogorov–Smirnov 统计量"""
+    grid = np.sort(np.concatenate([a, b]))
+    cdf_a = np.searchsorted(np.sort(a), grid, side="right") / len(a)
+    cdf_b = np.searchsorted(np.sort(b), grid, side="right") / len(b)
+    return np.max(np.abs(cdf_a - cdf_b))
+
+
+@pytest.mark.parametrize("name", list(ANNUAL_RATE_DISTRIBUTIONS))
+def test_inverse_cdf_matches_rejection(name):
+    spec = ANNUAL_RATE_DISTRIBUTIONS[name]
+    n = 20000
+    if spec["dist"] == "exponential":
+        fast = sample_truncated_exponential(np.random.default_rng(1), spec["low"], spec["high"], spec["mean"], size=n)
+        reference = rejection_exponential(np.random.default_rng(2), spec["low"], spec["high"], spec["mean"], n)
+    else:
+        fast = sample_truncated_gamma(np.random.default_rng(1), spec["low"], spec["high"], spec["shape"], spec["scale"], size=n)
+        reference = rejection_gamma(np.random.default_rng(2), spec["low"], spec["high"], spec["shape"], spec["scale"], n)
+
+    assert fast.min() >= spec["low"] and fast.max() <= spec["high"]
+    # 显著性水平 0.001 下的双样本 KS 临界值
+    critical = 1.949 * np.sqrt(2 / n)
+    assert ks_statistic(fast, reference) < critical
+    assert abs(fast.mean() - reference.mean()) < 4 * reference.std() / np.sqrt(n / 2)
+
+
+def test_degenerate_window_returns_constant():
+    rng = np.random.default_rng(0)
+    assert np.all(sample_truncated_exponential(rng, 0.2, 0.2, 1.0, size=5) == 0.2)
+    assert np.all(sample_truncated_gamma(rng, 0.03, 0.03, 2, 0.01, size=5) == 0.03)
+
+
+@pytest.mark.parametrize("name", list(ANNUAL_RATE_DISTRIBUTIONS))
+def test_truncated_mean(name):
+    spec = ANNUAL_RATE_DISTRIBUTIONS[name]
+    u = (np.arange(100_000) + 0.5) / 100_000
+    assert truncated_mean(spec) == pytest.approx(truncated_ppf(u, spec).mean(), rel=1e-6)
@@ -0,0 +1,35 @@
+import numpy as np
+from sensitivity import latin_hypercube, run_sensitivity, saltelli_design, sobol_indices, sobol_sequence
+
+
+def ishigami(x):
+    return np.sin(x[:, 0]) + 7 * np.sin(x[:, 1]) ** 2 + 0.1 * x[:, 2] ** 4 * np.sin(x[:, 0])
+
+
+def test_designs():
+    # Sobol 序列的前几个点（未移位）
+    assert np.allclose(sobol_sequence(4, 2), [[0, 0], [0.5, 0.5], [0.75, 0.25], [0.25, 0.75]])
+    # 拉丁超立方每一维的每个区间恰有一个点
+    points = latin_hypercube(20, 3, np.random.default_rng(1))
+    assert all(sorted((points[:, j] * 20).astype(int)) == list(range(20)) for j in range(3))
+
+
+# Ishigami 函数的解析指数：S1 = (0.314, 0.442, 0)，ST = (0.558, 0.442, 0.244)
+def test_ishigami_indices():
+    a, b = saltelli_design(4096, {name: (-np.pi, np.pi) for name in "xyz"}, "sobol", seed=1)
+    f_ab = [ishigami(np.where(np.arange(3) == k, b, a)) for k in range(3)]
+    indices = sobol_indices(ishigami(a), ishigami(b), f_ab, bootstrap=50)
+    assert np.allclose(indices["first"], [0.314, 0.442, 0.0], atol=0.03)
+    assert np.allclose(indices["total"], [0.558, 0.442, 0.244], atol=0.03)
+    assert np.all(indices["total_low"] <= indices["total_high"])
+
+
+def test_run_sensitivity():
+    result = run_sensitivity(10_000, 10, 5, 0, 0, 365 * 5, parameters=("R0", "d"), samples=16, processes=1)
+    assert result["evaluations"] == 16 * 4
+    indices = result["indices"]
+    assert len(indices) == 2 * 4 and set(indices["Parameter"]) == {"R0", "d"}
+    assert len(result["samples"]) == 32
+    deaths = indices[indices["Outcome"] == "Cumulative deaths"].set_index("Parameter")
+    # 死亡率 d 直接决定累计死亡
+    assert deaths.loc["d", "Total"] > 0.1
@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+
+from startup import format_report, import_report
+
+SHINYTB_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# 导入绘图、报告与浏览器模块时不导入 matplotlib、Playwright 与敏感性分析模块，首次绘图时使用 Agg 后端
+def test_heavy_modules_load_on_first_use():
+    code = ("import sys, plots, report, browser\n"
+            "assert not {'matplotlib', 'playwright', 'sensitivity', 'sweep'} & set(sys.modules), sorted(sys.modules)\n"
+            "plots.plot_placeholder('x')\n"
+            "import matplotlib\n"
+            "assert matplotlib.get_backend().lower() == 'agg'\n")
+    env = {key: value for key, value in os.environ.items() if key != "MPLBACKEND"}
+    completed = subprocess.run([sys.executable, "-c", code], cwd=SHINYTB_DIR, env=env, capture_output=True, text=True)
+    assert completed.returncode == 0, completed.stderr
+
+
+
+# 应用模块启动时不导入 NumPy、pandas 与依赖它们的模块
+def test_app_defers_numeric_modules():
+    code = ("import sys, ShinyTB\n"
+            "assert not {'numpy', 'pandas', 'sim', 'store', 'matplotlib'} & set(sys.modules), sorted(sys.modules)\n")
+    completed = subprocess.run([sys.executable, "-c", code], cwd=SHINYTB_DIR, capture_output=True, text=True)
+    assert completed.returncode == 0, completed.stderr
+
+
+# 多个线程同时首次导入同一模块时，都得到导入完成的模块，且只计时一次
+def test_timed_import_waits_for_other_threads(tmp_path):
+    (tmp_path / "slow_module.py").write_text("import time\ntime.sleep(0.2)\nVALUE = 1\n")
+    code = ("import sys, threading, startup\n"
+            f"sys.path.insert(0, {str(tmp_path)!r})\n"
+            "values = []\n"
+            "threads = [threading.Thread(target=lambda: values.append(startup.timed_import('slow_module').VALUE)) for _ in range(4)]\n"
+            "[thread.start() for thread in threads]\n"
+            "[thread.join() for thread in threads]\n"
+            "assert values == [1, 1, 1, 1], values\n"
+            "assert startup.IMPORT_TIMES['slow_module'] >= 0.2\n")
+    completed = subprocess.run([sys.executable, "-c", code], cwd=SHINYTB_DIR, capture_output=True, text=True)
+    assert completed.returncode == 0, completed.stderr
+    assert completed.stdout.count("Imported slow_module") == 1
+
+def test_import_report():
+    rows = import_report("sim")
+    assert rows[-1]["module"] == "sim" and rows[-1]["depth"] == 0
+    assert any(row["module"] == "pandas" and row["depth"] == 1 for row in rows)
+    assert all(row["depth"] > 0 for row in rows[:-1])
+    assert format_report(rows, "sim").startswith("Importing sim:")
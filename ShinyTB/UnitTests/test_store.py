@@ -0,0 +1,89 @@
+import os
+import numpy as np
+import pandas as pd
+import batch
+from sim import STATES, run_ensemble
+from store import ResultStore, scenario_hash
+
+
+def test_columnar_round_trip_and_slices(tmp_path):
+    store = ResultStore(tmp_path)
+    scenario = {"engine": "metapopulation", "seed": 1, "replicates": 2}
+    trajectories = pd.DataFrame({"Replicate": np.repeat([0, 1], 3), "Region": ["A", "B", "C"] * 2,
+                                 "Days": 31, **{state: np.arange(6.0) for state in STATES}})
+    with store.writer(scenario) as entry:
+        entry.table("data", trajectories.drop(columns="Replicate"))
+        entry.table("trajectories", trajectories)
+        key = entry.commit({"i (Susceptible to Infection) daily": np.array([1.0, 3.0]), "Engine": "metapopulation"})
+
+    assert key == scenario_hash(scenario) == store.find(dict(scenario))
+    data, params = store.load_result(key)
+    assert list(data["Region"]) == ["A", "B", "C"] * 2
+    assert params["i (Susceptible to Infection) daily"] == 2.0
+    second, params = store.load_result(key, replicate=1)
+    assert list(second["Infected"]) == [3.0, 4.0, 5.0] and "Replicate" not in second
+    assert params["Replicate"] == 1
+    assert list(store.load_table(key, "data", columns=["Days"], rows=slice(1, 3)).columns) == ["Days"]
+    assert store.runs()["Hash"].tolist() == [key]
+
+
+# 批量运行时各进程直接写入结果库中的轨迹数组；再次运行时直接读取结果库
+def test_batch_writes_memory_mapped_trajectories(tmp_path, monkeypatch):
+    scenario = {"population": 10_000, "init_infected": 10, "init_clinical": 5, "init_recovered": 0, "init_death": 0,
+                "basic_repro": 1.5, "sim_days": 730, "seed": 3, "replicates": 5}
+    first = batch.run_batch([scenario], processes=1, block=2, store=str(tmp_path))
+    store = ResultStore(tmp_path)
+    key = store.runs()["Hash"][0]
+    assert store.load_array(key, "trajectories").shape == (5, 24, len(STATES))
+
+    data, _ = run_ensemble(*(scenario[f] for f in batch.SCENARIO_FIELDS), replicates=5, seed=np.random.SeedSequence(3),
+                           aggregation="calendar_month")
+    replicate, params = store.load_result(key, replicate=4)
+    assert np.array_equal(replicate[STATES].to_numpy(), data[data["Replicate"] == 4][STATES].to_numpy())
+
+    monkeypatch.setattr(batch, "run_task", None)  # 已保存的场景不再运行
+    again = batch.run_batch([scenario], processes=1, store=str(tmp_path))
+    pd.testing.assert_frame_equal(first, again)
+
+
+# 超过条数上限时淘汰最久未使用的结果；读取过的结果记为最近使用
+def test_retention_evicts_least_recently_used(tmp_path):
+    store = ResultStore(tmp_path, max_runs=2)
+    frame = pd.DataFrame({"Days": [31], **{state: [1.0] for state in STATES}})
+
+    def save(seed):
+        with store.writer({"seed": seed}) as entry:
+            entry.table("data", frame)
+            key = entry.commit()
+        # 目录修改时间的精度有限，手动拉开各结果的使用时间
+        os.utime(os.path.join(store.root, key), (seed, seed))
+        return key
+
+    first, second = save(1), save(2)
+    store.load_result(first)
+    assert os.path.getmtime(os.path.join(store.root, first)) > 2
+    third = save(3)
+    assert sorted(store.runs()["Hash"]) == sorted([first, third])
+    assert store.find({"seed": 2}) is None and store.evictions == 1
+
+
+# 再次列出时只读取新增结果的 meta.json；其他进程删除的结果不再列出
+def test_runs_listing_is_cached(tmp_path, monkeypatch):
+    store = ResultStore(tmp_path)
+    frame = pd.DataFrame({"Days": [31], **{state: [1.0] for state in STATES}})
+    keys = []
+    for seed in (1, 2):
+        with store.writer({"seed": seed}) as entry:
+            entry.table("data", frame)
+            keys.append(entry.commit())
+    assert sorted(store.runs()["Hash"]) == sorted(keys)
+
+    reads = []
+    original = store.meta
+    monkeypatch.setattr(store, "meta", lambda key: reads.append(key) or original(key))
+    with store.writer({"seed": 3}) as entry:
+        entry.table("data", frame)
+        keys.append(entry.commit())
+    ResultStore(tmp_path).delete(keys[0])
+    assert sorted(store.runs()["Hash"]) == sorted(keys[1:])
+    assert reads == [keys[2]]
@@ -0,0 +1,22 @@
+import pandas as pd
+from sim import iter_simulation, run_simulation
+
+ARGS = (1000, 10, 5, 0, 0, 1.5, 400)
+
+
+# 流式模拟的各个 chunk 拼接后应与 run_simulation 的结果完全一致
+def test_chunks_match_run_simulation():
+    expected, expected_params = run_simulation(*ARGS, seed=7)
+    for chunk_records in (1, 5):
+        chunks = list(iter_simulation(*ARGS, seed=7, chunk_records=chunk_records))
+        assert all(len(chunk) <= chunk_records for chunk, _ in chunks)
+        data = pd.concat([chunk for chunk, _ in chunks], ignore_index=True)
+        pd.testing.assert_frame_equal(data, expected)
+        assert chunks[-1][1] == expected_params
+
+
+# 计算核心在校准、敏感性分析等循环中反复调用：不向标准输出写日志，且保留文档字符串
+def test_run_simulation_is_silent(capsys):
+    run_simulation(*ARGS, seed=7)
+    assert capsys.readouterr().out == ""
+    assert run_simulation.__doc__ and "population" in run_simulation.__doc__
@@ -0,0 +1,61 @@
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+import report
+from sim import STATES
+from structured import (age_contact_matrix, default_age_groups, default_regions, run_age_structured, run_metapopulation,
+                        uniform_mixing)
+
+
+# 单位混合矩阵：各地区互不影响，没有初始病例的地区一直没有感染
+def test_identity_mixing_keeps_regions_independent():
+    regions = default_regions(3_000_000, 1000, 500, 0, 0, 3)
+    data, params = run_metapopulation(regions, np.eye(3), 5, 365 * 20, replicates=4, seed=3, aggregation="yearly")
+    assert list(data.columns) == ["Replicate", "Region", "Days", *STATES]
+    assert len(data) == 4 * 3 * 20
+    quiet = data[data["Region"] != "Region 1"]
+    assert (quiet[["Infected", "Clinical", "Recovered", "Death"]] == 0).all().all()
+    assert len(params["i (Susceptible to Infection) daily"]) == 4
+
+
+# 地区间混合时病例扩散到其他地区，各轨迹总人数守恒
+def test_mixing_spreads_cases_and_conserves_population():
+    regions = default_regions(3_000_000, 1000, 500, 0, 0, 3)
+    data, _ = run_metapopulation(regions, uniform_mixing(3, 0.3), 5, 365 * 20, replicates=2, seed=3,
+                                 aggregation="yearly")
+    last = data[data["Days"] == data["Days"].max()]
+    assert (last[last["Region"] != "Region 1"]["Recovered"] > 0).all()
+    totals = data.groupby(["Replicate", "Days"])[STATES].sum().sum(axis=1)
+    assert np.allclose(totals, 3_000_000, atol=3)
+
+
+def test_report_includes_region_section():
+    regions = default_regions(30_000, 10, 5, 0, 0, 3)
+    data, params = run_metapopulation(regions, uniform_mixing(3, 0.1), 1.5, 365, seed=1)
+    html = report.generate_html_template({"data": data.drop(columns="Replicate"), "params": params})
+    assert "Results by Region" in html
+    assert html.count("data:image/png;base64,") == 2
+
+
+def test_default_age_groups_and_contacts():
+    ages = default_age_groups(1_000_000, 1000, 500, 0, 0, count=16)
+    assert ages["Population"].sum() == 1_000_000
+    assert ages["Infected"].sum() == 1000 and ages["Clinical"].sum() == 500
+    assert ages["Age group"].iloc[-1] == "75+"
+    assert np.allclose(age_contact_matrix(16).sum(axis=1), 1)
+
+
+# 年龄组的转换率倍数：易感性为 0 的年龄组不会被感染，各年龄组同时推进所有轨迹
+def test_age_rate_multipliers():
+    ages = default_age_groups(1_000_000, 1000, 500, 0, 0, count=16)
+    ages["Infected"] = ages["Clinical"] = 0
+    ages.loc[5, ["Infected", "Clinical"]] = [1000, 500]
+    ages["i"] = 1.0
+    ages.loc[0, "i"] = 0.0
+    data, params = run_age_structured(ages, age_contact_matrix(16), 5, 365 * 10, replicates=8, seed=2,
+                                      aggregation="yearly")
+    assert list(data.columns) == ["Replicate", "Age group", "Days", *STATES]
+    assert data["Replicate"].nunique() == 8
+    last = data[data["Days"] == data["Days"].max()]
+    assert (last[last["Age group"] == "0-4"][["Infected", "Clinical"]] == 0).all().all()
+    assert (last[last["Age group"] == "5-9"]["Infected"] > 0).all()
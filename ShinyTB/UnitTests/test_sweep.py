@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import sweep
+from sweep import run_sweep, parse_r0_grid
+
+REAL = pd.DataFrame({
+    "Year": [2005, 2006, 2007],
+    "Susceptible": [9000, 9010, 9020],
+    "Infection": [900, 905, 910],
+    "Clinical": [80, 78, 75],
+    "Recovered": [15, 14, 13],
+    "Death": [5, 4, 4],
+    "Population": [10000, 10011, 10022],
+})
+
+
+def test_parse_r0_grid():
+    assert parse_r0_grid("0.1:0.5:0.2") == [0.1, 0.3, 0.5]
+    assert parse_r0_grid("1, 1.5") == [1.0, 1.5]
+
+
+def test_sweep_table_and_mse():
+    table, mse = run_sweep([0.5, 1.5], REAL, replicates=2, seed=4, processes=1)
+    assert list(table.columns) == ["R0", "Year", "Susceptible", "Infection", "Clinical", "Recovered", "Death", "Population"]
+    assert len(table) == 2 * len(REAL)
+    # 首年为真实数据的初始状态
+    first = table[(table["R0"] == 0.5) & (table["Year"] == 2005)].iloc[0]
+    assert first["Infection"] == 900 and first["Death"] == 5
+
+    group = table[table["R0"] == 1.5].reset_index(drop=True)
+    expected = np.mean((group["Clinical"] - REAL["Clinical"]) ** 2)
+    assert np.isclose(mse.loc[mse["R0"] == 1.5, "Clinical"].iloc[0], expected)
+
+
+def test_parallel_sweep_matches_serial():
+    serial, _ = run_sweep([0.5, 1.0, 1.5], REAL, replicates=2, seed=9, processes=1)
+    parallel, _ = run_sweep([0.5, 1.0, 1.5], REAL, replicates=2, seed=9, processes=2)
+    pd.testing.assert_frame_equal(serial, parallel)
+    # 后续映射复用同一个进程池，而不是每次创建新的
+    pool = sweep.shared_pool(2)
+    assert sweep.parallel_map(abs, [-1, -2, -3], processes=2) == [1, 2, 3]
+    assert sweep.shared_pool(2) is pool
@@ -0,0 +1,246 @@
+"""无界面批量运行：从 CSV 或 YAML 场景文件读取多个模拟场景，在多个进程中并行运行，
+将各场景按记录日汇总的结果（轨迹均值与标准差）写为 CSV 或 Parquet。不导入 Shiny、Playwright 或 matplotlib。
+
+场景字段（CSV 的列或 YAML 中每个场景的键）:
+- population, init_infected, init_clinical, init_recovered, init_death, basic_repro, sim_days: 同 run_simulation
+- name: 场景名（缺省为 scenario_<序号>）
+- seed: 随机种子（缺省由 --seed 为每个场景派生）
+- replicates: 轨迹条数（缺省 1）
+- engine: ensemble（连续模型的集合模拟，缺省）、binomial 或 ode
+- aggregation: 记录天的汇总方式（见 sim.AGGREGATIONS，缺省 calendar_month）
+YAML 文件可以是场景列表，也可以是 {defaults: {...}, scenarios: [...]}，defaults 中的值用于所有场景。
+
+ensemble 场景的轨迹按 --block 条一组拆分为独立任务，任务数多于核心数时吞吐量随核心数近似线性增长；
+拆分使用每条轨迹固定的派生种子，因此结果与拆分方式及进程数无关。
+
+给出 --store 时，每个场景的汇总表与全部轨迹（轨迹数 × 记录条数 × 状态数 的内存映射数组，由各工作进程直接写入
+自己负责的切片）保存到结果库中，可在应用的 Stored Results 页浏览；结果库中已有的场景不再重新运行。
+
+给出 --quantiles 时，每个任务将其轨迹加入分位数草图（见 quantiles.QuantileSketch），各任务的草图在主进程中合并，
+汇总表另含各状态的中位数与 50%/90% 区间列（如 "Clinical Median"、"Clinical 5%"），无需保留全部轨迹。
+
+命令行示例（在 ShinyTB 目录下运行）:
+    python batch.py scenarios.yaml --out results.parquet --processes 8
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from quantiles import BAND_QUANTILES, QuantileSketch
+from sim import AGGREGATIONS, STATES, record_days, replicate_seeds, run_binomial, run_ensemble, run_ode
+from store import ResultStore, open_array
+from sweep import parallel_map, read_table
+
+SCENARIO_FIELDS = ["population", "init_infected", "init_clinical", "init_recovered", "init_death", "basic_repro", "sim_days"]
+ENGINES = ["ensemble", "binomial", "ode"]
+DEFAULT_BLOCK = 10
+
+
+def read_scenarios(path):
+    """读取场景文件（.yaml/.yml 或 CSV/Excel），返回场景字典列表"""
+    if str(path).lower().endswith((".yaml", ".yml")):
+        import yaml  # 只有 YAML 场景文件需要 PyYAML
+        with open(path) as f:
+            content = yaml.safe_load(f) or []
+        if isinstance(content, dict):
+            defaults = content.get("defaults") or {}
+            scenarios = [{**defaults, **scenario} for scenario in content.get("scenarios") or []]
+        else:
+            scenarios = list(content)
+    else:
+        table = read_table(path)
+        scenarios = [{k: v for k, v in row.items() if not pd.isna(v)} for row in table.to_dict("records")]
+    return scenarios
+
+
+def normalize_scenarios(scenarios, seed=None):
+    """检查字段并补全缺省值；未给出种子的场景使用由根种子为其派生的种子"""
+    derived = np.random.SeedSequence(seed).spawn(len(scenarios))
+    normalized = []
+    for index, scenario in enumerate(scenarios):
+        missing = [field for field in SCENARIO_FIELDS if field not in scenario]
+        if missing:
+            raise ValueError(f"Scenario {index + 1} is missing fields: {missing}")
+        engine = str(scenario.get("engine", "ensemble"))
+        aggregation = str(scenario.get("aggregation", "calendar_month"))
+        if engine not in ENGINES:
+            raise ValueError(f"Scenario {index + 1}: unknown engine {engine!r} (choose from {ENGINES})")
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"Scenario {index + 1}: unknown aggregation {aggregation!r}")
+        replicates = 1 if engine == "ode" else int(scenario.get("replicates", 1))
+        if replicates < 1:
+            raise ValueError(f"Scenario {index + 1}: replicates must be at least 1")
+        normalized.append({
+            "name": str(scenario.get("name", f"scenario_{index + 1}")),
+            **{field: int(scenario[field]) for field in SCENARIO_FIELDS if field != "basic_repro"},
+            "basic_repro": float(scenario["basic_repro"]),
+            "seed": np.random.SeedSequence(int(scenario["seed"])) if "seed" in scenario else derived[index],
+            "replicates": replicates,
+            "engine": engine,
+            "aggregation": aggregation,
+        })
+    return normalized
+
+
+def build_tasks(scenarios, block=DEFAULT_BLOCK, arrays=None, quantiles=False):
+    """拆分为进程任务 (场景序号, 场景, 种子, 轨迹数组路径, 首条轨迹序号, 是否计算分位数草图)：
+    ensemble 场景每 block 条轨迹一个任务，其余场景整体一个任务；arrays 为 {场景序号: 结果库中的轨迹数组路径}"""
+    arrays = arrays or {}
+    tasks = []
+    for index, scenario in enumerate(scenarios):
+        if scenario["engine"] == "ensemble":
+            seeds = replicate_seeds(scenario["seed"], scenario["replicates"])
+            tasks += [(index, scenario, seeds[start:start + block], arrays.get(index), start, quantiles)
+                      for start in range(0, len(seeds), block)]
+        else:
+            tasks.append((index, scenario, scenario["seed"], arrays.get(index), 0, quantiles))
+    return tasks
+
+
+def run_task(task):
+    """在工作进程中运行一个任务，返回 (场景序号, 记录天, 各状态之和, 各状态平方和, 轨迹数, 参数之和, 分位数草图或 None)；
+    给出轨迹数组路径时同时将本任务的轨迹写入数组中的对应切片"""
+    index, scenario, seed, array_path, offset, quantiles = task
+    inputs = [scenario[field] for field in SCENARIO_FIELDS]
+    if scenario["engine"] == "ode":
+        data, params = run_ode(*inputs, aggregation=scenario["aggregation"])
+        data.insert(0, "Replicate", 0)
+    elif scenario["engine"] == "binomial":
+        data, params = run_binomial(*inputs, replicates=scenario["replicates"], seed=seed, aggregation=scenario["aggregation"])
+    else:
+        data, params = run_ensemble(*inputs, replicates=len(seed), seed=seed, aggregation=scenario["aggregation"])
+    days = data.loc[data["Replicate"] == data["Replicate"].iloc[0], "Days"].to_numpy()
+    values = data[STATES].to_numpy(dtype=float).reshape(-1, len(days), len(STATES))
+    if array_path is not None:
+        trajectories = open_array(array_path)
+        trajectories[offset:offset + len(values)] = values
+        trajectories.flush()
+        del trajectories
+    param_sums = {key: float(np.sum(value)) if np.ndim(value) else float(value) * len(values)
+                  for key, value in params.items()}
+    sketch = None
+    if quantiles:
+        sketch = QuantileSketch(values.shape[1:], scenario["population"])
+        sketch.add(values)
+    return index, days, values.sum(axis=0), (values ** 2).sum(axis=0), len(values), param_sums, sketch
+
+
+def combine(outputs):
+    """合并各任务的部分和与分位数草图，返回 {场景序号: (汇总表（记录天、各状态轨迹均值与标准差，
+    有草图时另含各状态的 BAND_QUANTILES 分位数）, 参数均值)}"""
+    totals = {}
+    for index, days, sums, squares, count, param_sums, sketch in outputs:
+        if index in totals:
+            previous = totals[index]
+            totals[index] = (days, previous[1] + sums, previous[2] + squares, previous[3] + count,
+                             {key: previous[4][key] + value for key, value in param_sums.items()},
+                             previous[5].merge(sketch) if sketch is not None else None)
+        else:
+            totals[index] = (days, sums, squares, count, param_sums, sketch)
+    combined = {}
+    for index, (days, sums, squares, count, param_sums, sketch) in totals.items():
+        mean = sums / count
+        sd = np.sqrt(np.maximum(squares / count - mean ** 2, 0) * (count / (count - 1))) if count > 1 else np.zeros_like(mean)
+        frame = pd.DataFrame(mean, columns=STATES)
+        for k, state in enumerate(STATES):
+            frame[f"{state} sd"] = sd[:, k]
+        if sketch is not None:
+            for name, q in BAND_QUANTILES.items():
+                estimate = sketch.quantile(q)
+                for k, state in enumerate(STATES):
+                    frame[f"{state} {name}"] = estimate[:, k]
+        frame.insert(0, "Days", days)
+        params = {key: value / count for key, value in param_sums.items()}
+        params["Replicates"] = count
+        combined[index] = (frame, params)
+    return combined
+
+
+def store_scenario(scenario, quantiles=False):
+    """结果库中的场景描述（与 normalize_scenarios 的字段相同，种子以 SeedSequence 的熵与派生路径表示；
+    ode 场景与种子无关，不含种子；汇总表含分位数列时另含 quantiles）"""
+    excluded = {"name", "seed"} if scenario["engine"] == "ode" else {"name"}
+    described = {key: value for key, value in scenario.items() if key not in excluded}
+    if quantiles:
+        described["quantiles"] = True
+    return described
+
+
+def run_batch(scenarios, processes=None, seed=None, block=DEFAULT_BLOCK, store=None, quantiles=False):
+    """运行全部场景并返回汇总长表：Scenario、Engine、Replicates、Days、各状态均值及标准差（quantiles 为真时另含分位数）。
+    store 为 ResultStore 或其目录时，保存新场景的结果，并直接读取结果库中已有的场景"""
+    scenarios = normalize_scenarios(scenarios, seed)
+    if isinstance(store, str):
+        store = ResultStore(store)
+    results, entries, arrays = {}, {}, {}
+    for index, scenario in enumerate(scenarios):
+        key = store.find(store_scenario(scenario, quantiles)) if store is not None else None
+        if key is not None:
+            frame, params = store.load_result(key)
+            results[index] = (frame, {**params, "Stored result": key})
+        elif store is not None:
+            entries[index] = store.writer(store_scenario(scenario, quantiles))
+            days = record_days(scenario["sim_days"], aggregation=scenario["aggregation"])
+            arrays[index] = entries[index].array("trajectories", (scenario["replicates"], len(days), len(STATES)),
+                                                 ["Replicate", "Days", "State"],
+                                                 coords={"Days": days.tolist(), "State": STATES})
+    pending = [scenario for index, scenario in enumerate(scenarios) if index not in results]
+    tasks = [task for task in build_tasks(scenarios, block, arrays, quantiles) if task[0] not in results]
+    print(f"Running {len(pending)} scenarios as {len(tasks)} tasks "
+          f"({len(results)} read from the result store)...", flush=True)
+    try:
+        computed = combine(parallel_map(run_task, tasks, processes))
+    except BaseException:
+        for entry in entries.values():
+            entry.discard()
+        raise
+    for index, (frame, params) in computed.items():
+        if index in entries:
+            entries[index].table("data", frame)
+            params["Stored result"] = entries[index].commit(params)
+        results[index] = (frame, params)
+
+    frames = []
+    for index, scenario in enumerate(scenarios):
+        frame, params = results[index]
+        frame = frame.copy()
+        frame.insert(0, "Replicates", int(params["Replicates"]))
+        frame.insert(0, "Engine", scenario["engine"])
+        frame.insert(0, "Scenario", scenario["name"])
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def write_results(table, path):
+    """按扩展名写出 CSV 或 Parquet（Parquet 需要 pyarrow 或 fastparquet）"""
+    if str(path).lower().endswith(".parquet"):
+        table.to_parquet(path, index=False)
+    else:
+        table.to_csv(path, index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run TB simulation scenarios from a CSV or YAML file without the Shiny app.")
+    parser.add_argument("scenarios", help="scenario file (.csv, .xlsx, .yaml or .yml)")
+    parser.add_argument("--out", default="batch_results.csv", help="aggregated results (.csv or .parquet)")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=None, help="root seed for scenarios without their own seed")
+    parser.add_argument("--block", type=int, default=DEFAULT_BLOCK, help="ensemble replicates per task")
+    parser.add_argument("--store", default=None, help="result store directory (save trajectories, reuse stored scenarios)")
+    parser.add_argument("--quantiles", action="store_true",
+                        help="add per-state median and 50%%/90%% interval columns (merged quantile sketches)")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    table = run_batch(read_scenarios(args.scenarios), processes=args.processes, seed=args.seed, block=max(1, args.block),
+                      store=args.store, quantiles=args.quantiles)
+    write_results(table, args.out)
+    print(f"Wrote {len(table)} rows for {table['Scenario'].nunique()} scenarios to {args.out} "
+          f"in {time.perf_counter() - start:.1f} s using {args.processes or os.cpu_count()} processes", flush=True)
+
+
+if __name__ == "__main__":
+    main()
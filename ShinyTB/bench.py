@@ -0,0 +1,230 @@
+"""离线基准测试：测量模拟、报告生成与界面渲染热点路径随模拟天数、人口与轨迹数的耗时与峰值内存。
+
+每个用例先预热一次，再运行 repeat 次取最小与中位耗时（time.perf_counter），
+另运行一次在 tracemalloc 下记录 Python 分配的峰值内存（不含 Chromium 等子进程）。
+结果写为 JSON，并与保存的基准结果比较：耗时或峰值内存超过基准 (1 + tolerance) 倍的用例记为回归。
+基准结果只对生成它的机器（及相同的 Chromium 可用情况）有意义，因此不纳入版本控制：
+在每台机器上先以 --update-baseline 生成 bench_baseline.json；新增用例或基准中被跳过的用例会被列出而不比较。
+
+    python bench.py                                # 运行全部用例并与 bench_baseline.json 比较
+    python bench.py --quick --only simulation      # 只运行小规模的模拟用例
+    python bench.py --browser /usr/bin/chromium    # 使用本地 Chromium 测量 PDF 导出
+    python bench.py --update-baseline              # 以本次结果作为新的基准
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+import report
+from plots import plot_simulation
+from sim import run_ensemble, run_simulation
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+# 比较时忽略低于该绝对差值的变化（计时与分配的噪声）
+NOISE_FLOOR = {"seconds": 0.005, "peak_bytes": 1 << 20}
+
+# 各维度的取值：完整运行与 --quick 运行
+SWEEPS = {
+    "full": {"sim_days": [365, 365 * 10, 365 * 100], "population": [1_000, 1_000_000], "replicates": [1, 10, 100]},
+    "quick": {"sim_days": [365, 365 * 10], "population": [1_000], "replicates": [1, 10]},
+}
+
+
+def simulation_result(population, sim_days, replicates=1, seed=2025):
+    """生成报告与渲染用例的输入：单轨迹为 run_simulation 的结果，多轨迹为 run_ensemble 的轨迹均值"""
+    if replicates == 1:
+        data, params = run_simulation(population, 10, 5, 0, 0, 1.5, sim_days, seed=seed)
+    else:
+        data, params = run_ensemble(population, 10, 5, 0, 0, 1.5, sim_days, replicates=replicates, seed=seed)
+        data = data.groupby("Days", as_index=False).mean().drop(columns="Replicate")
+        params = {name: float(np.mean(value)) for name, value in params.items()}
+    return {"data": data, "params": params}
+
+
+def render_plot(data):
+    """sim_plot 的工作：绘图并按 render.plot 的方式编码为 PNG"""
+    fig = plot_simulation(data)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=96)
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def render_table(data):
+    """sim_table 的工作：render.data_frame 将返回的数据表包装为 DataGrid，序列化为发送给浏览器的 JSON"""
+    from shiny import render
+    return json.dumps(render.DataGrid(data).to_payload())
+
+
+def _on_result(population, sim_days, replicates, make):
+    """用例的 setup：先生成模拟结果（不计时），再由 make(result) 构造待测函数"""
+    return lambda: make(simulation_result(population, sim_days, replicates))
+
+
+def build_cases(sweep, browser_path=None):
+    """返回用例列表 (分组, 名称, 参数, setup)；setup() 返回待测的无参函数（准备工作不计入耗时）"""
+    cases = []
+    for population in sweep["population"]:
+        for sim_days in sweep["sim_days"]:
+            cases.append(("simulation", "run_simulation", {"population": population, "sim_days": sim_days},
+                          lambda p=population, d=sim_days: lambda: run_simulation(p, 10, 5, 0, 0, 1.5, d, seed=1)))
+    for replicates in sweep["replicates"]:
+        for sim_days in sweep["sim_days"]:
+            cases.append(("simulation", "run_ensemble", {"replicates": replicates, "sim_days": sim_days},
+                          lambda r=replicates, d=sim_days:
+                          lambda: run_ensemble(1_000, 10, 5, 0, 0, 1.5, d, replicates=r, seed=1)))
+
+    # 报告与渲染用例：每次调用使用新的结果字典，测量未命中报告缓存时的完整生成
+    population = sweep["population"][-1]
+    shapes = [(sim_days, 1) for sim_days in sweep["sim_days"]]
+    shapes += [(sweep["sim_days"][-1], replicates) for replicates in sweep["replicates"] if replicates > 1]
+    for sim_days, replicates in shapes:
+        params = {"population": population, "sim_days": sim_days, "replicates": replicates}
+        cases.append(("report", "generate_html_template", params, _on_result(
+            population, sim_days, replicates, lambda base: lambda: report.generate_html_template(dict(base)))))
+        cases.append(("report", "generate_pdf_report", params, _on_result(
+            population, sim_days, replicates,
+            lambda base: lambda: asyncio.run(report.generate_pdf_report(dict(base), browser_path, backend="chromium")))))
+        cases.append(("report", "generate_pdf_report", {**params, "backend": "native"}, _on_result(
+            population, sim_days, replicates,
+            lambda base: lambda: asyncio.run(report.generate_pdf_report(dict(base), backend="native")))))
+        for image_format in report.IMAGE_FORMATS:
+            cases.append(("report", "fig_to_base64", {**params, "image_format": image_format}, _on_result(
+                population, sim_days, replicates,
+                lambda base, f=image_format: lambda: report.fig_to_base64(plot_simulation(base["data"]), image_format=f))))
+        cases.append(("render", "sim_plot", params, _on_result(
+            population, sim_days, replicates, lambda base: lambda: render_plot(base["data"]))))
+        cases.append(("render", "sim_table", params, _on_result(
+            population, sim_days, replicates, lambda base: lambda: render_table(base["data"]))))
+    return cases
+
+
+def measure(func, repeat=3):
+    """预热一次后运行 repeat 次记录耗时，再在 tracemalloc 下运行一次记录峰值内存"""
+    func()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": min(times), "median_seconds": statistics.median(times), "peak_bytes": peak, "repeat": repeat}
+
+
+def case_key(entry):
+    """用于与基准结果对应的用例键：名称与排序后的参数"""
+    return entry["name"] + "".join(f" {k}={v}" for k, v in sorted(entry["params"].items()))
+
+
+def run_benchmarks(sweep="full", only=None, repeat=3, browser_path=None):
+    """运行基准用例，返回 JSON 可序列化的结果字典；无法运行的用例（如没有 Chromium）记为 skipped"""
+    results = []
+    for group, name, params, setup in build_cases(SWEEPS[sweep], browser_path):
+        if only and group not in only and name not in only:
+            continue
+        entry = {"group": group, "name": name, "params": params}
+        try:
+            entry.update(measure(setup(), repeat))
+        except Exception as e:
+            entry["skipped"] = f"{type(e).__name__}: {str(e).strip().splitlines()[0] if str(e).strip() else ''}"
+        finally:
+            plt.close("all")
+        print(f"{case_key(entry)}: " + (f"skipped ({entry['skipped']})" if "skipped" in entry else
+                                        f"{entry['seconds'] * 1000:.1f} ms, peak {entry['peak_bytes'] / 2 ** 20:.1f} MiB"),
+              flush=True)
+        results.append(entry)
+    report.browser_manager.shutdown()
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "sweep": sweep,
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, tolerance=0.25):
+    """与基准结果逐用例比较，返回回归列表 (用例键, 指标, 基准值, 当前值)；基准中没有或被跳过的用例不比较，
+    超出比例但绝对差值低于 NOISE_FLOOR 的变化不算回归"""
+    reference = {case_key(entry): entry for entry in baseline["results"] if "skipped" not in entry}
+    regressions = []
+    for entry in current["results"]:
+        old = reference.get(case_key(entry))
+        if old is None or "skipped" in entry:
+            continue
+        for metric in ("seconds", "peak_bytes"):
+            if entry[metric] > old[metric] * (1 + tolerance) and entry[metric] - old[metric] > NOISE_FLOOR[metric]:
+                regressions.append((case_key(entry), metric, old[metric], entry[metric]))
+    return regressions
+
+
+def uncompared(current, baseline):
+    """返回无法与基准比较的用例键：本次或基准中被跳过的用例，以及基准中没有的（如基准生成后新增的）用例"""
+    reference = {case_key(entry): entry for entry in baseline["results"] if "skipped" not in entry}
+    return [case_key(entry) for entry in current["results"] if "skipped" in entry or case_key(entry) not in reference]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark simulation, report and render hot paths.")
+    parser.add_argument("--quick", action="store_true", help="smaller sweep for a fast check")
+    parser.add_argument("--only", nargs="*", default=None, help="groups (simulation, report, render) or case names to run")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case")
+    parser.add_argument("--browser", default=None, help="local Chromium executable for the PDF case")
+    parser.add_argument("--out", default="bench_results.json", help="JSON results file")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="stored baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown / memory growth")
+    parser.add_argument("--update-baseline", action="store_true", help="write the results as the new baseline")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks("quick" if args.quick else "full", args.only, args.repeat, args.browser)
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.baseline}", flush=True)
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one.", flush=True)
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline["meta"].get("platform") != results["meta"]["platform"]:
+        print(f"Warning: baseline was recorded on {baseline['meta'].get('platform')}, "
+              f"timings from another machine are not comparable.", flush=True)
+    missing = uncompared(results, baseline)
+    if missing:
+        print(f"{len(missing)} case(s) not compared (skipped or no baseline entry; rerun with --update-baseline): "
+              + ", ".join(missing), flush=True)
+    regressions = compare(results, baseline, args.tolerance)
+    for key, metric, old, new in regressions:
+        print(f"REGRESSION {key}: {metric} {old:.4g} -> {new:.4g} ({new / old - 1:+.0%})", flush=True)
+    print(f"{len(regressions)} regression(s) against {args.baseline}", flush=True)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
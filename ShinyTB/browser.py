@@ -0,0 +1,157 @@
+"""应用级无头 Chromium 管理器。
+
+Playwright 在独立后台线程的事件循环中运行：浏览器在首次导出时启动一次，
+之后所有会话的导出共享该浏览器，并从有上限的页面池中复用页面；
+浏览器崩溃或断开后在下次使用时自动重启；应用关闭时通过 shutdown() 干净地退出。
+"""
+import asyncio
+import threading
+
+from startup import timed_import
+
+
+class BrowserManager:
+    def __init__(self, max_pages=4, launch_timeout=60):
+        self.max_pages = max_pages
+        self.launch_timeout = launch_timeout
+        self._loop = None
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        # 以下对象只在管理器线程的事件循环中访问
+        self._playwright = None
+        self._browsers = {}      # executable_path -> Browser
+        self._idle_pages = {}    # executable_path -> [Page]
+        self._semaphore = None
+        self._launch_lock = None
+        self.launches = 0
+
+    # ---- 后台事件循环 ----
+    def _ensure_loop(self):
+        with self._thread_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="browser-manager", daemon=True)
+                self._thread.start()
+        return self._loop
+
+    def submit(self, coro):
+        """将协程提交到管理器线程运行，返回 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    # ---- 以下协程均在管理器线程中运行 ----
+    async def _get_browser(self, executable_path):
+        if self._launch_lock is None:
+            self._launch_lock = asyncio.Lock()
+        async with self._launch_lock:
+            browser = self._browsers.get(executable_path)
+            if browser is not None and browser.is_connected():
+                return browser
+            # 浏览器未启动或已崩溃：丢弃旧页面并重新启动
+            self._forget(executable_path)
+            if self._playwright is None:
+                # Playwright 在首次导出时才导入，应用启动时不必付出其导入耗时
+                async_playwright = timed_import("playwright.async_api").async_playwright  # 异步API
+                self._playwright = await async_playwright().start()
+            launch_options = {"timeout": self.launch_timeout * 1000}
+            if executable_path:
+                # 使用关键字参数传递路径
+                launch_options["executable_path"] = executable_path.replace("\\", "/")
+            print(f"Launching Chromium ({executable_path or 'bundled'})...", flush=True)
+            browser = await self._playwright.chromium.launch(**launch_options)
+            browser.on("disconnected", lambda _: self._forget(executable_path, browser))
+            self._browsers[executable_path] = browser
+            self._idle_pages[executable_path] = []
+            self.launches += 1
+            return browser
+
+    def _forget(self, executable_path, browser=None):
+        """移除已断开的浏览器及其页面池"""
+        if browser is None or self._browsers.get(executable_path) is browser:
+            self._browsers.pop(executable_path, None)
+            self._idle_pages.pop(executable_path, None)
+
+    async def _acquire_page(self, executable_path):
+        browser = await self._get_browser(executable_path)
+        idle = self._idle_pages.setdefault(executable_path, [])
+        while idle:
+            page = idle.pop()
+            if not page.is_closed():
+                return browser, page
+        return browser, await browser.new_page()
+
+    def _release_page(self, executable_path, browser, page):
+        if browser.is_connected() and not page.is_closed() and self._browsers.get(executable_path) is browser:
+            self._idle_pages.setdefault(executable_path, []).append(page)
+
+    async def _render_pdf(self, html_content, executable_path, pdf_options):
+        async with self._semaphore_for_loop():
+            # 浏览器在渲染途中崩溃时重启并重试一次
+            for attempt in range(2):
+                browser, page = await self._acquire_page(executable_path)
+                try:
+                    await page.set_content(html_content)
+                    pdf_bytes = await page.pdf(**pdf_options)
+                except Exception:
+                    await _close_quietly(page)
+                    if attempt == 0 and not browser.is_connected():
+                        print("Chromium disconnected, restarting...", flush=True)
+                        continue
+                    raise
+                self._release_page(executable_path, browser, page)
+                return pdf_bytes
+
+    def _semaphore_for_loop(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_pages)
+        return self._semaphore
+
+    async def _close(self):
+        for executable_path, browser in list(self._browsers.items()):
+            self._forget(executable_path)
+            await _close_quietly(browser)
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+        # 锁与信号量绑定在当前事件循环上，重新启动后需重建
+        self._launch_lock = None
+        self._semaphore = None
+
+    # ---- 对外接口 ----
+    async def render_pdf(self, html_content, executable_path=None, **pdf_options):
+        """在共享浏览器中将 HTML 渲染为 PDF（可在任意事件循环中 await）"""
+        pdf_options.setdefault("format", "A4")
+        future = self.submit(self._render_pdf(html_content, executable_path or None, pdf_options))
+        return await asyncio.wrap_future(future)
+
+    def stats(self):
+        return {
+            "browsers": len(self._browsers),
+            "idle_pages": sum(len(pages) for pages in self._idle_pages.values()),
+            "max_pages": self.max_pages,
+            "launches": self.launches,
+        }
+
+    def shutdown(self, timeout=10):
+        """关闭所有浏览器与 Playwright，并停止后台线程（同步调用，可注册为 App.on_shutdown 回调）"""
+        with self._thread_lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._close(), loop).result(timeout)
+        except Exception as e:
+            print(f"Browser shutdown error: {e}", flush=True)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+
+
+async def _close_quietly(target):
+    try:
+        await target.close()
+    except Exception:
+        pass
+
+
+# 进程级共享的浏览器管理器
+browser_manager = BrowserManager()
@@ -0,0 +1,179 @@
+import sys
+import threading
+from collections import OrderedDict
+
+
+def estimate_size(value):
+    """估算缓存条目占用的字节数（DataFrame 按实际内存计算，字典/列表递归累加）"""
+    # 缓存只可能存有已导入的 pandas 的 DataFrame，无需为此在导入本模块时导入 pandas
+    pd = sys.modules.get("pandas")
+    if pd is not None and isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    nbytes = getattr(value, "nbytes", None)
+    if nbytes is not None:
+        return int(nbytes)
+    return sys.getsizeof(value)
+
+
+class SimulationCache:
+    """进程级的 LRU 模拟结果缓存，可同时限制条目数与内存占用，并统计命中/未命中次数。
+
+    缓存的结果在多个会话间共享，调用方应将其视为只读。
+    """
+
+    def __init__(self, max_entries=128, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """命中时返回结果并将其移到最近使用的位置，未命中返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """写入结果；超过条目数或内存上限时按最久未使用顺序淘汰"""
+        size = estimate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            # 单个结果超过内存上限时不缓存
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def stats(self):
+        """返回命中、未命中、淘汰次数以及当前条目数与占用字节数"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
+
+
+class _Flight:
+    """一次正在进行的计算：结束时设置 done，期间记录最新进度与已推送的部分结果"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.progress = (0, 1)
+        self.chunks = []
+
+
+class SingleFlight:
+    """合并相同键的并发计算：同一键正在计算时，后来的调用方等待同一次计算的结果，而不是重新计算。
+
+    第一个调用方（leader）在自己的线程中运行计算；其余调用方（follower）等待其结束，
+    期间转发 leader 推送的部分结果与进度，并以各自的 callback 检查自身是否已取消。
+    leader 因 retry_on 中的异常（如其会话取消了作业）结束时，等待者之一接替计算；其他异常转交给所有等待者。
+    结果在所有调用方间共享，应视为只读。
+    """
+
+    def __init__(self, poll=0.1):
+        self.poll = poll
+        self.leaders = 0
+        self.coalesced = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, compute, callback=None, on_chunk=None, retry_on=()):
+        """返回 compute(callback, on_chunk) 的结果；相同键的计算正在进行时等待并共享其结果"""
+        forwarded = 0
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+                    self.leaders += 1
+                else:
+                    self.coalesced += 1
+            if leader:
+                return self._lead(key, flight, compute, callback, on_chunk, forwarded)
+            forwarded = self._follow(flight, callback, on_chunk, forwarded)
+            if flight.error is None:
+                return flight.result
+            if not isinstance(flight.error, retry_on):
+                raise flight.error
+
+    def _lead(self, key, flight, compute, callback, on_chunk, forwarded):
+        def report(done, total):
+            flight.progress = (done, total)
+            if callback is not None:
+                callback(done, total)
+
+        def publish(chunk):
+            with self._lock:
+                flight.chunks.append(chunk)
+                count = len(flight.chunks)
+            # 接替计算时，已从上一个 leader 转发过的部分结果不再重复推送
+            if on_chunk is not None and count > forwarded:
+                on_chunk(chunk)
+
+        try:
+            flight.result = compute(report, publish)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _follow(self, flight, callback, on_chunk, forwarded):
+        """等待 flight 结束，返回已转发的部分结果数；自身被取消时 callback 抛出的异常直接传出"""
+        while True:
+            finished = flight.done.wait(self.poll)
+            with self._lock:
+                chunks = flight.chunks[forwarded:]
+            if on_chunk is not None:
+                for chunk in chunks:
+                    on_chunk(chunk)
+            forwarded += len(chunks)
+            if finished:
+                return forwarded
+            if callback is not None:
+                callback(*flight.progress)
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._flights)
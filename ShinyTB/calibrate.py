@@ -0,0 +1,147 @@
+"""模型校准：以真实数据（如 Rwork/real_ca.xlsx）为目标，自动拟合 R0，
+并可选地以 ABC 拒绝采样拟合 s、c、r1、r2、d 的取值范围。
+
+目标函数为各状态相对真实数据的归一化 MSE 之和；同一组参数的评估结果缓存复用。
+模拟使用固定种子（共同随机数），使目标函数对参数是确定性的；也可用 engine="ode" 以确定性方程快速评估。
+"""
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from cache import SimulationCache
+from sim import ANNUAL_RATE_DISTRIBUTIONS
+from sweep import MSE_STATES, initial_state, parallel_map, simulate_yearly
+
+# 进程级目标函数缓存：key 为参数组合，value 为 (loss, 逐年模拟表)
+evaluation_cache = SimulationCache(max_entries=4096, max_bytes=64 * 1024 * 1024)
+
+_GOLDEN = (math.sqrt(5) - 1) / 2
+
+
+def calibration_loss(table, real):
+    """各状态 MSE 除以真实值均值平方后求和，使量级相差很大的状态权重可比"""
+    merged = table.merge(real, on="Year", how="inner", suffixes=("_sim", "_real"))
+    loss = 0.0
+    for state in MSE_STATES:
+        real_values = merged[f"{state}_real"].to_numpy(dtype=float)
+        mse = np.mean((merged[f"{state}_sim"].to_numpy() - real_values) ** 2)
+        loss += mse / max(np.mean(real_values) ** 2, 1.0)
+    return float(loss)
+
+
+def _fixed_rates(rates):
+    """将拟合的转换率取值转换为退化（固定值）的截断窗口"""
+    return {name: {"low": value, "high": value} for name, value in rates.items()}
+
+
+def _evaluation_key(basic_repro, rates, real, replicates, seed, engine):
+    real_key = tuple(map(tuple, real[["Year"] + MSE_STATES + ["Population"]].to_numpy().tolist()))
+    return (round(basic_repro, 10), tuple(sorted((k, round(v, 10)) for k, v in rates.items())),
+            replicates, seed, engine, real_key)
+
+
+def _evaluate_task(task):
+    basic_repro, rates, real, replicates, seed, engine = task
+    years = sorted(real["Year"].unique())
+    table = simulate_yearly(basic_repro, initial_state(real), years, replicates, seed,
+                            rate_distributions=_fixed_rates(rates), engine=engine)
+    return calibration_loss(table, real), table
+
+
+def evaluate_many(candidates, real, replicates=2, seed=0, processes=None, engine="ensemble"):
+    """批量评估 (R0, rates) 候选参数，未缓存的部分在进程池中并行计算"""
+    keys = [_evaluation_key(r0, rates, real, replicates, seed, engine) for r0, rates in candidates]
+    results = [evaluation_cache.get(key) for key in keys]
+    pending = [k for k, result in enumerate(results) if result is None]
+    computed = parallel_map(_evaluate_task,
+                            [(candidates[k][0], candidates[k][1], real, replicates, seed, engine) for k in pending],
+                            processes)
+    for k, result in zip(pending, computed):
+        evaluation_cache.put(keys[k], result)
+        results[k] = result
+    return results
+
+
+def calibrate_r0(real, bounds=(0.1, 3.0), replicates=2, seed=0, tol=1e-3, max_evaluations=60, callback=None, engine="ensemble"):
+    """以黄金分割搜索（无导数）拟合 R0，其余转换率保持默认分布。
+
+    callback(done, total) 在每次评估后调用，可抛出 SimulationCancelled 中止校准。
+    返回字典：r0、loss、table（最优 R0 的逐年模拟表）、history（每次评估的 R0 与 loss）
+    """
+    print("Calibrating R0...", flush=True)
+    history = []
+
+    def loss_at(r0):
+        (loss, table), = evaluate_many([(r0, {})], real, replicates, seed, processes=1, engine=engine)
+        history.append((r0, loss))
+        if callback is not None:
+            callback(len(history), max_evaluations)
+        return loss, table
+
+    low, high = bounds
+    x1 = high - _GOLDEN * (high - low)
+    x2 = low + _GOLDEN * (high - low)
+    f1, f2 = loss_at(x1)[0], loss_at(x2)[0]
+    while high - low > tol and len(history) < max_evaluations:
+        if f1 <= f2:
+            high, x2, f2 = x2, x1, f1
+            x1 = high - _GOLDEN * (high - low)
+            f1 = loss_at(x1)[0]
+        else:
+            low, x1, f1 = x1, x2, f2
+            x2 = low + _GOLDEN * (high - low)
+            f2 = loss_at(x2)[0]
+    loss_at((low + high) / 2)
+    # 取所有评估点中 loss 最小者（目标函数带噪声时可能不在最终区间中点）
+    best, _ = min(history, key=lambda item: item[1])
+    loss, table = loss_at(best)
+    history = pd.DataFrame(history[:-1], columns=["R0", "Loss"]).sort_values("R0", ignore_index=True)
+    return {"r0": best, "loss": loss, "table": table, "history": history}
+
+
+def calibrate_abc(real, fit_rates=tuple(ANNUAL_RATE_DISTRIBUTIONS), r0_bounds=(0.1, 3.0), samples=200,
+                  accept_fraction=0.1, replicates=2, seed=0, processes=None, callback=None, engine="ensemble"):
+    """ABC 拒绝采样：从先验（R0 为均匀分布，各转换率在其默认截断窗口内均匀分布）抽取候选参数，
+    并行评估后保留 loss 最小的 accept_fraction 部分作为近似后验。
+
+    返回字典：
+    - posterior: 被接受样本的 DataFrame（R0、各转换率、Loss）
+    - summary: 每个参数的后验中位数及 5%–95% 区间（即拟合得到的取值范围）
+    - best: loss 最小的样本；table: 该样本的逐年模拟表
+    候选参数按批评估，每批结束后调用 callback(done, samples)，可抛出 SimulationCancelled 中止校准。
+    """
+    print(f"Calibrating with ABC over {samples} samples...", flush=True)
+    rng = np.random.default_rng(seed)
+    candidates = []
+    for _ in range(samples):
+        r0 = float(rng.uniform(*r0_bounds))
+        rates = {name: float(rng.uniform(ANNUAL_RATE_DISTRIBUTIONS[name]["low"], ANNUAL_RATE_DISTRIBUTIONS[name]["high"]))
+                 for name in fit_rates}
+        candidates.append((r0, rates))
+    batch = 4 * (processes or os.cpu_count() or 1)
+    results = []
+    for start in range(0, samples, batch):
+        results.extend(evaluate_many(candidates[start:start + batch], real, replicates, seed, processes, engine))
+        if callback is not None:
+            callback(len(results), samples)
+
+    rows = [{"R0": r0, **rates, "Loss": loss} for (r0, rates), (loss, _) in zip(candidates, results)]
+    samples_table = pd.DataFrame(rows)
+    accepted = max(1, int(round(samples * accept_fraction)))
+    order = samples_table["Loss"].to_numpy().argsort()[:accepted]
+    posterior = samples_table.iloc[order].reset_index(drop=True)
+
+    summary = pd.DataFrame({
+        "Parameter": ["R0", *fit_rates],
+        "Median": [posterior[name].median() for name in ["R0", *fit_rates]],
+        "Low (5%)": [posterior[name].quantile(0.05) for name in ["R0", *fit_rates]],
+        "High (95%)": [posterior[name].quantile(0.95) for name in ["R0", *fit_rates]],
+    })
+    return {
+        "posterior": posterior,
+        "summary": summary,
+        "best": posterior.iloc[0].to_dict(),
+        "table": results[order[0]][1],
+    }
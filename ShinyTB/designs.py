@@ -0,0 +1,5 @@
+"""敏感性分析抽样方案的名称与显示标签。
+
+单独成模块，使报告与界面只需标签时不必导入 sensitivity（及其依赖的 sim、sweep、多进程与 Sobol 方向数表）。
+"""
+DESIGNS = {"sobol": "Sobol sequence", "lhs": "Latin hypercube"}
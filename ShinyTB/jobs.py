@@ -0,0 +1,131 @@
+"""后台作业：模拟与校准在进程级线程池中运行，不阻塞 Shiny 事件循环。
+
+每个作业带有进度与取消标志；计算函数通过 callback 报告进度，
+取消后在下一次 callback 时抛出 SimulationCancelled，工作线程随即停止。
+流式计算还可通过 publish 推送部分结果，由 run_job 在事件循环中定期转交给界面。
+"""
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from startup import timed_import
+
+# 进程级工作线程池，所有会话共享
+executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 2, thread_name_prefix="simulation")
+
+
+class Job:
+    def __init__(self, name):
+        self.name = name
+        self.progress = 0.0
+        self._cancelled = threading.Event()
+        self._chunks = []
+        self._chunks_lock = threading.Lock()
+        # 计时（time.perf_counter）：开始、首个部分结果、结束
+        self.started = time.perf_counter()
+        self.first_chunk_at = None
+        self.finished_at = None
+
+    def report(self, done, total):
+        """作为计算函数的 callback：更新进度，已取消时抛出 SimulationCancelled"""
+        if self._cancelled.is_set():
+            raise timed_import("sim").SimulationCancelled(self.name)
+        self.progress = done / total if total else 0.0
+
+    def publish(self, chunk):
+        """由工作线程调用，推送一份部分结果"""
+        with self._chunks_lock:
+            if self.first_chunk_at is None:
+                self.first_chunk_at = time.perf_counter()
+            self._chunks.append(chunk)
+
+    def take_chunks(self):
+        """取出自上次调用以来推送的全部部分结果"""
+        with self._chunks_lock:
+            chunks, self._chunks = self._chunks, []
+        return chunks
+
+    def timings(self):
+        """返回 (首个部分结果耗时, 总耗时)，单位为秒；尚未发生的为 None"""
+        first = None if self.first_chunk_at is None else self.first_chunk_at - self.started
+        total = None if self.finished_at is None else self.finished_at - self.started
+        return first, total
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+
+class SessionJobs:
+    """会话内的作业登记：限制同时运行的作业数量，并在取消或会话结束时通知工作线程停止"""
+
+    def __init__(self, max_jobs=1):
+        self.max_jobs = max_jobs
+        self._jobs = {}
+
+    def start(self, name):
+        """登记一个新作业；已达到并发上限时返回 None"""
+        if len(self._jobs) >= self.max_jobs:
+            return None
+        job = Job(name)
+        self._jobs[name] = job
+        return job
+
+    def finish(self, job):
+        """注销作业（在 run_job 返回后调用，此时工作线程已不再运行该作业）"""
+        if self._jobs.get(job.name) is job:
+            del self._jobs[job.name]
+
+    def cancel(self, name):
+        """通知作业停止；作业仍占用并发名额，直到工作线程返回、调用方调用 finish"""
+        job = self._jobs.get(name)
+        if job is not None:
+            job.cancel()
+
+    def cancel_all(self):
+        for job in list(self._jobs.values()):
+            job.cancel()
+
+    def __len__(self):
+        return len(self._jobs)
+
+
+async def run_job(job, func, *args, message="Running...", on_partial=None, **kwargs):
+    """在线程池中运行 func(*args, callback=job.report, **kwargs)，等待期间更新 Shiny 进度条。
+
+    给出 on_partial 时，func 另获得 on_chunk=job.publish 参数；等待期间每次轮询都将新推送的
+    部分结果列表交给 await on_partial(chunks)（在事件循环中运行，可更新响应式值）。
+    协程被取消（如 ExtendedTask.cancel()）时通知工作线程停止，并等待其返回后才结束。
+    """
+    from shiny import ui
+
+    if on_partial is not None:
+        kwargs["on_chunk"] = job.publish
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(executor, functools.partial(func, *args, callback=job.report, **kwargs))
+    # 取消后工作线程抛出的 SimulationCancelled 无需再处理
+    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+    try:
+        with ui.Progress(min=0, max=1) as progress:
+            progress.set(0, message=message)
+            while True:
+                done, _ = await asyncio.wait({future}, timeout=0.25)
+                if done:
+                    job.finished_at = time.perf_counter()
+                    return future.result()
+                if on_partial is not None:
+                    chunks = job.take_chunks()
+                    if chunks:
+                        await on_partial(chunks)
+                progress.set(job.progress, message=message, detail=f"{job.progress:.0%}")
+    finally:
+        if not future.done():
+            job.cancel()
+            # 等待工作线程在下一次 callback 时察觉取消并返回，调用方随后才调用 finish 释放并发名额
+            await asyncio.wait({future})
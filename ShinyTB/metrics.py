@@ -0,0 +1,163 @@
+"""应用内的计时与运行指标。
+
+- span(name, **labels)：计时上下文，记录到按名称与标签分组的直方图，并保留最近的 span 记录（含父 span）
+- timed(name)：同上的装饰器，支持普通函数、协程函数与异步生成器（如 render.download）
+- register_gauge(...)：注册在抓取时才读取的指标（如缓存条目数、活动会话数）
+- render_prometheus()：Prometheus 文本格式；metrics_app 为提供 /metrics 与 /metrics/spans 的 ASGI 应用
+- profile_call(func, ...)：在 cProfile 下运行函数，返回 (结果, 耗时最多的函数列表文本)
+"""
+import contextvars
+import cProfile
+import functools
+import inspect
+import io
+import json
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# 直方图桶上限（秒）
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+RECENT_SPANS = 200
+PROFILE_LINES = 25
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Metrics:
+    def __init__(self, buckets=BUCKETS, recent=RECENT_SPANS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._histograms = {}  # (span, 排序后的标签) -> [各桶计数, 总和, 次数]
+        self._gauges = {}      # 名称 -> (类型, 说明, 取值函数)
+        self.recent = deque(maxlen=recent)
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            counts, total, count = self._histograms.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for k, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts[k] += 1
+            self._histograms[key] = [counts, total + seconds, count + 1]
+
+    @contextmanager
+    def span(self, name, **labels):
+        """计时一个代码块；异常同样记录耗时，并以 error 标记在最近的 span 记录中"""
+        record = {"span": name, "labels": labels, "parent": _current_span.get(),
+                  "thread": threading.current_thread().name, "start": time.time()}
+        token = _current_span.set(name)
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record["error"] = type(e).__name__
+            raise
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # 异步生成器可能在另一个上下文中结束
+                pass
+            self.observe(name, record["seconds"], **labels)
+            self.recent.append(record)
+
+    def timed(self, name=None, **labels):
+        """装饰器：以 span 计时每次调用（默认以函数名为 span 名）"""
+        def decorate(func):
+            span_name = name or func.__name__
+            if inspect.isasyncgenfunction(func):
+                @functools.wraps(func)
+                async def wrapper(*args, **kwargs):
+                    with self.span(span_name, **labels):
+                        async for item in func(*args, **kwargs):
+                            yield item
+            elif inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def wrapper(*args, **kwargs):
+                    with self.span(span_name, **labels):
+                        return await func(*args, **kwargs)
+            else:
+                @functools.wraps(func)
+                def wrapper(*args, **kwargs):
+                    with self.span(span_name, **labels):
+                        return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def register_gauge(self, name, help, func, kind="gauge"):
+        """注册抓取时读取的指标：func() 返回数值，kind 为 gauge 或 counter"""
+        self._gauges[name] = (kind, help, func)
+
+    def snapshot(self):
+        """返回各 span 的次数与总耗时 {(span, 标签): (次数, 总秒数)}"""
+        with self._lock:
+            return {key: (count, total) for key, (_, total, count) in self._histograms.items()}
+
+    def render_prometheus(self):
+        lines = ["# HELP shinytb_span_seconds Duration of instrumented hot paths.",
+                 "# TYPE shinytb_span_seconds histogram"]
+        with self._lock:
+            histograms = sorted((key, (list(counts), total, count))
+                                for key, (counts, total, count) in self._histograms.items())
+        for (name, labels), (counts, total, count) in histograms:
+            base = [("span", name), *labels]
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"shinytb_span_seconds_bucket{_labels(base + [('le', repr(float(bound)))])} {bucket_count}")
+            lines.append(f"shinytb_span_seconds_bucket{_labels(base + [('le', '+Inf')])} {count}")
+            lines.append(f"shinytb_span_seconds_sum{_labels(base)} {total!r}")
+            lines.append(f"shinytb_span_seconds_count{_labels(base)} {count}")
+        for name, (kind, help, func) in sorted(self._gauges.items()):
+            try:
+                value = float(func())
+            except Exception as e:
+                print(f"Metric {name} failed: {e}", flush=True)
+                continue
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {value!r}"]
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs):
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def profile_call(func, *args, **kwargs):
+    """在 cProfile 下运行 func（只分析当前线程），返回 (结果, 按累计耗时排序的前 PROFILE_LINES 个函数)"""
+    profiler = cProfile.Profile()
+    result = profiler.runcall(func, *args, **kwargs)
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).strip_dirs().sort_stats("cumulative").print_stats(PROFILE_LINES)
+    return result, stream.getvalue()
+
+
+# 应用级共享的指标
+metrics = Metrics()
+
+
+async def metrics_app(scope, receive, send):
+    """ASGI 应用：/metrics 为 Prometheus 文本，/metrics/spans 为最近 span 记录的 JSON"""
+    if scope["path"].rstrip("/").endswith("/spans"):
+        body = json.dumps(list(metrics.recent), default=str).encode()
+        content_type = b"application/json"
+    else:
+        body = metrics.render_prometheus().encode()
+        content_type = b"text/plain; version=0.0.4; charset=utf-8"
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def with_metrics(app, path="/metrics"):
+    """在 app 旁挂载指标端点：path 及其子路径由 metrics_app 处理，其余请求（含 lifespan）交给 app"""
+    async def dispatch(scope, receive, send):
+        if scope["type"] == "http" and (scope["path"] == path or scope["path"].startswith(path + "/")):
+            return await metrics_app(scope, receive, send)
+        return await app(scope, receive, send)
+    return dispatch
@@ -0,0 +1,86 @@
+"""自适应步长常微分方程求解器（Dormand–Prince 5(4) 显式 Runge–Kutta，纯 NumPy 实现）。
+
+每步以 5 阶解推进、以内嵌的 4 阶解估计局部误差并据此调整步长；
+输出点落在步内时用 Dormand–Prince 的 4 阶连续扩展（Shampine, 1986）插值，因此可在任意时间网格上输出而不限制步长。
+"""
+import numpy as np
+
+# Dormand–Prince 系数表
+_C = np.array([0, 1 / 5, 3 / 10, 4 / 5, 8 / 9, 1, 1])
+_A = [
+    [],
+    [1 / 5],
+    [3 / 40, 9 / 40],
+    [44 / 45, -56 / 15, 32 / 9],
+    [19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729],
+    [9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656],
+    [35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84],
+]
+# 5 阶权重（即最后一行 _A，第 7 个阶段与下一步的第 1 个阶段相同）与 5 阶、4 阶解之差
+_B = np.array([35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84, 0])
+_E = np.array([71 / 57600, 0, -71 / 16695, 71 / 1920, -17253 / 339200, 22 / 525, -1 / 40])
+# 连续扩展：步内 y(t + theta*h) = y + h * (K.T @ _P) @ [theta, theta^2, theta^3, theta^4]
+_P = np.array([
+    [1, -8048581381 / 2820520608, 8663915743 / 2820520608, -12715105075 / 11282082432],
+    [0, 0, 0, 0],
+    [0, 131558114200 / 32700410799, -68118460800 / 10900136933, 87487479700 / 32700410799],
+    [0, -1754552775 / 470086768, 14199869525 / 1410260304, -10690763975 / 1880347072],
+    [0, 127303824393 / 49829197408, -318862633887 / 49829197408, 701980252875 / 199316789632],
+    [0, -282668133 / 205662961, 2019193451 / 616988883, -1453857185 / 822651844],
+    [0, 40617522 / 29380423, -110615467 / 29380423, 69997945 / 29380423],
+])
+
+
+def dormand_prince(fun, t_span, y0, t_eval, rtol=1e-6, atol=1e-9, max_step=np.inf, max_steps=100_000):
+    """求解 dy/dt = fun(t, y)，返回 (t_eval 各时刻的解，形状为 时刻数 × 变量数；统计字典)。
+
+    - t_span: (t0, t_end)；t_eval: t_span 内的升序输出时刻
+    - rtol、atol: 局部误差的相对与绝对容差
+    统计字典包含 steps（接受的步数）、rejected（拒绝的步数）与 evaluations（fun 调用次数）。
+    """
+    t0, t_end = map(float, t_span)
+    t_eval = np.asarray(t_eval, dtype=float)
+    if t_eval.size and (t_eval[0] < t0 or t_eval[-1] > t_end or np.any(np.diff(t_eval) < 0)):
+        raise ValueError("t_eval must be ascending and within t_span")
+    y = np.asarray(y0, dtype=float)
+    out = np.empty((len(t_eval), len(y)))
+    stats = {"steps": 0, "rejected": 0, "evaluations": 1}
+
+    t = t0
+    f = fun(t, y)
+    n_out = np.searchsorted(t_eval, t0, side="right")
+    out[:n_out] = y
+    # 初始步长：按解与导数的量级估计（Hairer 等的简化做法）
+    scale = atol + rtol * np.abs(y)
+    d0, d1 = np.sqrt(np.mean((y / scale) ** 2)), np.sqrt(np.mean((f / scale) ** 2))
+    h = 1e-6 if d0 < 1e-5 or d1 < 1e-5 else 0.01 * d0 / d1
+    h = min(h, max_step, t_end - t0)
+
+    k = np.empty((7, len(y)))
+    while t < t_end:
+        if stats["steps"] + stats["rejected"] >= max_steps:
+            raise RuntimeError(f"ODE solver exceeded {max_steps} steps")
+        h = min(h, t_end - t)
+        k[0] = f
+        for stage in range(1, 7):
+            k[stage] = fun(t + _C[stage] * h, y + h * (np.dot(_A[stage], k[:stage])))
+        stats["evaluations"] += 6
+        y_new = y + h * (_B @ k)
+        # 以 RMS 范数衡量缩放后的局部误差
+        scale = atol + rtol * np.maximum(np.abs(y), np.abs(y_new))
+        error = np.sqrt(np.mean((h * (_E @ k) / scale) ** 2))
+        if error <= 1:
+            t_new = t_end if h == t_end - t else t + h
+            n_new = np.searchsorted(t_eval, t_new, side="right")
+            if n_new > n_out:
+                theta = ((t_eval[n_out:n_new] - t) / h)[:, None]
+                out[n_out:n_new] = y + h * (theta ** np.arange(1, 5)) @ (k.T @ _P).T
+            n_out = n_new
+            t, y, f = t_new, y_new, k[6].copy()
+            stats["steps"] += 1
+        else:
+            stats["rejected"] += 1
+        # 步长调整：安全系数 0.9，每步最多放大 10 倍、缩小到 1/5
+        factor = 10.0 if error == 0 else min(10.0, max(0.2, 0.9 * error ** -0.2))
+        h = min(h * factor, max_step)
+    return out, stats
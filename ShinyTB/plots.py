@@ -0,0 +1,154 @@
+import os
+import sys
+import threading
+
+import pandas as pd
+
+from sim import STATES
+from startup import timed_import
+
+# 分组模型结果中的分组列
+GROUP_COLUMNS = ["Region", "Age group"]
+
+
+def pyplot():
+    """首次绘图时才导入 matplotlib.pyplot（应用启动时不必付出其导入耗时）；
+    尚未由调用方选择后端时使用无界面的 Agg 后端"""
+    if "matplotlib.pyplot" not in sys.modules:
+        import matplotlib
+        if "MPLBACKEND" not in os.environ:
+            matplotlib.use("Agg")
+    return timed_import("matplotlib.pyplot")
+
+
+# pyplot 以进程级的图形管理器记录所有图形，不是线程安全的：界面在事件循环中绘图，native PDF 报告在工作线程中绘图，
+# 因此创建与关闭图形时持有此锁；在各自的图形上绘制与保存不需要加锁
+_pyplot_lock = threading.Lock()
+
+
+def subplots(*args, **kwargs):
+    """pyplot().subplots，持有 pyplot 锁"""
+    with _pyplot_lock:
+        return pyplot().subplots(*args, **kwargs)
+
+
+def figure(**kwargs):
+    """pyplot().figure，持有 pyplot 锁"""
+    with _pyplot_lock:
+        return pyplot().figure(**kwargs)
+
+
+def close_figure(fig):
+    """pyplot().close(fig)，持有 pyplot 锁"""
+    with _pyplot_lock:
+        pyplot().close(fig)
+
+
+def group_column(data):
+    """返回数据中的分组列名，非分组结果返回 None"""
+    return next((column for column in GROUP_COLUMNS if column in data.columns), None)
+
+
+def plot_simulation(data):
+    """根据模拟数据绘制堆叠区域图展示状态动态（仅在需要展示时调用）；分组结果按天汇总所有组"""
+    if group_column(data) is not None:
+        data = data.groupby("Days", as_index=False)[STATES].sum()
+    fig, ax = subplots()
+    ax.stackplot(
+            data["Days"],
+            *(data[state] for state in STATES),
+            labels=STATES)
+    ax.set_xlabel("Days")
+    ax.set_ylabel("Population")
+    ax.legend(loc="upper left")
+    ax.set_title("TB Transmission Simulation")
+    return fig
+
+
+def plot_placeholder(message):
+    """无数据时显示的提示图"""
+    fig, ax = subplots()
+    ax.axis('off')
+    ax.text(0.5, 0.5, message,
+            ha="center", va="center", fontsize=15)
+    return fig
+
+
+def plot_calibration(table, real):
+    """校准结果：拟合后的逐年模拟值与真实数据对比（四个状态各一幅子图）"""
+    fig, axes = subplots(2, 2, figsize=(10, 7))
+    for ax, state in zip(axes.flat, ["Infection", "Clinical", "Recovered", "Death"]):
+        ax.plot(real["Year"], real[state], "o-", label="Real")
+        ax.plot(table["Year"], table[state], "s--", label="Simulated")
+        ax.set_title(state)
+        ax.set_xlabel("Year")
+    axes[0, 0].legend(loc="upper left")
+    fig.suptitle("Calibrated Simulation vs. Real Data")
+    fig.tight_layout()
+    return fig
+
+
+def plot_group_heatmap(data, state="Clinical"):
+    """分组结果：各组某一状态每 10 万人的人数随时间变化的热图（行是组，列是记录天）"""
+    group = group_column(data)
+    names = data[group].drop_duplicates()
+    totals = data[STATES].sum(axis=1)
+    rate = (data[state] / totals * 1e5).rename("rate")
+    table = (pd.concat([data[[group, "Days"]], rate], axis=1)
+             .pivot(index=group, columns="Days", values="rate").loc[names])
+    fig, ax = subplots(figsize=(8, min(2 + 0.25 * len(names), 12)))
+    days = table.columns.to_numpy()
+    image = ax.imshow(table.to_numpy(), aspect="auto", interpolation="nearest", cmap="viridis",
+                      extent=(days[0], days[-1], len(names) - 0.5, -0.5))
+    if len(names) <= 40:
+        ax.set_yticks(range(len(names)), labels=names)
+    ax.set_xlabel("Days")
+    ax.set_ylabel(group)
+    fig.colorbar(image, ax=ax, label=f"{state} per 100,000")
+    ax.set_title(f"{state} by {group.lower()}")
+    fig.tight_layout()
+    return fig
+
+
+def plot_sensitivity(indices):
+    """敏感性分析：每个结局一幅子图，各参数的一阶与总效应 Sobol 指数（误差线为自助法置信区间）"""
+    outcomes = list(dict.fromkeys(indices["Outcome"]))
+    columns = min(2, len(outcomes))
+    rows = -(-len(outcomes) // columns)
+    fig, axes = subplots(rows, columns, figsize=(5 * columns, 3.5 * rows), squeeze=False)
+    for ax, outcome in zip(axes.flat, outcomes):
+        table = indices[indices["Outcome"] == outcome]
+        positions = range(len(table))
+        for offset, (name, label) in zip((-0.2, 0.2), (("First-order", "First-order"), ("Total", "Total effect"))):
+            values = table[name].to_numpy()
+            errors = [(values - table[f"{name} low"]).clip(lower=0), (table[f"{name} high"] - values).clip(lower=0)]
+            ax.bar([p + offset for p in positions], values, width=0.4, yerr=errors, capsize=3, label=label)
+        ax.set_xticks(list(positions), labels=table["Parameter"])
+        ax.axhline(0, color="grey", linewidth=0.8)
+        ax.set_title(outcome)
+        if table["Total"].isna().all():
+            ax.text(0.5, 0.5, "Outcome does not vary", ha="center", va="center", transform=ax.transAxes)
+    for ax in axes.flat[len(outcomes):]:
+        ax.axis("off")
+    axes[0, 0].legend(loc="upper left")
+    fig.suptitle("Sobol Sensitivity Indices")
+    fig.tight_layout()
+    return fig
+
+
+def plot_fan_chart(bands):
+    """集合模拟的不确定性扇形图：每个状态一幅子图，中位数及 50%（25%–75%）与 90%（5%–95%）区间"""
+    fig, axes = subplots(2, 3, figsize=(12, 6.5), sharex=True)
+    for ax, state in zip(axes.flat, STATES):
+        table = bands[bands["State"] == state]
+        ax.fill_between(table["Days"], table["5%"], table["95%"], alpha=0.25, color="tab:blue", linewidth=0, label="90% interval")
+        ax.fill_between(table["Days"], table["25%"], table["75%"], alpha=0.45, color="tab:blue", linewidth=0, label="50% interval")
+        ax.plot(table["Days"], table["Median"], color="tab:blue", label="Median")
+        ax.set_title(state)
+        ax.set_xlabel("Days")
+    axes.flat[-1].axis("off")
+    handles, labels = axes.flat[0].get_legend_handles_labels()
+    axes.flat[-1].legend(handles, labels, loc="center")
+    fig.suptitle("TB Transmission Simulation: ensemble median and intervals")
+    fig.tight_layout()
+    return fig
@@ -0,0 +1,193 @@
+"""集合模拟的不确定性区间：以可合并、内存有界的分位数草图流式估计每个记录日各状态的中位数与 50%/90% 区间。
+
+QuantileSketch 与 DDSketch 相同，以对数宽度的桶计数：值 v ≥ 1 落入第 floor(log_γ v) 个桶，γ = (1 + α) / (1 - α)，
+桶的代表值与桶内任一值的相对误差不超过 α；v < 1 的值计入零桶（代表值 0）。
+状态人数有上限（总人口 N），接近上限的值（如易感者）同时以 N - v 计入另一组桶，分位数接近上限时由后者估计，
+因此误差相对于 min(v, N - v) 而不是 v。
+所有记录日与状态的桶计数保存在稠密数组中（记录条数 × 状态数 × 桶数），内存与轨迹数无关，且不超过 max_bytes：
+记录条数很多（如 20 年的逐日记录）时桶宽在创建时放大，精度 α 随之降低（见 relative_accuracy）。
+观测数不超过桶数时只保存原始值（占用的内存不超过桶计数），分位数精确；超过后才转换为桶计数。
+两个草图的计数相加即为合并，因此可以分块（或在多个进程中）逐批加入轨迹后再合并。
+"""
+import numpy as np
+import pandas as pd
+
+from sim import STATES, replicate_seeds, run_ensemble
+
+BAND_QUANTILES = {"5%": 0.05, "25%": 0.25, "Median": 0.5, "75%": 0.75, "95%": 0.95}
+DEFAULT_ACCURACY = 0.01
+# 一个草图的桶计数（两组）占用的内存上限
+MAX_SKETCH_BYTES = 64 * 1024 * 1024
+# 每次计入桶计数的元素数（观测数 × 位置数），限制计算桶序号时的临时数组
+BUCKET_CHUNK = 1 << 20
+# 流式集合模拟每次运行的轨迹数
+BLOCK_REPLICATES = 256
+
+
+class QuantileSketch:
+    def __init__(self, shape, max_value, relative_accuracy=DEFAULT_ACCURACY, max_bytes=MAX_SKETCH_BYTES):
+        self.shape = tuple(shape)
+        self.size = int(np.prod(self.shape))
+        self.max_value = float(max_value)
+        # 零桶 + 覆盖 [1, max_value] 的对数桶；桶数超过内存上限允许的数量时放大桶宽
+        log_max = np.log(max(self.max_value, 1.0))
+        limit = max(3, max_bytes // (2 * self.size * np.dtype(np.int32).itemsize))
+        gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        if np.floor(log_max / np.log(gamma)) + 2 > limit:
+            gamma = np.exp(log_max / (limit - 2))
+            relative_accuracy = (gamma - 1) / (gamma + 1)
+        self.relative_accuracy = relative_accuracy
+        self.gamma = gamma
+        self._log_gamma = np.log(self.gamma)
+        self.buckets = int(np.floor(log_max / self._log_gamma)) + 2
+        # 观测数不超过桶数时的原始值（各批 观测数 × size 数组）；转换为桶计数后为 None
+        self._values = []
+        # 各位置 v 与 max_value - v 的桶计数（保存原始值期间为 None）
+        self.counts = None
+        self.complement = None
+        # 各位置的最小与最大值（估计值限制在其间，全部观测相同时结果精确）
+        self.minimum = np.full(self.size, np.inf)
+        self.maximum = np.full(self.size, -np.inf)
+        self.count = 0
+
+    @property
+    def nbytes(self):
+        stored = sum(values.nbytes for values in self._values) if self.counts is None else (
+            self.counts.nbytes + self.complement.nbytes)
+        return stored + self.minimum.nbytes + self.maximum.nbytes
+
+    def _bucket_counts(self, values):
+        with np.errstate(divide="ignore"):
+            index = np.floor(np.log(values) / self._log_gamma) + 1
+        index = np.where(values < 1, 0, np.clip(index, 1, self.buckets - 1)).astype(np.int64)
+        positions = values.shape[1]
+        flat = index + np.arange(positions) * self.buckets
+        return np.bincount(flat.ravel(), minlength=positions * self.buckets).reshape(positions, self.buckets)
+
+    def _value_at(self, counts, rank):
+        index = (np.cumsum(counts, axis=1) > rank).argmax(axis=1)
+        return np.where(index == 0, 0.0, self.gamma ** (index - 1) * 2 * self.gamma / (self.gamma + 1))
+
+    def _to_buckets(self):
+        """将保存的原始值转换为桶计数"""
+        if self.counts is not None:
+            return
+        self.counts = np.zeros((self.size, self.buckets), dtype=np.int32)
+        self.complement = np.zeros_like(self.counts)
+        values, self._values = self._values, None
+        for batch in values:
+            self._add_buckets(batch)
+
+    def _add_buckets(self, values):
+        step = max(1, BUCKET_CHUNK // max(len(values), 1))
+        for start in range(0, self.size, step):
+            part = values[:, start:start + step]
+            self.counts[start:start + step] += self._bucket_counts(part)
+            self.complement[start:start + step] += self._bucket_counts(np.maximum(self.max_value - part, 0))
+
+    def _extend(self, batches):
+        """加入若干批观测（最小与最大值由调用方更新）"""
+        self.count += sum(len(batch) for batch in batches)
+        if self.counts is None and self.count <= self.buckets:
+            self._values.extend(batch.copy() for batch in batches)
+            return
+        self._to_buckets()
+        for batch in batches:
+            self._add_buckets(batch)
+
+    def add(self, values):
+        """加入一批观测，values 的形状为 (观测数, *shape)；超过 max_value 的值计入最后一个桶"""
+        values = np.asarray(values, dtype=float).reshape(-1, self.size)
+        np.minimum(self.minimum, values.min(axis=0, initial=np.inf), out=self.minimum)
+        np.maximum(self.maximum, values.max(axis=0, initial=-np.inf), out=self.maximum)
+        self._extend([values])
+
+    def merge(self, other):
+        """合并另一个以相同参数创建的草图（如另一个进程中的一批轨迹）"""
+        if (other.shape, other.buckets, other.relative_accuracy) != (self.shape, self.buckets, self.relative_accuracy):
+            raise ValueError("Cannot merge sketches with different shapes or accuracy")
+        np.minimum(self.minimum, other.minimum, out=self.minimum)
+        np.maximum(self.maximum, other.maximum, out=self.maximum)
+        if other.counts is None:
+            self._extend(other._values)
+            return self
+        self._to_buckets()
+        self.counts += other.counts
+        self.complement += other.complement
+        self.count += other.count
+        return self
+
+    def quantile(self, q):
+        """返回形状为 shape 的 q 分位数估计：第 floor(q (n - 1)) 个次序统计量，
+        误差不超过 α · min(v, max_value - v)（仍保存原始值时为精确值）"""
+        if self.count == 0:
+            raise ValueError("Sketch is empty")
+        if self.counts is None:
+            return np.quantile(np.concatenate(self._values), q, axis=0, method="lower").reshape(self.shape)
+        rank = np.floor(q * (self.count - 1))
+        values = self._value_at(self.counts, rank)
+        # 同一次序统计量在 max_value - v 中的位置是 n - 1 - rank
+        near_max = self.max_value - self._value_at(self.complement, self.count - 1 - rank)
+        values = np.where(values > self.max_value / 2, near_max, values)
+        return np.clip(values, self.minimum, self.maximum).reshape(self.shape)
+
+def band_table(sketch, days, states=STATES):
+    """将草图（形状：记录条数 × 状态数）转换为长表：Days、State 及 BAND_QUANTILES 中的各分位数"""
+    table = pd.DataFrame({"Days": np.repeat(np.asarray(days), len(states)), "State": list(states) * len(days)})
+    for name, q in BAND_QUANTILES.items():
+        table[name] = sketch.quantile(q).ravel()
+    return table
+
+
+def trajectory_values(data, states=STATES):
+    """集合模拟长表（Replicate、Days、[分组列]、各状态）转换为 (轨迹 × 记录条数 × 状态数 数组, 记录天)，分组结果按天汇总所有组"""
+    totals = data.groupby(["Replicate", "Days"], sort=True)[list(states)].sum()
+    days = totals.index.get_level_values("Days").unique().to_numpy()
+    return totals.to_numpy(dtype=float).reshape(-1, len(days), len(states)), days
+
+
+def trajectory_bands(data, max_value=None, relative_accuracy=DEFAULT_ACCURACY):
+    """由已在内存中的全部轨迹计算不确定性区间表（max_value 缺省为首条记录各状态之和，即总人口）"""
+    values, days = trajectory_values(data)
+    sketch = QuantileSketch((len(days), len(STATES)), max_value or values[0, 0].sum(), relative_accuracy)
+    sketch.add(values)
+    return band_table(sketch, days)
+
+
+def run_ensemble_bands(population, init_infected, init_clinical, init_recovered, init_death, basic_repro, sim_days,
+                       replicates, seed=None, aggregation=None, rate_distributions=None, block=BLOCK_REPLICATES,
+                       relative_accuracy=DEFAULT_ACCURACY, callback=None):
+    """流式集合模拟：每次以 block 条轨迹运行 run_ensemble（第 k 条轨迹的种子与整体运行相同），
+    逐块加入分位数草图并累加均值后丢弃轨迹，内存不随轨迹数增长。
+
+    返回 (data, params, bands)：data 为各记录日的轨迹均值，params 为参数均值（另含 Replicates 与
+    Extinction probability，同 ShinyTB.summarize_replicates），bands 为 band_table 的不确定性区间表。
+    运行期间调用 callback(已完成的轨迹数（可为小数）, replicates)，可抛出 SimulationCancelled 中止模拟。
+    """
+    seeds = replicate_seeds(seed, replicates)
+    sketch = sums = days = None
+    param_sums = {}
+    extinct = 0
+    for start in range(0, replicates, block):
+        chunk_seeds = seeds[start:start + block]
+        # 块内按模拟天数折算进度，使取消在块运行期间也能及时生效
+        report = None if callback is None else (
+            lambda day, total, start=start, size=len(chunk_seeds): callback(start + size * day / total, replicates))
+        data, params = run_ensemble(population, init_infected, init_clinical, init_recovered, init_death, basic_repro,
+                                    sim_days, replicates=len(chunk_seeds), seed=chunk_seeds, aggregation=aggregation,
+                                    rate_distributions=rate_distributions, callback=report)
+        values, days = trajectory_values(data)
+        if sketch is None:
+            sketch = QuantileSketch(values.shape[1:], population, relative_accuracy)
+            sums = np.zeros(values.shape[1:])
+        sketch.add(values)
+        sums += values.sum(axis=0)
+        extinct += int(((values[:, -1, STATES.index("Infected")] + values[:, -1, STATES.index("Clinical")]) == 0).sum())
+        for key, value in params.items():
+            param_sums[key] = param_sums.get(key, 0.0) + float(np.sum(value))
+    data = pd.DataFrame(sums / replicates, columns=STATES)
+    data.insert(0, "Days", days)
+    params = {key: value / replicates for key, value in param_sums.items()}
+    params["Replicates"] = replicates
+    params["Extinction probability"] = extinct / replicates
+    return data, params, band_table(sketch, days)
@@ -1,57 +1,407 @@
+import asyncio
+import hashlib
 import io
+import math
 import base64
+import textwrap
+import zipfile
 import numpy as np
+import pandas as pd
 from datetime import datetime
-from playwright.async_api import async_playwright  # 异步API
+from plots import (close_figure, figure, group_column, plot_fan_chart, plot_group_heatmap, plot_sensitivity,
+                   plot_simulation)
+from browser import browser_manager
+from designs import DESIGNS
+from cache import SimulationCache
+from metrics import metrics
+from startup import timed_import
 
-async def generate_pdf_report(simulation_data, browser_path):
-    print("Report Generating...", flush=True)
+# 报告图像与表格的进程级 LRU 缓存（键见 report_artifacts）。模拟结果在会话间共享且只读，
+# 因此编码后的图像不写入结果字典，而是单独缓存并计入这里的内存上限
+artifact_cache = SimulationCache(max_entries=256, max_bytes=64 * 1024 * 1024)
+
+# 报告图像格式：名称 -> (savefig 格式, MIME 类型)
+IMAGE_FORMATS = {
+    "png": ("png", "image/png"),
+    "png_compressed": ("png", "image/png"),
+    "svg": ("svg", "image/svg+xml"),
+}
+
+# PDF 导出方式：native 直接以 matplotlib 生成矢量 PDF（不需要浏览器）；chromium 以 Playwright 打印 HTML 报告（与预览外观相同）
+PDF_BACKENDS = {
+    "native": "Native (vector, no browser)",
+    "chromium": "Chromium (same layout as preview)",
+}
+# native PDF 的页面尺寸（英寸）：图为 A4 横向，文字与表格为 A4 纵向
+A4_PORTRAIT = (8.27, 11.69)
+A4_LANDSCAPE = (11.69, 8.27)
+# 表格每行的高度（英寸）
+TABLE_ROW_HEIGHT = 0.24
+# 报告（HTML 预览、Chromium 与 native PDF）中模拟数据表的行数上限（native PDF 约 10 页）：更长的结果（如 10 年的逐日数据）按记录日等间隔抽取，并保留最后一天
+MAX_TABLE_ROWS = 400
+
+async def generate_pdf_report(simulation_data, browser_path=None, image_format="png", dpi=100, sensitivity=None,
+                              backend="native"):
+    """生成 PDF 报告：backend 为 native 时直接生成矢量 PDF（忽略 browser_path 与图像格式），
+    为 chromium 时由浏览器打印 HTML 报告"""
+    if backend not in PDF_BACKENDS:
+        raise ValueError(f"Unknown PDF backend: {backend}")
+    print(f"Report Generating ({backend})...", flush=True)
+    if backend == "native":
+        # 在工作线程中绘制，不阻塞事件循环
+        with metrics.span("pdf_native"):
+            return await asyncio.to_thread(generate_native_pdf, simulation_data, sensitivity=sensitivity)
     
-    # 生成HTML内容
-    html_content = generate_html_template(simulation_data)
+    # 生成HTML内容（与预览共享已缓存的图像与表格）
+    with metrics.span("pdf_html"):
+        html_content = generate_html_template(simulation_data, image_format=image_format, dpi=dpi, sensitivity=sensitivity)
     
-    async with async_playwright() as p:
-        # 创建浏览器启动配置
-        launch_options = {}
+    # 复用应用级共享的 Chromium，仅在首次导出或浏览器崩溃后启动
+    browser_path = (browser_path or "").strip() or None
+    try:
+        with metrics.span("pdf_chromium", browser="custom" if browser_path else "bundled"):
+            pdf_bytes = await browser_manager.render_pdf(html_content, executable_path=browser_path)
+    except Exception as e:
+        # 当自定义路径失败时尝试使用默认浏览器
         if browser_path:
-            # 使用关键字参数传递路径
-            launch_options["executable_path"] = browser_path.replace("\\", "/")
-        browser = await p.chromium.launch(**launch_options)
-        
-        try:
-            # 自动安装缺失的浏览器组件
-            browser = await p.chromium.launch(**launch_options)
-        except Exception as e:
-            # 当自定义路径失败时尝试使用默认浏览器
-            if browser_path:
-                print(f"使用自定义浏览器失败，正在尝试默认浏览器: {str(e)}", flush=True)
-                browser = await p.chromium.launch()
-            else:
-                raise
-
-        page = await browser.new_page()
-        await page.set_content(html_content)
-        pdf_bytes = await page.pdf(format="A4")
-        await browser.close()
+            print(f"使用自定义浏览器失败，正在尝试默认浏览器: {str(e)}", flush=True)
+            with metrics.span("pdf_chromium", browser="bundled"):
+                pdf_bytes = await browser_manager.render_pdf(html_content)
+        else:
+            raise
     
     return pdf_bytes
 
-def generate_html_template(simulation_data):
-    """生成报告HTML模板"""
-    # 转换图表为Base64
-    plot_base64 = fig_to_base64(simulation_data["fig"])
-    
-    # 生成数据表格
-    data_table = simulation_data["data"].to_html(
-        index=False,
-        classes="data-table",
-        float_format=lambda x: f"{x:.2f}"
-    )
+async def stream_report_zip(items, backend="native", browser_path=None, image_format="png", dpi=100, concurrency=None):
+    """批量导出：为多个场景生成 PDF 报告并以 ZIP 流式输出（异步生成器，逐段产出 ZIP 字节）。
+
+    items 为 (文件名, load) 序列，load() 在工作线程中运行并返回模拟结果字典（如 simulate_cached 或读取结果库）。
+    同时处理的场景不超过 concurrency 个（缺省为浏览器页面池大小；native 报告各在一个工作线程中绘制），
+    每份报告完成后立即写入 ZIP 并产出，内存中最多只有 concurrency 份 PDF；写入顺序为完成顺序。
+    重复的文件名依次加上 " (2)"、" (3)" 等后缀。失败的场景不中断导出，其错误写入 errors.txt。
+    """
+    concurrency = max(1, int(concurrency or browser_manager.max_pages))
+    sink = _ZipSink()
+    archive = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED)
+
+    async def render(name, load):
+        simulation_data = await asyncio.to_thread(load)
+        return await generate_pdf_report(simulation_data, browser_path, image_format=image_format, dpi=dpi,
+                                         backend=backend)
+
+    items = iter(items)
+    running = {}
+    errors = []
+    used = {"errors.txt"}
+    try:
+        while True:
+            for name, load in items:
+                name = _unique_name(name, used)
+                running[asyncio.ensure_future(render(name, load))] = name
+                if len(running) >= concurrency:
+                    break
+            if not running:
+                break
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = running.pop(task)
+                if task.exception() is not None:
+                    print(f"Batch report {name} failed: {task.exception()}", flush=True)
+                    errors.append(f"{name}: {type(task.exception()).__name__}: {task.exception()}")
+                    continue
+                archive.writestr(zipfile.ZipInfo(name, datetime.now().timetuple()[:6]), task.result())
+                yield sink.take()
+        if errors:
+            archive.writestr(zipfile.ZipInfo("errors.txt", datetime.now().timetuple()[:6]), "\n".join(errors) + "\n")
+        archive.close()
+        yield sink.take()
+    finally:
+        # 客户端断开或出错时取消仍在运行的场景
+        for task in running:
+            task.cancel()
+
+def _unique_name(name, used):
+    """返回不在 used 中的文件名（重复时在扩展名前加 " (2)"、" (3)" 等），并将其加入 used"""
+    stem, dot, extension = name.rpartition(".")
+    if not dot:
+        stem, extension = name, ""
+    candidate, number = name, 1
+    while candidate in used:
+        number += 1
+        candidate = f"{stem} ({number}){dot}{extension}"
+    used.add(candidate)
+    return candidate
+
+class _ZipSink:
+    """只追加的 ZIP 输出流（不可 seek，zipfile 因此在每个文件后写数据描述符），take() 取出已写入的字节"""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+def generate_native_pdf(simulation_data, sensitivity=None):
+    """不经过浏览器，以 matplotlib 的 PDF 后端生成与 HTML 报告内容相同的矢量 PDF：
+    首页为标题与参数表，随后是各图（每幅一页）与分页的数据表"""
+    backend_pdf = timed_import("matplotlib.backends.backend_pdf")
+    params = simulation_data["params"]
+    data = simulation_data["data"]
+    aggregation = params.get("Aggregation", "monthly (every 31 days)")
+    buf = io.BytesIO()
+    with backend_pdf.PdfPages(buf, metadata={"Title": "TB Transmission Simulation Report"}) as pdf:
+        def cover(fig, top):
+            fig.text(0.5, top, "TB Transmission Simulation Report", ha="center", va="top", fontsize=20, weight="bold",
+                     color="#2c3e50")
+            fig.text(0.5, top - 0.035, f"DATE:{datetime.now().strftime('%Y-%m-%d %H:%M')}", ha="center", va="top",
+                     fontsize=10, color="#7f8c8d")
+            _paragraph(fig, top - 0.075, "This report presents the simulation of TB transmission dynamics over the "
+                       "simulated period. The model uses randomly generated parameters based on estimates from TB "
+                       "transmission studies, which introduces realistic variability into the simulation.")
+            return top - 0.17
+
+        _table_pages(pdf, "Parameters", ["Parameters", "Value"],
+                     [[key, _format_value(value)] for key, value in params.items()], lead=cover)
+
+        _figure_page(pdf, plot_simulation(data), "Transmission Dynamics",
+                     "The stacked area chart displays the evolution of different states (Susceptible, Infected, "
+                     f"Clinical, Recovered, Death) over time. The results are aggregated {aggregation}.")
+        if "bands" in simulation_data:
+            _figure_page(pdf, plot_fan_chart(simulation_data["bands"]), "Ensemble Uncertainty",
+                         f"Across {params.get('Replicates', 'all')} replicate trajectories, the line shows the median "
+                         "of each state and the shaded bands the central 50% and 90% of trajectories on every recorded day.")
+        group = group_column(data)
+        if group is not None:
+            _figure_page(pdf, plot_group_heatmap(data), f"Results by {group}",
+                         f"Clinical cases per 100,000 people in each {group.lower()} over time.")
+            last = data[data["Days"] == data["Days"].max()].drop(columns="Days")
+            _table_pages(pdf, f"Results by {group} on the last simulated day", list(last.columns), _table_rows(last))
+        if sensitivity is not None:
+            parameters = ", ".join(sensitivity["bounds"]["Parameter"])
+            _figure_page(pdf, plot_sensitivity(sensitivity["indices"]), "Sensitivity Analysis",
+                         f"{parameters} were sampled over their ranges ({sensitivity['evaluations']} model runs, "
+                         f"{DESIGNS[sensitivity['design']].lower()} design, {sensitivity['engine']} engine). First-order "
+                         "indices give the share of outcome variance explained by each parameter alone; total-effect "
+                         "indices also include its interactions with the other parameters.")
+            columns = ["Outcome", "Parameter", "First-order", "Total"]
+            _table_pages(pdf, "Sensitivity Indices", columns,
+                         _table_rows(sensitivity["indices"][columns], float_format="{:.3f}"))
+        table, note = _sampled_days(data)
+        _table_pages(pdf, "Simulation Data", list(table.columns), _table_rows(table),
+                     lead=None if note is None else lambda fig, top: _paragraph(fig, top, note) or top - 0.05)
+    return buf.getvalue()
+
+def _sampled_days(data, max_rows=MAX_TABLE_ROWS):
+    """超过 max_rows 行的数据按记录日等间隔抽取（分组结果保留所抽记录日的全部组，并总保留最后一天），
+    返回 (数据, 说明)；未抽取时说明为 None"""
+    if len(data) <= max_rows:
+        return data, None
+    days = data["Days"].unique()
+    step = math.ceil(len(data) / max_rows)
+    kept = days[::step]
+    if kept[-1] != days[-1]:
+        kept = np.append(kept, days[-1])
+    note = (f"The simulation recorded {len(days)} days; one in every {step} recorded days is shown here "
+            f"({len(kept)} days, including the last).")
+    return data[data["Days"].isin(kept)], note
 
+def _paragraph(fig, top, text, width=100):
+    """在图页上从 top（图高的比例）处写一段自动换行的文字"""
+    fig.text(0.06, top, textwrap.fill(text, width), ha="left", va="top", fontsize=10, linespacing=1.5)
+
+def _figure_page(pdf, fig, title, caption):
+    """将绘图函数返回的图调整为 A4 横向一页，加上节标题与说明后写入 PDF 并关闭"""
+    fig.set_size_inches(*A4_LANDSCAPE)
+    fig.text(0.04, 0.97, title, ha="left", va="top", fontsize=16, weight="bold", color="#2c3e50")
+    fig.text(0.04, 0.07, textwrap.fill(caption, 150), ha="left", va="top", fontsize=10, linespacing=1.5)
+    suptitle = fig.get_suptitle()
+    if suptitle:
+        fig.suptitle(suptitle, y=0.91)
+    fig.tight_layout(rect=(0.03, 0.08, 0.97, 0.88 if suptitle else 0.92))
+    pdf.savefig(fig)
+    close_figure(fig)
+
+def _table_rows(frame, float_format="{:.2f}"):
+    """DataFrame 转换为表格单元文字（浮点数按 float_format，缺失值为 –，同 HTML 报告中的表格）"""
+    def cell(value):
+        if isinstance(value, (float, np.floating)):
+            return "–" if np.isnan(value) else float_format.format(value)
+        return str(value)
+    return [[cell(value) for value in row] for row in frame.itertuples(index=False)]
+
+def _table_pages(pdf, title, columns, rows, lead=None):
+    """将表格按 A4 纵向分页写入 PDF；lead(fig, top) 在第一页表格上方绘制内容并返回表格标题的位置"""
+    height = A4_PORTRAIT[1]
+    start = 0
+    while True:
+        fig = figure(figsize=A4_PORTRAIT)
+        top = lead(fig, 0.95) if lead is not None and start == 0 else 0.95
+        fig.text(0.06, top, title if start == 0 else f"{title} (continued)", ha="left", va="top", fontsize=16,
+                 weight="bold", color="#2c3e50")
+        top -= 0.04
+        # 表头占一行，其余可用高度（下边距 0.05）全部用于数据行
+        count = max(1, int((top - 0.05) * height / TABLE_ROW_HEIGHT) - 1)
+        page = rows[start:start + count]
+        table_height = (len(page) + 1) * TABLE_ROW_HEIGHT / height
+        ax = fig.add_axes((0.06, top - table_height, 0.88, table_height))
+        ax.axis("off")
+        table = ax.table(cellText=page or [[""] * len(columns)], colLabels=columns, cellLoc="center", loc="upper center",
+                         bbox=(0, 0, 1, 1))
+        table.auto_set_font_size(False)
+        table.set_fontsize(8 if len(columns) > 6 else 9)
+        for (row, _), cell in table.get_celld().items():
+            cell.set_edgecolor("#dddddd")
+            if row == 0:
+                cell.set_facecolor("#f8f9fa")
+                cell.set_text_props(weight="bold")
+        pdf.savefig(fig)
+        close_figure(fig)
+        start += count
+        if start >= len(rows):
+            break
+
+def result_digest(simulation_data):
+    """模拟结果内容的哈希（数据、参数与不确定性区间表），用作报告缓存的键"""
+    digest = hashlib.sha256()
+    for name in ("data", "bands"):
+        if name in simulation_data:
+            digest.update(name.encode())
+            digest.update(pd.util.hash_pandas_object(simulation_data[name], index=False).to_numpy().tobytes())
+            digest.update(repr(list(simulation_data[name].columns)).encode())
+    digest.update(repr(sorted((str(k), str(v)) for k, v in simulation_data["params"].items())).encode())
+    return digest.hexdigest()
+
+def _cached_artifact(key, build):
+    """从 artifact_cache 读取报告部件，未命中时生成并写入"""
+    value = artifact_cache.get(key)
+    if value is None:
+        value = build()
+        artifact_cache.put(key, value)
+    return value
+
+def _encoded_figure(plot, *args, image_format="png", dpi=100):
+    """绘图并编码为 Base64，编码后立即释放图形"""
+    fig = plot(*args)
+    encoded = fig_to_base64(fig, image_format=image_format, dpi=dpi)
+    close_figure(fig)
+    return encoded
+
+def report_artifacts(simulation_data, image_format="png", dpi=100):
+    """生成并缓存报告所需的编码图像、参数表与数据表。
+
+    部件按 (结果内容哈希, 部件名[, 图像格式, DPI]) 缓存在 artifact_cache 中，同一模拟结果的预览与 PDF 导出共用，
+    只有首次请求某种图像格式/DPI 时才绘图编码。simulation_data 可能是在会话间共享的缓存结果，不会被修改。
+    """
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"Unknown image format: {image_format}")
+    digest = result_digest(simulation_data)
+    data = simulation_data["data"]
+    # 根据数据绘图并转换为Base64
+    plot = _cached_artifact((digest, "plot", image_format, dpi), lambda: _encoded_figure(
+        plot_simulation, data, image_format=image_format, dpi=dpi))
+    # 生成数据表格（长期结果与 native PDF 相同，按记录日抽取）
+    def build_data_table():
+        table, note = _sampled_days(data)
+        html = table.to_html(index=False, classes="data-table", float_format=lambda x: f"{x:.2f}")
+        return html if note is None else f"<p>{note}</p>\n{html}"
+    data_table = _cached_artifact((digest, "data_table"), build_data_table)
+    group = group_column(data)
+    group_plot = group_table = fan_plot = None
+    if group is not None:
+        # 分组结果：各组的热图与最后一天的分组表
+        group_plot = _cached_artifact((digest, "group_plot", image_format, dpi), lambda: _encoded_figure(
+            plot_group_heatmap, data, image_format=image_format, dpi=dpi))
+        group_table = _cached_artifact((digest, "group_table"), lambda: data[data["Days"] == data["Days"].max()].drop(
+            columns="Days").to_html(
+            index=False,
+            classes="data-table",
+            float_format=lambda x: f"{x:.2f}"
+        ))
+    if "bands" in simulation_data:
+        # 多条轨迹：不确定性扇形图
+        fan_plot = _cached_artifact((digest, "fan_plot", image_format, dpi), lambda: _encoded_figure(
+            plot_fan_chart, simulation_data["bands"], image_format=image_format, dpi=dpi))
     param_rows = "".join(
         f"<tr><td>{key}</td><td>{_format_value(value)}</td></tr>"
         for key, value in simulation_data["params"].items()
     )
+    return {
+        "plot_base64": plot,
+        "plot_mime": IMAGE_FORMATS[image_format][1],
+        "data_table": data_table,
+        "param_rows": param_rows,
+        "group": group,
+        "group_plot_base64": group_plot,
+        "group_table": group_table,
+        "fan_plot_base64": fan_plot,
+    }
+
+def sensitivity_artifacts(sensitivity, image_format="png", dpi=100):
+    """敏感性分析结果的编码图像与指数表，缓存在 artifact_cache 中（同 report_artifacts）"""
+    indices = sensitivity["indices"]
+    digest = hashlib.sha256(pd.util.hash_pandas_object(indices, index=False).to_numpy().tobytes()).hexdigest()
+    plot = _cached_artifact((digest, "sensitivity_plot", image_format, dpi), lambda: _encoded_figure(
+        plot_sensitivity, indices, image_format=image_format, dpi=dpi))
+    columns = ["Outcome", "Parameter", "First-order", "Total"]
+    table = _cached_artifact((digest, "sensitivity_table"), lambda: indices[columns].to_html(
+        index=False,
+        classes="data-table",
+        float_format=lambda x: f"{x:.3f}",
+        na_rep="–"
+    ))
+    return {"plot_base64": plot, "plot_mime": IMAGE_FORMATS[image_format][1], "table": table}
+
+
+def generate_html_template(simulation_data, image_format="png", dpi=100, sensitivity=None):
+    """生成报告HTML模板；给出 sensitivity（run_sensitivity 的结果）时附加敏感性分析一节"""
+    artifacts = report_artifacts(simulation_data, image_format=image_format, dpi=dpi)
+    plot_base64 = artifacts["plot_base64"]
+    plot_mime = artifacts["plot_mime"]
+    data_table = artifacts["data_table"]
+    param_rows = artifacts["param_rows"]
+    aggregation = simulation_data["params"].get("Aggregation", "monthly (every 31 days)")
+    group = artifacts["group"]
+    group_section = ""
+    if group is not None:
+        group_section = f"""
+        <h2>Results by {group}</h2>
+        <p>The heatmap shows clinical cases per 100,000 people in each {group.lower()} over time; the table lists every {group.lower()} on the last simulated day.</p>
+        <div class="plot-section">
+            <img class="plot-img" src="data:{plot_mime};base64,{artifacts["group_plot_base64"]}">
+        </div>
+        {artifacts["group_table"]}
+        """
+    fan_section = ""
+    if artifacts["fan_plot_base64"] is not None:
+        fan_section = f"""
+        <h2>Ensemble Uncertainty</h2>
+        <p>Across {simulation_data["params"].get("Replicates", "all")} replicate trajectories, the line shows the median of each state and the shaded bands the central 50% and 90% of trajectories on every recorded day (quantiles estimated with a mergeable sketch, accurate to about 1%).</p>
+        <div class="plot-section">
+            <img class="plot-img" src="data:{plot_mime};base64,{artifacts["fan_plot_base64"]}">
+        </div>
+        """
+    sensitivity_section = ""
+    if sensitivity is not None:
+        parts = sensitivity_artifacts(sensitivity, image_format=image_format, dpi=dpi)
+        parameters = ", ".join(sensitivity["bounds"]["Parameter"])
+        sensitivity_section = f"""
+        <h2>Sensitivity Analysis</h2>
+        <p>{parameters} were sampled over their ranges ({sensitivity["evaluations"]} model runs, {DESIGNS[sensitivity["design"]].lower()} design, {sensitivity["engine"]} engine).
+        First-order indices give the share of outcome variance explained by each parameter alone; total-effect indices also include its interactions with the other parameters.</p>
+        <div class="plot-section">
+            <img class="plot-img" src="data:{parts["plot_mime"]};base64,{parts["plot_base64"]}">
+        </div>
+        {parts["table"]}
+        """
 
     return f"""
     <!DOCTYPE html>
@@ -128,10 +478,13 @@ def generate_html_template(simulation_data):
         <p>The stacked area chart displays the evolution of different states (Susceptible, Infected, Clinical, Recovered, Death) over time.</p>
         <div class="plot-section">
             <h2>Transmission Dynamics</h2>
-            <img class="plot-img" src="data:image/png;base64,{plot_base64}">
+            <img class="plot-img" src="data:{plot_mime};base64,{plot_base64}">
         </div>
 
-        <p>The results are aggregated monthly (every 31 days), providing insights into the progression of TB within the population.</p>
+        <p>The results are aggregated {aggregation}, providing insights into the progression of TB within the population.</p>
+        {fan_section}
+        {group_section}
+        {sensitivity_section}
         <h2>Simulation Data</h2>
         {data_table}
     </body>
@@ -148,8 +501,14 @@ def _format_value(value):
     else:
         return str(value)
     
-def fig_to_base64(fig):
-    """将matplotlib图表转换为Base64字符串"""
+def fig_to_base64(fig, image_format="png", dpi=100):
+    """将matplotlib图表转换为Base64字符串；png_compressed 会量化为 256 色调色板并压缩，svg 为矢量图"""
     buf = io.BytesIO()
-    fig.savefig(buf, format="png", bbox_inches="tight")
+    fig.savefig(buf, format=IMAGE_FORMATS[image_format][0], bbox_inches="tight", dpi=dpi)
+    if image_format == "png_compressed":
+        from PIL import Image
+        buf.seek(0)
+        image = Image.open(buf).convert("RGB").quantize(colors=256)
+        buf = io.BytesIO()
+        image.save(buf, format="png", optimize=True)
     return base64.b64encode(buf.getvalue()).decode("utf-8")
\ No newline at end of file
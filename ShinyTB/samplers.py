@@ -0,0 +1,70 @@
+from functools import lru_cache
+
+import numpy as np
+
+# 截断 Gamma 分布逆 CDF 查找表的网格点数
+_GAMMA_GRID_POINTS = 4097
+
+
+def truncated_exponential_ppf(u, low, high, mean):
+    """截断指数分布 [low, high] 的逆 CDF（闭式解），u 为 [0, 1) 均匀数（可为数组）"""
+    u = np.asarray(u, dtype=float)
+    if high <= low:
+        return np.full(u.shape, float(low))
+    # 利用指数分布的无记忆性：先平移到 low，再在宽度 high-low 的窗口内取逆
+    return low - mean * np.log1p(-u * -np.expm1(-(high - low) / mean))
+
+
+@lru_cache(maxsize=64)
+def _gamma_inverse_table(low, high, shape, scale):
+    """在 [low, high] 上数值积分 Gamma 密度，得到用于插值的 (CDF, x) 查找表"""
+    x = np.linspace(max(low, np.finfo(float).tiny), high, _GAMMA_GRID_POINTS)
+    log_pdf = (shape - 1) * np.log(x) - x / scale
+    pdf = np.exp(log_pdf - log_pdf.max())
+    # 梯形法累积积分并归一化
+    cdf = np.concatenate(([0.0], np.cumsum((pdf[1:] + pdf[:-1]) * np.diff(x) / 2)))
+    cdf /= cdf[-1]
+    return cdf, x
+
+
+def truncated_gamma_ppf(u, low, high, shape, scale):
+    """截断 Gamma 分布 [low, high] 的逆 CDF（查表插值），u 为 [0, 1) 均匀数（可为数组）"""
+    u = np.asarray(u, dtype=float)
+    if high <= low:
+        return np.full(u.shape, float(low))
+    cdf, x = _gamma_inverse_table(float(low), float(high), float(shape), float(scale))
+    return np.interp(u, cdf, x)
+
+
+def truncated_ppf(u, spec):
+    """按分布描述字典计算逆 CDF，例如 {"dist": "gamma", "low": 0.01, "high": 0.05, "shape": 2, "scale": 0.01}"""
+    if spec["dist"] == "exponential":
+        return truncated_exponential_ppf(u, spec["low"], spec["high"], spec["mean"])
+    if spec["dist"] == "gamma":
+        return truncated_gamma_ppf(u, spec["low"], spec["high"], spec["shape"], spec["scale"])
+    raise ValueError(f"Unknown distribution: {spec['dist']}")
+
+
+def truncated_mean(spec):
+    """截断分布的均值：指数分布用闭式解，Gamma 分布用逆 CDF 查找表数值积分"""
+    low, high = spec["low"], spec["high"]
+    if high <= low:
+        return float(low)
+    if spec["dist"] == "exponential":
+        mean = spec["mean"]
+        tail_low, tail_high = np.exp(-low / mean), np.exp(-high / mean)
+        return float(mean + (low * tail_low - high * tail_high) / (tail_low - tail_high))
+    if spec["dist"] == "gamma":
+        cdf, x = _gamma_inverse_table(float(low), float(high), float(spec["shape"]), float(spec["scale"]))
+        return float(np.sum((x[1:] + x[:-1]) / 2 * np.diff(cdf)))
+    raise ValueError(f"Unknown distribution: {spec['dist']}")
+
+
+def sample_truncated_exponential(rng, low, high, mean, size=None):
+    """无拒绝地批量生成截断指数分布样本"""
+    return truncated_exponential_ppf(rng.random(size), low, high, mean)
+
+
+def sample_truncated_gamma(rng, low, high, shape, scale, size=None):
+    """无拒绝地批量生成截断 Gamma 分布样本"""
+    return truncated_gamma_ppf(rng.random(size), low, high, shape, scale)
@@ -0,0 +1,248 @@
+"""全局敏感性分析：在 R0 与各转换率的取值范围内以 Sobol 序列或拉丁超立方抽样，
+并行评估峰值临床人数、累计死亡等结局，计算一阶与总效应 Sobol 指数。
+
+采用 Saltelli 抽样方案：两个独立的 N × k 样本矩阵 A、B，以及 k 个将 A 的第 i 列换为 B 的第 i 列的矩阵 AB_i，
+共 N (k + 2) 次模型评估。一阶指数使用 Saltelli (2010) 的估计量 mean(f_B (f_ABi - f_A)) / Var(Y)，
+总效应指数使用 Jansen (1999) 的估计量 mean((f_A - f_ABi)^2) / 2 / Var(Y)；置信区间由对样本行的自助法给出。
+评估时各转换率取固定值（退化的截断窗口），所有评估使用同一种子（共同随机数），
+因此默认的 ODE 引擎下结局是参数的确定性函数。
+"""
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from designs import DESIGNS
+from sim import ANNUAL_RATE_DISTRIBUTIONS, run_binomial, run_ode, run_simulation
+from sweep import parallel_map
+
+PARAMETERS = ("R0", *ANNUAL_RATE_DISTRIBUTIONS)
+ENGINES = ("ode", "continuous", "binomial")
+# 每个进程任务评估的样本数（ODE 单次评估只需几毫秒，逐个提交时进程间通信的开销更大）
+TASK_SAMPLES = 16
+
+# Joe–Kuo (2008) 方向数（new-joe-kuo-6.21201）：第 2 维起每维的 (本原多项式次数 s, 系数 a, 初始值 m_1..m_s)
+_SOBOL_DIRECTIONS = [
+    (1, 0, (1,)),
+    (2, 1, (1, 3)),
+    (3, 1, (1, 3, 1)),
+    (3, 2, (1, 1, 1)),
+    (4, 1, (1, 1, 3, 3)),
+    (4, 4, (1, 3, 5, 13)),
+    (5, 2, (1, 1, 5, 5, 17)),
+    (5, 4, (1, 1, 5, 5, 5)),
+    (5, 7, (1, 1, 7, 11, 19)),
+    (5, 11, (1, 1, 5, 1, 1)),
+    (5, 13, (1, 1, 1, 3, 11)),
+    (5, 14, (1, 3, 5, 5, 31)),
+    (6, 1, (1, 3, 3, 9, 7, 49)),
+    (6, 13, (1, 1, 1, 15, 21, 21)),
+    (6, 16, (1, 3, 1, 13, 27, 49)),
+]
+_SOBOL_BITS = 30
+MAX_SOBOL_DIMS = len(_SOBOL_DIRECTIONS) + 1
+
+
+def _direction_numbers(dims):
+    """各维的方向数 v_k = m_k · 2^(BITS-1-k)，形状 (dims, BITS)"""
+    shifts = _SOBOL_BITS - 1 - np.arange(_SOBOL_BITS)
+    directions = np.zeros((dims, _SOBOL_BITS), dtype=np.uint64)
+    directions[0] = np.left_shift(np.uint64(1), shifts.astype(np.uint64))
+    for j in range(1, dims):
+        s, a, initial = _SOBOL_DIRECTIONS[j - 1]
+        m = list(initial)
+        for k in range(s, _SOBOL_BITS):
+            value = m[k - s] ^ (m[k - s] << s)
+            for l in range(1, s):
+                if (a >> (s - 1 - l)) & 1:
+                    value ^= m[k - l] << l
+            m.append(value)
+        directions[j] = [m[k] << int(shifts[k]) for k in range(_SOBOL_BITS)]
+    return directions
+
+
+def sobol_sequence(n, dims, seed=None):
+    """Sobol 低差异序列的前 n 个点（格雷码顺序，与 scipy.stats.qmc.Sobol(scramble=False) 一致），
+    给出 seed 时再做随机数字移位（各维异或同一随机整数），使点不落在 0 上且可独立重复"""
+    if dims > MAX_SOBOL_DIMS:
+        raise ValueError(f"Sobol sequence supports at most {MAX_SOBOL_DIMS} dimensions")
+    directions = _direction_numbers(dims)
+    index = np.arange(n, dtype=np.uint64)
+    gray = index ^ (index >> np.uint64(1))
+    points = np.zeros((n, dims), dtype=np.uint64)
+    for bit in range(_SOBOL_BITS):
+        mask = ((gray >> np.uint64(bit)) & np.uint64(1)).astype(bool)
+        points[mask] ^= directions[:, bit]
+    if seed is not None:
+        shift = np.random.default_rng(seed).integers(0, 1 << _SOBOL_BITS, size=dims, dtype=np.uint64)
+        points ^= shift
+    return points / float(1 << _SOBOL_BITS)
+
+
+def latin_hypercube(n, dims, rng):
+    """拉丁超立方：每一维分成 n 个等宽区间，每个区间恰有一个点（区间内均匀抖动，各维的区间随机配对）"""
+    strata = np.column_stack([rng.permutation(n) for _ in range(dims)])
+    return (strata + rng.random((n, dims))) / n
+
+
+def saltelli_design(samples, bounds, design="sobol", seed=None):
+    """返回样本矩阵 (A, B)，形状均为 samples × 参数数，已按 bounds（参数名 -> (下限, 上限)）缩放。
+    Sobol 设计取 2k 维序列的前后 k 维作为 A 与 B；拉丁超立方设计为两个独立的拉丁超立方"""
+    dims = len(bounds)
+    if design == "sobol":
+        unit = sobol_sequence(samples, 2 * dims, seed)
+        a, b = unit[:, :dims], unit[:, dims:]
+    elif design == "lhs":
+        rng = np.random.default_rng(seed)
+        a, b = latin_hypercube(samples, dims, rng), latin_hypercube(samples, dims, rng)
+    else:
+        raise ValueError(f"Unknown design: {design} (choose from {list(DESIGNS)})")
+    low = np.array([low for low, _ in bounds.values()], dtype=float)
+    high = np.array([high for _, high in bounds.values()], dtype=float)
+    return low + a * (high - low), low + b * (high - low)
+
+
+def parameter_bounds(parameters=PARAMETERS, r0_bounds=(0.5, 3.0)):
+    """各参数的抽样范围：R0 为 r0_bounds，转换率为其默认截断窗口"""
+    bounds = {}
+    for name in parameters:
+        if name == "R0":
+            bounds[name] = tuple(r0_bounds)
+        elif name in ANNUAL_RATE_DISTRIBUTIONS:
+            bounds[name] = (ANNUAL_RATE_DISTRIBUTIONS[name]["low"], ANNUAL_RATE_DISTRIBUTIONS[name]["high"])
+        else:
+            raise ValueError(f"Unknown parameter: {name}")
+    return bounds
+
+
+# 结局：由模拟结果表（多轨迹时已按记录日取均值）与初始死亡人数计算
+def _peak_clinical(data, init_death):
+    return data["Clinical"].max()
+
+
+def _peak_clinical_day(data, init_death):
+    return data["Days"].iloc[int(data["Clinical"].to_numpy().argmax())]
+
+
+def _cumulative_deaths(data, init_death):
+    return data["Death"].iloc[-1] - init_death
+
+
+def _final_prevalence(data, init_death):
+    return data["Infected"].iloc[-1] + data["Clinical"].iloc[-1]
+
+
+OUTCOMES = {
+    "Peak clinical": _peak_clinical,
+    "Peak clinical day": _peak_clinical_day,
+    "Cumulative deaths": _cumulative_deaths,
+    "Final prevalence": _final_prevalence,
+}
+
+
+def _evaluate_task(task):
+    """在工作进程中评估一批参数组合，返回各组合的结局值列表"""
+    initial, sim_days, basic_repro, rows, engine, replicates, seed, aggregation, outcomes = task
+    values = []
+    for row in rows:
+        r0 = row.get("R0", basic_repro)
+        fixed = {name: {"low": value, "high": value} for name, value in row.items() if name != "R0"}
+        if engine == "ode":
+            data, _ = run_ode(*initial, r0, sim_days, rate_distributions=fixed, aggregation=aggregation)
+        elif engine == "binomial":
+            data, _ = run_binomial(*initial, r0, sim_days, replicates=replicates, seed=seed,
+                                   rate_distributions=fixed, aggregation=aggregation)
+            data = data.groupby("Days", as_index=False).mean()
+        elif engine == "continuous":
+            data, _ = run_simulation(*initial, r0, sim_days, seed=seed, rate_distributions=fixed, aggregation=aggregation)
+        else:
+            raise ValueError(f"Unknown engine: {engine} (choose from {list(ENGINES)})")
+        values.append([float(OUTCOMES[name](data, initial[4])) for name in outcomes])
+    return values
+
+
+def sobol_indices(f_a, f_b, f_ab, bootstrap=200, seed=0, confidence=0.95):
+    """由 f(A)、f(B)（形状 N）与 f(AB_i)（形状 k × N）计算一阶与总效应指数及其自助法置信区间。
+    返回字典：first、total（形状 k），first_low/first_high、total_low/total_high（bootstrap 为 0 时为 NaN）；
+    结局方差为 0 时指数为 NaN"""
+    def estimate(fa, fb, fab):
+        variance = np.var(np.concatenate([fa, fb], axis=-1), axis=-1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            first = np.mean(fb * (fab - fa), axis=-1) / variance
+            total = 0.5 * np.mean((fa - fab) ** 2, axis=-1) / variance
+        return first, total
+
+    f_a, f_b, f_ab = np.asarray(f_a, float), np.asarray(f_b, float), np.asarray(f_ab, float)
+    first, total = estimate(f_a, f_b, f_ab)
+    result = {"first": first, "total": total}
+    tail = 100 * (1 - confidence) / 2
+    rows = np.random.default_rng(seed).integers(0, len(f_a), size=(bootstrap, len(f_a)))
+    boot_first, boot_total = estimate(f_a[rows], f_b[rows], f_ab[:, rows])
+    for name, values in (("first", boot_first), ("total", boot_total)):
+        with warnings.catch_warnings():
+            # 方差为 0 的结局全部为 NaN
+            warnings.simplefilter("ignore", RuntimeWarning)
+            low, high = np.nanpercentile(values, [tail, 100 - tail], axis=-1) if bootstrap else np.full((2, len(f_ab)), np.nan)
+        result[f"{name}_low"], result[f"{name}_high"] = low, high
+    return result
+
+
+def run_sensitivity(population, init_infected, init_clinical, init_recovered, init_death, sim_days,
+                    basic_repro=1.5, parameters=PARAMETERS, r0_bounds=(0.5, 3.0), samples=128, design="sobol",
+                    engine="ode", outcomes=tuple(OUTCOMES), replicates=1, seed=0, aggregation="weekly",
+                    bootstrap=200, processes=None, callback=None):
+    """对 parameters 中的参数做全局敏感性分析（未参与抽样的 R0 取 basic_repro，转换率按其默认分布抽取）。
+
+    模型评估 samples × (参数数 + 2) 次，按批在进程池中并行运行，每批结束后调用 callback(done, total)，
+    可抛出 SimulationCancelled 中止分析。Sobol 设计的 samples 取 2 的幂时均匀性最好。
+    返回字典：
+    - indices: 每个结局与参数的一阶指数、总效应指数及置信区间
+    - samples: A、B 矩阵的参数值与结局（Matrix 列区分 A 与 B）
+    - bounds: 各参数的抽样范围；design、engine、evaluations: 设计、引擎与模型评估次数
+    """
+    parameters = list(parameters)
+    bounds = parameter_bounds(parameters, r0_bounds)
+    a, b = saltelli_design(samples, bounds, design, seed)
+    # 评估顺序：A、B、AB_1 … AB_k
+    matrices = [a, b]
+    for k in range(len(parameters)):
+        ab = a.copy()
+        ab[:, k] = b[:, k]
+        matrices.append(ab)
+    design_rows = [dict(zip(parameters, map(float, row))) for matrix in matrices for row in matrix]
+    print(f"Sensitivity analysis: {len(design_rows)} evaluations ({design}, {engine})...", flush=True)
+
+    initial = (population, init_infected, init_clinical, init_recovered, init_death)
+    tasks = [(initial, sim_days, basic_repro, design_rows[start:start + TASK_SAMPLES], engine, replicates, seed,
+              aggregation, list(outcomes)) for start in range(0, len(design_rows), TASK_SAMPLES)]
+    batch = 4 * (processes or os.cpu_count() or 1)
+    values = []
+    for start in range(0, len(tasks), batch):
+        for task_values in parallel_map(_evaluate_task, tasks[start:start + batch], processes):
+            values.extend(task_values)
+        if callback is not None:
+            callback(len(values), len(design_rows))
+    values = np.array(values).reshape(len(matrices), samples, len(outcomes))
+
+    rows = []
+    for j, outcome in enumerate(outcomes):
+        indices = sobol_indices(values[0, :, j], values[1, :, j], values[2:, :, j], bootstrap=bootstrap, seed=seed)
+        for k, name in enumerate(parameters):
+            rows.append({"Outcome": outcome, "Parameter": name,
+                         "First-order": indices["first"][k], "First-order low": indices["first_low"][k],
+                         "First-order high": indices["first_high"][k], "Total": indices["total"][k],
+                         "Total low": indices["total_low"][k], "Total high": indices["total_high"][k]})
+    sample_table = pd.concat([
+        pd.DataFrame(matrix, columns=parameters).assign(**{outcome: values[m, :, j] for j, outcome in enumerate(outcomes)})
+        for m, matrix in enumerate([a, b])
+    ], keys=["A", "B"], names=["Matrix", None]).reset_index(level=0).reset_index(drop=True)
+    return {
+        "indices": pd.DataFrame(rows),
+        "samples": sample_table,
+        "bounds": pd.DataFrame({"Parameter": parameters, "Low": [low for low, _ in bounds.values()],
+                                "High": [high for _, high in bounds.values()]}),
+        "design": design,
+        "engine": engine,
+        "evaluations": len(design_rows),
+    }
@@ -1,45 +1,147 @@
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 
-def run_simulation(population, init_infected, init_clinical,init_recovered,init_death,basic_repro, sim_days):
-    print("Running simulation...", flush=True)
-    """
-    参数:
-    - population: 总人口数 (int)
-    - init_infected: 初始感染状态人数 (int)
-    - init_clinical: 初始临床状态人数 (int)
-    - infection_rate: 易感转感染的转换率 (float)
-    - sim_days: 模拟天数 (int)
-    常假设感染事件为泊松过程（Poisson process），每个易感者被感染概率随感染人数而变，以指数分布描述。
-    通常模型设定的基本再生数R₀约为1至4，因此每名感染者年感染人数约为1–10。
-    返回:
-    - data: 每 31 天（月）聚合的状态人数数据，类型为 Pandas DataFrame。
-    - fig: 展示状态变化的堆叠区域图（Matplotlib 图形）。
-    - params: 包含随机生成模型参数（s、c、r1、r2、d）和用户输入参数的字典。
-    
-    随机参数基于 TB 传播研究中的合理分布生成，以“年率”生成，转换为每日率时除以365。
-    """
+from ode import dormand_prince
+from samplers import truncated_mean, truncated_ppf
+
+STATES = ["Susceptible", "Infected", "Clinical", "Recovered", "Death"]
+
+
+class SimulationCancelled(Exception):
+    """由 callback 抛出，用于中止正在运行的模拟"""
+
+
+def _validate_inputs(population, init_infected, init_clinical):
     # 参数验证
     if population <= 0:
         raise ValueError("Population must be positive")
     if (init_infected + init_clinical) > population:
         raise ValueError("Initial cases exceed total population")
+
+
+# 各转换率（年率）的截断分布，采样由 samplers 模块以逆 CDF 方式批量完成
+ANNUAL_RATE_DISTRIBUTIONS = {
+    # 选择 mean = 0.1 (中间值)，范围 0.05–0.15
+    "s": {"dist": "exponential", "low": 0.05, "high": 0.15, "mean": 0.1},
+    # 按照文献，快速进展概率约为 0.69
+    # 慢速进展：采用 Gamma 分布，形状参数 shape=2，scale设为0.01 均值约为0.02
+    "c": {"dist": "gamma", "low": 0.01, "high": 0.05, "shape": 2, "scale": 0.01},
+    #mean = 0.2, 范围 0.1–0.3
+    "r1": {"dist": "exponential", "low": 0.1, "high": 0.3, "mean": 0.2},
+    #mean = 1.1, 范围 0.2–2.0
+    "r2": {"dist": "exponential", "low": 0.2, "high": 1.5, "mean": 1},
+    #mean = 0.125, 范围 0.1–0.15
+    "d": {"dist": "exponential", "low": 0.05, "high": 0.1, "mean": 0.1},
+}
+
+
+# 记录（聚合）方式：在每个周期的最后一天记录状态人数，模拟的最后一天总会记录
+AGGREGATIONS = {
+    "daily": "daily",
+    "weekly": "weekly (every 7 days)",
+    "calendar_month": "by calendar month",
+    "yearly": "yearly (every 365 days)",
+}
+# 365 天日历中各月的天数（不考虑闰年）
+MONTH_DAYS = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+# 随机参数按天分块生成，每块最多 RATE_BLOCK_DAYS 天、RATE_BLOCK_VALUES 个值，内存不随模拟天数与轨迹数增长
+RATE_BLOCK_DAYS = 365
+RATE_BLOCK_VALUES = 1 << 20
+
+
+def record_days(sim_days, interval=31, aggregation=None):
+    """返回需要记录数据的天（升序 int 数组）：按 aggregation 的周期末记录，未指定时每 interval 天记录一次"""
+    if aggregation is None:
+        days = np.arange(interval, sim_days + 1, interval)
+    elif aggregation == "calendar_month":
+        years = -(-sim_days // 365)
+        month_ends = np.cumsum(MONTH_DAYS) + 365 * np.arange(years)[:, None]
+        days = month_ends.ravel()
+        days = days[days <= sim_days]
+    elif aggregation in AGGREGATIONS:
+        days = np.arange(0, sim_days + 1, {"daily": 1, "weekly": 7, "yearly": 365}[aggregation])[1:]
+    else:
+        raise ValueError(f"Unknown aggregation: {aggregation}")
+    if len(days) == 0 or days[-1] != sim_days:
+        days = np.append(days, sim_days)
+    return days.astype(np.int64)
+
+
+def _draw_uniforms(rng, sim_days):
+    """为一次模拟抽取全部均匀随机数，形状为 (转换率个数, 天数)"""
+    return rng.random((len(ANNUAL_RATE_DISTRIBUTIONS), sim_days))
+
+
+def _rate_streams(seed, sim_days):
+    """为一条轨迹的每个转换率各建立一个随机数流，依次抽取的结果与 _draw_uniforms 整体抽取结果的对应行完全相同。
+
+    _draw_uniforms 中第 k 个转换率的随机数是 PCG64 流中从第 k * sim_days 个开始的一段，
+    因此将生成器从初始状态前进（advance）到该位置即可按天分块抽取，无需一次生成全部随机数。
+    """
+    state = np.random.default_rng(seed).bit_generator.state
+    streams = []
+    for k in range(len(ANNUAL_RATE_DISTRIBUTIONS)):
+        bit_generator = np.random.PCG64()
+        bit_generator.state = state
+        bit_generator.advance(k * sim_days)
+        streams.append(np.random.Generator(bit_generator))
+    return streams
+
+
+def _iter_annual_rates(seeds, sim_days, rate_distributions=None, block_days=RATE_BLOCK_DAYS):
+    """按天分块生成各转换率的年率：每块产生 {name: 数组（轨迹数 × 块内天数）}，每个种子对应一条轨迹"""
+    streams = [_rate_streams(seed, sim_days) for seed in seeds]
+    uniforms = np.empty((len(streams), len(ANNUAL_RATE_DISTRIBUTIONS), block_days))
+    for start in range(0, sim_days, block_days):
+        size = min(block_days, sim_days - start)
+        for replicate, generators in enumerate(streams):
+            for k, generator in enumerate(generators):
+                generator.random(out=uniforms[replicate, k, :size])
+        yield _draw_annual_rates(uniforms[..., :size], rate_distributions)
+
+
+def resolve_rate_distributions(rate_distributions=None):
+    """以 ANNUAL_RATE_DISTRIBUTIONS 为默认值，合并调用方对部分转换率分布的覆盖（如缩小截断范围）"""
+    resolved = {name: dict(spec) for name, spec in ANNUAL_RATE_DISTRIBUTIONS.items()}
+    for name, override in (rate_distributions or {}).items():
+        if name not in resolved:
+            raise ValueError(f"Unknown rate: {name}")
+        resolved[name].update(override)
+    return resolved
+
+
+def _draw_annual_rates(uniforms, rate_distributions=None):
+    """将均匀随机数转换为各转换率的年率数组；uniforms 的倒数第二维对应 ANNUAL_RATE_DISTRIBUTIONS 的顺序"""
+    return {
+        name: truncated_ppf(uniforms[..., k, :], spec)
+        for k, (name, spec) in enumerate(resolve_rate_distributions(rate_distributions).items())
+    }
+
+
+def replicate_seeds(seed, replicates):
+    """为集合模拟的每条轨迹派生独立的随机种子（SeedSequence）。
+
+    第 k 条轨迹与 run_simulation(..., seed=replicate_seeds(seed, replicates)[k]) 的结果一致。
+    seed 也可以是已派生好的种子列表（如将一个集合拆分到多个进程时的一段），此时原样使用。
+    """
+    if isinstance(seed, (list, tuple)):
+        if len(seed) != replicates:
+            raise ValueError(f"Expected {replicates} replicate seeds, got {len(seed)}")
+        return list(seed)
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return seed.spawn(replicates)
+
+
+def _iter_records(population, init_infected, init_clinical, init_recovered, init_death, basic_repro, sim_days, seed, days, rate_distributions):
+    """逐日推进单条轨迹，在 days 中的每一天产生一条记录 (day, 五个状态人数, 截至当天的参数)"""
+    _validate_inputs(population, init_infected, init_clinical)
     
-    # 定义辅助函数：用于生成截断的指数分布样本
-    def sample_truncated_exponential(low, high, mean):
-        # np.random.exponential 的参数为 scale=mean
-        while True:
-            candidate = np.random.exponential(scale=mean)
-            if low <= candidate <= high:
-                return candidate
-
-    # 定义辅助函数：用于生成截断的 Gamma 分布样本
-    def sample_truncated_gamma(low, high, shape, scale):
-        while True:
-            candidate = np.random.gamma(shape, scale)
-            if low <= candidate <= high:
-                return candidate
+    # 按块生成随机参数（每块 RATE_BLOCK_DAYS 天）
+    rate_blocks = _iter_annual_rates([seed], sim_days, rate_distributions)
+    is_record = np.zeros(sim_days + 1, dtype=bool)
+    is_record[days] = True
             
     # 初始状态
     S = population - (init_infected + init_clinical + init_recovered + init_death)  # 易感
@@ -47,17 +149,6 @@ def run_simulation(population, init_infected, init_clinical,init_recovered,init_
     C = init_clinical                                # 临床
     R = init_recovered                               # 痊愈
     D = init_death                                  # 死亡
-    
-    # 用于记录每 31 天的数据
-    results = {
-        "Days": [],
-        "Susceptible": [],
-        "Infected": [],
-        "Clinical": [],
-        "Recovered": [],
-        "Death": []
-    }
-   
 
     # 模拟循环：每天更新状态
     for day in range(1, sim_days + 1):
@@ -65,26 +156,23 @@ def run_simulation(population, init_infected, init_clinical,init_recovered,init_
         N=S+I+C+R+D
         effective_infection_ratio =  C / N
         
-        # 生成随机参数  
-        # 选择 mean = 0.1 (中间值)，范围 0.05–0.15
-        s_annual = sample_truncated_exponential(0.05, 0.15, mean=0.1)
+        # 取出当天的随机参数
+        k = (day - 1) % RATE_BLOCK_DAYS
+        if k == 0:
+            annual_rates = {name: rates[0] for name, rates in next(rate_blocks).items()}
+        s_annual = float(annual_rates["s"][k])
         s = s_annual / 365
 
-        # 按照文献，快速进展概率约为 0.69
-        # 慢速进展：采用 Gamma 分布，形状参数 shape=2，scale设为0.01 均值约为0.02
-        c_annual = sample_truncated_gamma(0.01, 0.05, shape=2, scale=0.01)
+        c_annual = float(annual_rates["c"][k])
         c = c_annual / 365
 
-        #mean = 0.2, 范围 0.1–0.3
-        r1_annual = sample_truncated_exponential(0.1, 0.3, mean=0.2)
+        r1_annual = float(annual_rates["r1"][k])
         r1 = r1_annual / 365
 
-        #mean = 1.1, 范围 0.2–2.0
-        r2_annual = sample_truncated_exponential(0.2, 1.5, mean=1)
+        r2_annual = float(annual_rates["r2"][k])
         r2 = r2_annual / 365
 
-        #mean = 0.125, 范围 0.1–0.15
-        d_annual = sample_truncated_exponential(0.05, 0.1, mean=0.1)
+        d_annual = float(annual_rates["d"][k])
         d = d_annual / 365
 
         # 根据 R0 公式反推 i
@@ -127,39 +215,15 @@ def run_simulation(population, init_infected, init_clinical,init_recovered,init_
             ND = ND + D_next
             
         
-        # 每 31 天或最后一天记录数据
-        if  (day % 31 == 0) or(day == sim_days):
-            results["Days"].append(day)
-            results["Susceptible"].append(np.round(NS))
-            results["Infected"].append(np.round(NI))
-            results["Clinical"].append(np.round(NC))
-            results["Recovered"].append(np.round(NR))
-            results["Death"].append(np.round(ND))
+        # 在需要记录的天产生一条记录
+        if is_record[day]:
+            record = [np.round(NS), np.round(NI), np.round(NC), np.round(NR), np.round(ND)]
+            yield day, record, _pack_params(basic_repro, s_annual, s, i_annual, i, c_annual, c, r1_annual, r1, r2_annual, r2, d_annual, d)
 
 
-            
-    
-    # 将数据聚合成 DataFrame
-    data = pd.DataFrame(results)
-    
-    # 绘制堆叠区域图展示状态动态
-    fig, ax = plt.subplots()
-    ax.stackplot(
-            results["Days"],
-            results["Susceptible"],
-            results["Infected"],
-            results["Clinical"],
-            results["Recovered"],
-            results["Death"],
-                 labels=["Susceptible", "Infected", "Clinical", "Recovered", "Death"])
-    ax.set_xlabel("Days")
-    ax.set_ylabel("Population")
-    ax.legend(loc="upper left")
-    ax.set_title("TB Transmission Simulation")
-    
-    
+def _pack_params(basic_repro, s_annual, s, i_annual, i, c_annual, c, r1_annual, r1, r2_annual, r2, d_annual, d):
     # 打包所有参数
-    params = {
+    return {
         "Basic Reproduction number (R0)": basic_repro,
         "s (Recovered to Susceptible) annual": s_annual,
         "s (Recovered to Susceptible) daily": s,
@@ -174,4 +238,287 @@ def run_simulation(population, init_infected, init_clinical,init_recovered,init_
         "d (Clinical to Death) annual": d_annual,
         "d (Clinical to Death) daily": d,
     }
-    return data, fig, params
\ No newline at end of file
+
+
+def run_simulation(population, init_infected, init_clinical,init_recovered,init_death,basic_repro, sim_days, seed=None, interval=31, rate_distributions=None, callback=None, aggregation=None):
+    """
+    参数:
+    - population: 总人口数 (int)
+    - init_infected: 初始感染状态人数 (int)
+    - init_clinical: 初始临床状态人数 (int)
+    - infection_rate: 易感转感染的转换率 (float)
+    - sim_days: 模拟天数 (int)
+    - seed: 随机种子（int、SeedSequence 或 None），相同种子得到相同轨迹
+    - interval: 记录间隔天数 (int)，默认每 31 天（月）记录一次，最后一天总会记录
+    - rate_distributions: 可选，覆盖部分转换率的截断分布，例如 {"c": {"low": 0.02, "high": 0.03}}
+    - callback: 可选，每次记录数据后调用 callback(day, sim_days) 报告进度，抛出 SimulationCancelled 可中止模拟
+    - aggregation: 可选，记录方式（AGGREGATIONS 的键：daily、weekly、calendar_month、yearly），给出时代替 interval
+    常假设感染事件为泊松过程（Poisson process），每个易感者被感染概率随感染人数而变，以指数分布描述。
+    通常模型设定的基本再生数R₀约为1至4，因此每名感染者年感染人数约为1–10。
+    返回:
+    - data: 每 31 天（月）或按 aggregation 聚合的状态人数数据，类型为 Pandas DataFrame。
+    - params: 包含随机生成模型参数（s、c、r1、r2、d）和用户输入参数的字典。
+    
+    随机参数基于 TB 传播研究中的合理分布生成，以“年率”生成，转换为每日率时除以365。
+    """
+    # 预先分配记录数组（记录条数 × 状态数）
+    days = record_days(sim_days, interval, aggregation)
+    records = np.empty((len(days), len(STATES)))
+   
+    for n, (day, record, params) in enumerate(_iter_records(population, init_infected, init_clinical, init_recovered, init_death,
+                                                            basic_repro, sim_days, seed, days, rate_distributions)):
+        records[n] = record
+        if callback is not None:
+            callback(day, sim_days)
+
+    # 将数据聚合成 DataFrame
+    data = pd.DataFrame(records, columns=STATES)
+    data.insert(0, "Days", days)
+    return data, params
+
+
+def iter_simulation(population, init_infected, init_clinical, init_recovered, init_death, basic_repro, sim_days, seed=None, interval=31, rate_distributions=None, chunk_records=1, aggregation=None):
+    """
+    run_simulation 的流式版本：模拟推进过程中，每累积 chunk_records 条记录（默认即每个 31 天聚合）产生一次 (chunk, params)。
+    - chunk: 仅包含新记录的 DataFrame，列与 run_simulation 返回的 data 相同
+    - params: 截至该 chunk 最后一天的参数字典
+    按顺序拼接所有 chunk 即得到与相同参数下 run_simulation 完全一致的结果。
+    """
+    rows = []
+    days = record_days(sim_days, interval, aggregation)
+    for day, record, params in _iter_records(population, init_infected, init_clinical, init_recovered, init_death,
+                                             basic_repro, sim_days, seed, days, rate_distributions):
+        rows.append([day, *record])
+        if len(rows) >= chunk_records or day == sim_days:
+            yield pd.DataFrame(rows, columns=["Days", *STATES]), params
+            rows = []
+
+
+def run_ensemble(population, init_infected, init_clinical, init_recovered, init_death, basic_repro, sim_days, replicates, seed=None, interval=31, rate_distributions=None, callback=None, aggregation=None):
+    """
+    集合（Monte Carlo）模拟：所有轨迹以 NumPy 数组（轨迹数 × 状态数）同步推进。
+
+    参数与 run_simulation 相同，另加:
+    - replicates: 轨迹条数 (int)
+    - seed: 集合的根随机种子；第 k 条轨迹使用 replicate_seeds(seed, replicates)[k]，
+      因此与相同种子下 run_simulation 的单条结果逐一相同。
+    返回:
+    - data: 堆叠的长表 DataFrame，列为 Replicate、Days 及五个状态。
+    - params: 与 run_simulation 相同的键，值为每条轨迹最后一天参数组成的数组。
+    """
+    _validate_inputs(population, init_infected, init_clinical)
+    if replicates < 1:
+        raise ValueError("Replicates must be at least 1")
+
+    # 按块生成所有轨迹的随机参数（每块形状：轨迹数 × 块内天数），块大小随轨迹数缩小以限制内存
+    block_days = max(1, min(RATE_BLOCK_DAYS, RATE_BLOCK_VALUES // replicates))
+    rate_blocks = _iter_annual_rates(replicate_seeds(seed, replicates), sim_days, rate_distributions, block_days)
+
+    # 初始状态（与单轨迹路径一致，初始值在整个循环中保持不变）
+    S = population - (init_infected + init_clinical + init_recovered + init_death)
+    I = init_infected
+    C = init_clinical
+    R = init_recovered
+    D = init_death
+    effective_infection_ratio = C / (S + I + C + R + D)
+
+    # 当前状态矩阵：轨迹数 × 状态数（列顺序同 STATES）
+    state = np.empty((replicates, len(STATES)))
+    NS, NI, NC, NR, ND = (state[:, k] for k in range(len(STATES)))
+    days = record_days(sim_days, interval, aggregation)
+    records = np.empty((replicates, len(days), len(STATES)))
+    snapshot = 0
+
+    for day in range(1, sim_days + 1):
+        k = (day - 1) % block_days
+        if k == 0:
+            annual_rates = next(rate_blocks)
+            s_annual = annual_rates["s"]
+            c_annual = annual_rates["c"]
+            r1_annual = annual_rates["r1"]
+            r2_annual = annual_rates["r2"]
+            d_annual = annual_rates["d"]
+            s = s_annual / 365
+            c = c_annual / 365
+            r1 = r1_annual / 365
+            r2 = r2_annual / 365
+            d = d_annual / 365
+            # 根据 R0 公式反推 i
+            i_annual = basic_repro * s_annual * (c_annual + r1_annual) * (r2_annual + d_annual) / c_annual
+            i = i_annual / 365
+
+        if day >= 2:
+            new_infections = NS * i[:, k] * effective_infection_ratio
+            new_clinical = NI * c[:, k]
+            new_recovered_from_infection = NI * r1[:, k]
+            new_recovered_from_clinical = NC * r2[:, k]
+            new_deaths = NC * d[:, k]
+            new_susceptible = NR * s[:, k]
+        else:
+            new_infections = S * i[:, k] * effective_infection_ratio
+            new_clinical = I * c[:, k]
+            new_recovered_from_infection = I * r1[:, k]
+            new_recovered_from_clinical = C * r2[:, k]
+            new_deaths = C * d[:, k]
+            new_susceptible = R * s[:, k]
+
+        S_next = new_susceptible - new_infections
+        I_next = new_infections - new_clinical - new_recovered_from_infection
+        C_next = new_clinical - new_recovered_from_clinical - new_deaths
+        R_next = new_recovered_from_infection + new_recovered_from_clinical - new_susceptible
+        D_next = new_deaths
+
+        NS[:] = S + S_next
+        NI[:] = I + I_next
+        NC[:] = C + C_next
+        NR[:] = R + R_next
+        ND[:] = D + D_next
+        if day >= 2:
+            state += np.column_stack([S_next, I_next, C_next, R_next, D_next])
+
+        if snapshot < len(days) and day == days[snapshot]:
+            records[:, snapshot, :] = np.round(state)
+            snapshot += 1
+            if callback is not None:
+                callback(day, sim_days)
+
+    # 堆叠为长表：每条轨迹依次排列
+    data = pd.DataFrame(records.reshape(-1, len(STATES)), columns=STATES)
+    data.insert(0, "Days", np.tile(days, replicates))
+    data.insert(0, "Replicate", np.repeat(np.arange(replicates), len(days)))
+
+    last = k
+    params = {
+        "Basic Reproduction number (R0)": basic_repro,
+        "s (Recovered to Susceptible) annual": s_annual[:, last],
+        "s (Recovered to Susceptible) daily": s[:, last],
+        "i (Susceptible to Infection) annual": i_annual[:, last],
+        "i (Susceptible to Infection) daily": i[:, last],
+        "c (Infected to Clinical) annual": c_annual[:, last],
+        "c (Infected to Clinical) daily": c[:, last],
+        "r1 (Infected to Recovered) annual": r1_annual[:, last],
+        "r1 (Infected to Recovered) daily": r1[:, last],
+        "r2 (Clinical to Recovered) annual": r2_annual[:, last],
+        "r2 (Clinical to Recovered) daily": r2[:, last],
+        "d (Clinical to Death) annual": d_annual[:, last],
+        "d (Clinical to Death) daily": d[:, last],
+    }
+    return data, params
+
+
+def _with_infection_rate(annual_rates, basic_repro):
+    """在一块年率中加入根据 R0 公式反推的 i，返回 (年率, 日率) 两个字典"""
+    annual = dict(annual_rates)
+    annual["i"] = basic_repro * annual["s"] * (annual["c"] + annual["r1"]) * (annual["r2"] + annual["d"]) / annual["c"]
+    return annual, {name: rate / 365 for name, rate in annual.items()}
+
+
+def run_binomial(population, init_infected, init_clinical, init_recovered, init_death, basic_repro, sim_days, replicates=1, seed=None, interval=31, rate_distributions=None, callback=None, aggregation=None):
+    """
+    整数值随机引擎（链式二项 / tau-leap，步长一天）：每天各转换的人数按二项分布抽取，
+    可体现人口规模带来的随机波动以及小规模暴发的自然灭绝。
+
+    转换率与 run_ensemble 相同（相同种子下每条轨迹每天的 s、c、r1、r2、d 相同），日率 x 转换为当天的转换概率 1 - exp(-x)；
+    I→C/R、C→R/D 两个去向按竞争风险分配（等价于多项分布）。感染概率使用当天的临床人数比例 C / population。
+    所有轨迹以整数数组（轨迹数 × 状态数）同步推进。
+    参数与返回值格式同 run_ensemble，状态人数为整数。
+    """
+    _validate_inputs(population, init_infected, init_clinical)
+    if replicates < 1:
+        raise ValueError("Replicates must be at least 1")
+
+    # 前 replicates 个子种子生成转换率（与 run_ensemble 相同），最后一个子种子生成转换人数
+    children = replicate_seeds(seed, replicates + 1)
+    block_days = max(1, min(RATE_BLOCK_DAYS, RATE_BLOCK_VALUES // replicates))
+    rate_blocks = _iter_annual_rates(children[:-1], sim_days, rate_distributions, block_days)
+    rng = np.random.default_rng(children[-1])
+
+    # 当前状态矩阵：轨迹数 × 状态数（列顺序同 STATES）
+    state = np.empty((replicates, len(STATES)), dtype=np.int64)
+    state[:] = [population - (init_infected + init_clinical + init_recovered + init_death),
+                init_infected, init_clinical, init_recovered, init_death]
+    NS, NI, NC, NR, ND = (state[:, k] for k in range(len(STATES)))
+    days = record_days(sim_days, interval, aggregation)
+    records = np.empty((replicates, len(days), len(STATES)), dtype=np.int64)
+    snapshot = 0
+
+    for day in range(1, sim_days + 1):
+        k = (day - 1) % block_days
+        if k == 0:
+            annual, daily = _with_infection_rate(next(rate_blocks), basic_repro)
+        s, i, c, r1, r2, d = (daily[name][:, k] for name in ("s", "i", "c", "r1", "r2", "d"))
+
+        new_infections = rng.binomial(NS, -np.expm1(-i * NC / population))
+        leave_infected = rng.binomial(NI, -np.expm1(-(c + r1)))
+        new_clinical = rng.binomial(leave_infected, c / (c + r1))
+        new_recovered_from_infection = leave_infected - new_clinical
+        leave_clinical = rng.binomial(NC, -np.expm1(-(r2 + d)))
+        new_deaths = rng.binomial(leave_clinical, d / (r2 + d))
+        new_recovered_from_clinical = leave_clinical - new_deaths
+        new_susceptible = rng.binomial(NR, -np.expm1(-s))
+
+        NS += new_susceptible - new_infections
+        NI += new_infections - new_clinical - new_recovered_from_infection
+        NC += new_clinical - new_recovered_from_clinical - new_deaths
+        NR += new_recovered_from_infection + new_recovered_from_clinical - new_susceptible
+        ND += new_deaths
+
+        if snapshot < len(days) and day == days[snapshot]:
+            records[:, snapshot, :] = state
+            snapshot += 1
+            if callback is not None:
+                callback(day, sim_days)
+
+    # 堆叠为长表：每条轨迹依次排列
+    data = pd.DataFrame(records.reshape(-1, len(STATES)), columns=STATES)
+    data.insert(0, "Days", np.tile(days, replicates))
+    data.insert(0, "Replicate", np.repeat(np.arange(replicates), len(days)))
+
+    params = _pack_params(basic_repro, *(rates[:, k] for name in ("s", "i", "c", "r1", "r2", "d")
+                                         for rates in (annual[name], daily[name])))
+    return data, params
+
+
+def mean_rates(rate_distributions=None):
+    """各转换率截断分布的均值（年率）"""
+    return {name: truncated_mean(spec) for name, spec in resolve_rate_distributions(rate_distributions).items()}
+
+
+def run_ode(population, init_infected, init_clinical, init_recovered, init_death, basic_repro, sim_days, t_eval=None, interval=31, rate_distributions=None, aggregation=None, rtol=1e-6, atol=1e-6):
+    """
+    确定性平均场引擎：以各转换率截断分布的均值（固定率）积分 S-I-C-R-D 常微分方程组
+        dS/dt = s R - i S C / N,  dI/dt = i S C / N - (c + r1) I,  dC/dt = c I - (r2 + d) C,
+        dR/dt = r1 I + r2 C - s R,  dD/dt = d C
+    （t 以天计，N 为总人口），使用自适应步长的 Dormand–Prince 5(4) 方法（见 ode 模块）。
+    - t_eval: 可选，任意升序的输出时刻（天，可为小数）；未给出时按 interval / aggregation 的记录天输出
+    - rtol、atol: 求解器的相对与绝对容差
+    返回值格式同 run_simulation（状态人数不取整），params 中另含求解器步数。
+    """
+    _validate_inputs(population, init_infected, init_clinical)
+    annual = mean_rates(rate_distributions)
+    annual["i"] = basic_repro * annual["s"] * (annual["c"] + annual["r1"]) * (annual["r2"] + annual["d"]) / annual["c"]
+    s, i, c, r1, r2, d = (annual[name] / 365 for name in ("s", "i", "c", "r1", "r2", "d"))
+
+    def derivatives(t, y):
+        S, I, C, R, D = y
+        infections = i * S * C / population
+        return np.array([
+            s * R - infections,
+            infections - (c + r1) * I,
+            c * I - (r2 + d) * C,
+            r1 * I + r2 * C - s * R,
+            d * C,
+        ])
+
+    if t_eval is None:
+        t_eval = record_days(sim_days, interval, aggregation)
+    y0 = [population - (init_infected + init_clinical + init_recovered + init_death),
+          init_infected, init_clinical, init_recovered, init_death]
+    values, stats = dormand_prince(derivatives, (0, sim_days), y0, t_eval, rtol=rtol, atol=atol)
+
+    data = pd.DataFrame(values, columns=STATES)
+    data.insert(0, "Days", t_eval)
+    params = _pack_params(basic_repro, *(rate for name in ("s", "i", "c", "r1", "r2", "d")
+                                         for rate in (annual[name], annual[name] / 365)))
+    params["ODE solver steps"] = stats["steps"]
+    return data, params
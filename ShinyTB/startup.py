@@ -0,0 +1,117 @@
+"""启动耗时：重依赖在首次使用时才导入，并可在后台预先导入。
+
+- timed_import(name)：导入模块；首次导入的耗时记录在 IMPORT_TIMES 与 metrics 的 lazy_import span 中
+- prewarm(modules)：在后台线程中预先导入（并绘制一张图），使首个导出或绘图请求不必等待导入；
+  应用在环境变量 SHINYTB_PREWARM=1 时于启动后调用
+- import_report(module)：在新的解释器中以 python -X importtime 导入 module，返回各模块的导入耗时
+
+命令行示例（在 ShinyTB 目录下运行）：
+    python startup.py                 # ShinyTB 应用模块的导入耗时报告
+    python startup.py report --top 10 # 报告模块，列出自身耗时最多的 10 个模块
+"""
+import argparse
+import importlib
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from metrics import metrics
+
+# 首次使用时才导入的模块，预热时依次导入
+PREWARM_MODULES = ["sim", "matplotlib.pyplot", "report", "playwright.async_api"]
+
+# 模块名 -> 首次导入耗时（秒）
+IMPORT_TIMES = {}
+# 模块名 -> 该模块首次导入的锁（同一模块只由一个线程计时导入）
+_import_locks = {}
+_import_locks_lock = threading.Lock()
+
+
+def timed_import(name):
+    """导入并返回模块；模块尚未加载时记录导入耗时。
+    模块已在 sys.modules 中时由 importlib.import_module 返回：若其他线程正在导入该模块，
+    import_module 等待导入完成（如多份报告同时在工作线程中生成）"""
+    if name in sys.modules:
+        return importlib.import_module(name)
+    with _import_locks_lock:
+        lock = _import_locks.setdefault(name, threading.Lock())
+    with lock:
+        if name in sys.modules:
+            return importlib.import_module(name)
+        with metrics.span("lazy_import", module=name) as record:
+            module = importlib.import_module(name)
+        IMPORT_TIMES[name] = record["seconds"]
+    print(f"Imported {name} in {IMPORT_TIMES[name] * 1000:.0f} ms", flush=True)
+    return module
+
+
+def _prewarm(modules):
+    start = time.perf_counter()
+    for name in modules:
+        try:
+            timed_import(name)
+        except ImportError as e:
+            print(f"Prewarm: cannot import {name}: {e}", flush=True)
+    if "matplotlib.pyplot" in modules:
+        # 首次绘图还会加载字体与后端，预先绘制一张提示图
+        from plots import close_figure, plot_placeholder
+        close_figure(plot_placeholder("Prewarm"))
+    print(f"Prewarm finished in {(time.perf_counter() - start) * 1000:.0f} ms", flush=True)
+
+
+def prewarm(modules=PREWARM_MODULES):
+    """在后台守护线程中预先导入模块，返回该线程"""
+    thread = threading.Thread(target=_prewarm, args=(list(modules),), name="prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+def import_report(module="ShinyTB", python=sys.executable, cwd=None):
+    """在新的解释器中导入 module，返回 -X importtime 记录的每个模块：
+    [{"module", "depth"（相对 module 的层级，0 为 module 本身）, "self", "cumulative"（秒）}]，按导入完成顺序排列，
+    不含解释器启动时已导入的模块"""
+    cwd = cwd or os.path.dirname(os.path.abspath(__file__))
+    completed = subprocess.run([python, "-X", "importtime", "-c", f"import {module}"], cwd=cwd,
+                               capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr.strip()[-2000:]}")
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append({"module": name.strip(), "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+                     "self": int(self_us) / 1e6, "cumulative": int(cumulative_us) / 1e6})
+    # 只保留 module 本身及其导入的模块（在其之前完成、层级更深的连续记录），并以 module 的层级为 0
+    end = max(index for index, row in enumerate(rows) if row["module"] == module)
+    start = end
+    while start > 0 and rows[start - 1]["depth"] > rows[end]["depth"]:
+        start -= 1
+    top = rows[end]["depth"]
+    return [{**row, "depth": row["depth"] - top} for row in rows[start:end + 1]]
+
+
+def format_report(rows, module="ShinyTB", top=20):
+    """报告文本：module 的总导入耗时、其直接导入的各模块耗时，以及自身耗时最多的 top 个模块"""
+    total = rows[-1]["cumulative"]
+    lines = [f"Importing {module}: {total * 1000:.0f} ms", "", "Direct imports (cumulative):"]
+    direct = sorted((row for row in rows if row["depth"] == 1), key=lambda row: -row["cumulative"])
+    lines += [f"  {row['cumulative'] * 1000:8.1f} ms  {row['module']}" for row in direct]
+    lines += ["", f"Slowest {top} modules (self):"]
+    lines += [f"  {row['self'] * 1000:8.1f} ms  {row['module']}"
+              for row in sorted(rows, key=lambda row: -row["self"])[:top]]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report the import cost of each module loaded at startup.")
+    parser.add_argument("module", nargs="?", default="ShinyTB", help="module to import (default: the Shiny app)")
+    parser.add_argument("--top", type=int, default=20, help="number of slowest modules to list")
+    args = parser.parse_args(argv)
+    print(format_report(import_report(args.module), args.module, args.top), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""磁盘上的模拟结果库：按场景哈希保存，列式存储、按需以内存映射读取。
+
+每个结果一个目录 <root>/<哈希>/：
+- meta.json: 场景描述、参数、创建时间，以及各表的列与行数、各数组的形状与维度名
+- tables/<表名>/<列名>.npy: 列式表（每列一个 .npy，读取时以 mmap 打开，只读取所需的列与行）
+- arrays/<名称>.npy: 多维数组（如集合轨迹 轨迹数 × 记录条数 × 状态数），可由多个进程按切片并行写入
+
+写入在临时目录中进行，提交时整体改名为最终目录，因此读者不会看到写了一半的结果。
+给出 max_runs 或 max_bytes 时，每次提交后按最近使用时间（结果目录的修改时间，读取时更新）淘汰最久未使用的结果。
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+META_FILE = "meta.json"
+
+
+def _jsonable(value):
+    if isinstance(value, np.random.SeedSequence):
+        return {"entropy": value.entropy, "spawn_key": list(value.spawn_key)}
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+def scenario_hash(scenario):
+    """场景描述（可 JSON 序列化的字典）的稳定哈希，用作结果目录名"""
+    text = json.dumps(scenario, sort_keys=True, default=_jsonable)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+class StoreEntry:
+    """正在写入的结果：在临时目录中写表与数组，commit() 后才对读者可见"""
+
+    def __init__(self, store, scenario):
+        self.store = store
+        self.scenario = scenario
+        self.key = scenario_hash(scenario)
+        self.path = os.path.join(store.root, f".{self.key}.{uuid.uuid4().hex[:8]}.tmp")
+        os.makedirs(self.path)
+        self.meta = {"hash": self.key, "scenario": scenario, "tables": {}, "arrays": {}}
+
+    def table(self, name, frame):
+        """以列式保存 DataFrame（数值列保持原类型，其余列保存为定长字符串）"""
+        directory = os.path.join(self.path, "tables", name)
+        os.makedirs(directory, exist_ok=True)
+        for column in frame.columns:
+            values = frame[column].to_numpy()
+            if values.dtype == object:
+                values = values.astype(str)
+            np.save(os.path.join(directory, f"{column}.npy"), values)
+        self.meta["tables"][name] = {"columns": [str(c) for c in frame.columns], "rows": len(frame)}
+
+    def array(self, name, shape, dims, dtype=np.float64, coords=None):
+        """预分配一个可由多个进程按切片写入的 .npy 数组，返回其路径（以 open_array 打开写入）"""
+        directory = os.path.join(self.path, "arrays")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{name}.npy")
+        np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=tuple(shape)).flush()
+        self.meta["arrays"][name] = {"shape": list(shape), "dims": list(dims), "coords": coords or {}}
+        return path
+
+    def commit(self, params=None):
+        """写入 meta.json 并改名为最终目录；同一场景已存在时保留已有结果。
+        参数中的数组（如集合中每条轨迹的参数）保存为均值。"""
+        self.meta["params"] = {key: float(np.mean(value)) if isinstance(value, np.ndarray) else value
+                               for key, value in (params or {}).items()}
+        self.meta["created"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        with open(os.path.join(self.path, META_FILE), "w") as f:
+            json.dump(self.meta, f, indent=2, default=_jsonable)
+        target = os.path.join(self.store.root, self.key)
+        try:
+            os.rename(self.path, target)
+        except OSError:
+            # 其他写入者已提交同一场景
+            shutil.rmtree(self.path, ignore_errors=True)
+        self.store.touch(self.key)
+        self.store.prune(keep={self.key})
+        return self.key
+
+    def discard(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.discard()
+
+
+def open_array(path, mode="r+"):
+    """在（可能是另一个进程中的）写入者里打开预分配的数组"""
+    return np.load(path, mmap_mode=mode)
+
+
+class ResultStore:
+    def __init__(self, root, max_runs=None, max_bytes=None):
+        self.root = os.path.abspath(root)
+        self.max_runs = max_runs
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        # 已提交结果的列表行（meta.json 与占用字节数在提交后不再改变），列出与淘汰时不必重复读取
+        self._rows = {}
+        os.makedirs(self.root, exist_ok=True)
+
+    def writer(self, scenario):
+        """开始写入一个场景的结果（with 语句中出错时自动丢弃）"""
+        return StoreEntry(self, scenario)
+
+    def __contains__(self, key):
+        return os.path.exists(os.path.join(self.root, key, META_FILE))
+
+    def find(self, scenario):
+        """返回场景对应的哈希（已保存时，同时记为最近使用），否则返回 None"""
+        key = scenario_hash(scenario)
+        if key not in self:
+            return None
+        self.touch(key)
+        return key
+
+    def touch(self, key):
+        """将结果记为最近使用（淘汰顺序依据结果目录的修改时间）"""
+        try:
+            os.utime(os.path.join(self.root, key))
+        except OSError:
+            pass
+
+    def _size(self, key):
+        return sum(os.path.getsize(os.path.join(folder, name))
+                   for folder, _, names in os.walk(os.path.join(self.root, key)) for name in names)
+
+    def prune(self, keep=()):
+        """超过 max_runs 或 max_bytes 时按最久未使用顺序删除结果（keep 中的结果除外），返回被删除的哈希"""
+        if self.max_runs is None and self.max_bytes is None:
+            return []
+        runs = []
+        for key in os.listdir(self.root):
+            if not key.startswith(".") and key in self:
+                try:
+                    runs.append((os.path.getmtime(os.path.join(self.root, key)), key, self._row(key)["Bytes"]))
+                except OSError:
+                    continue  # 其他进程刚刚删除
+        runs.sort()
+        count, total = len(runs), sum(size for _, _, size in runs)
+        evicted = []
+        for _, key, size in runs:
+            if (self.max_runs is None or count <= self.max_runs) and (self.max_bytes is None or total <= self.max_bytes):
+                break
+            if key in keep:
+                continue
+            self.delete(key)
+            evicted.append(key)
+            count -= 1
+            total -= size
+        self.evictions += len(evicted)
+        return evicted
+
+    def meta(self, key):
+        with open(os.path.join(self.root, key, META_FILE)) as f:
+            return json.load(f)
+
+    def load_table(self, key, name="data", columns=None, rows=None):
+        """读取表的部分列与行（rows 为切片或下标数组），只从内存映射中复制所需部分"""
+        info = self.meta(key)["tables"][name]
+        directory = os.path.join(self.root, key, "tables", name)
+        selected = {}
+        for column in columns or info["columns"]:
+            values = np.load(os.path.join(directory, f"{column}.npy"), mmap_mode="r")
+            selected[column] = np.array(values if rows is None else values[rows])
+        return pd.DataFrame(selected)
+
+    def load_array(self, key, name):
+        """以只读内存映射打开数组（切片时才从磁盘读取）"""
+        return np.load(os.path.join(self.root, key, "arrays", f"{name}.npy"), mmap_mode="r")
+
+    def load_result(self, key, replicate=None):
+        """读取可直接展示的结果 (data, params)：缺省为汇总表 data；
+        给出 replicate 时只读取该条轨迹（来自长表 trajectories 的连续行，或数组 trajectories 的一个切片）"""
+        meta = self.meta(key)
+        params = dict(meta.get("params") or {})
+        self.touch(key)
+        if replicate is None:
+            return self.load_table(key, "data"), params
+        replicates = int(meta["scenario"].get("replicates", 1))
+        if not 0 <= replicate < replicates:
+            raise ValueError(f"Replicate must be between 0 and {replicates - 1}")
+        if "trajectories" in meta["tables"]:
+            per_replicate = meta["tables"]["trajectories"]["rows"] // replicates
+            columns = [c for c in meta["tables"]["trajectories"]["columns"] if c != "Replicate"]
+            data = self.load_table(key, "trajectories", columns,
+                                   rows=slice(replicate * per_replicate, (replicate + 1) * per_replicate))
+        elif "trajectories" in meta["arrays"]:
+            coords = meta["arrays"]["trajectories"]["coords"]
+            data = pd.DataFrame(np.array(self.load_array(key, "trajectories")[replicate]), columns=coords["State"])
+            data.insert(0, "Days", coords["Days"])
+        else:
+            return self.load_table(key, "data"), params
+        params["Replicate"] = replicate
+        return data, params
+
+    def _row(self, key):
+        """结果的列表行：哈希、创建时间、场景描述的主要字段与占用字节数（首次读取后缓存）"""
+        row = self._rows.get(key)
+        if row is None:
+            meta = self.meta(key)
+            row = {"Hash": key, "Created": meta.get("created"),
+                   **{k: v for k, v in meta["scenario"].items() if isinstance(v, (str, int, float))},
+                   "Bytes": self._size(key)}
+            self._rows[key] = row
+        return row
+
+    def runs(self):
+        """列出已保存的结果：哈希、创建时间、场景描述的主要字段与占用字节数（只读取上次列出后新增的结果）"""
+        keys = [key for key in sorted(os.listdir(self.root)) if not key.startswith(".") and key in self]
+        for key in set(self._rows) - set(keys):
+            self._rows.pop(key, None)
+        rows = []
+        for key in keys:
+            try:
+                rows.append(self._row(key))
+            except OSError:
+                continue  # 其他进程刚刚删除
+        return pd.DataFrame(rows)
+
+    def delete(self, key):
+        self._rows.pop(key, None)
+        shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
@@ -0,0 +1,221 @@
+"""分组（结构化）传播模型：五个状态均为按组（地区或年龄组）排列的向量，组间感染通过混合（接触）矩阵耦合。
+
+每天的感染力为一次矩阵运算：lambda = (C / N) @ mixing.T，即第 g 组的易感者受到
+sum_h mixing[g, h] * C_h / N_h 的感染压力，所有组（以及所有集合轨迹）同步推进。
+转换率可按组乘以倍数（如按年龄的易感性、发病率与病死率），以 (轨迹数 × 组数) 的数组参与运算。
+"""
+import numpy as np
+import pandas as pd
+
+from sim import (STATES, RATE_BLOCK_DAYS, RATE_BLOCK_VALUES, _iter_annual_rates, _pack_params,
+                 _with_infection_rate, record_days, replicate_seeds)
+from sweep import read_table
+
+# 地区表的列：地区名、总人口与各状态初始人数（易感人数由总人口推出）
+REGION_COLUMNS = ["Region", "Population", "Infected", "Clinical", "Recovered", "Death"]
+# 年龄组表的列同上；可选列 s、i、c、r1、r2、d 为该年龄组相应转换率的倍数（缺省为 1）
+AGE_COLUMNS = ["Age group", "Population", "Infected", "Clinical", "Recovered", "Death"]
+RATE_NAMES = ("s", "i", "c", "r1", "r2", "d")
+
+
+def uniform_mixing(groups, strength):
+    """简单混合矩阵：每组 1 - strength 的接触发生在组内，其余 strength 均匀分布到所有组"""
+    return (1 - strength) * np.eye(groups) + strength / groups
+
+
+def validate_mixing(mixing, groups):
+    mixing = np.asarray(mixing, dtype=float)
+    if mixing.shape != (groups, groups):
+        raise ValueError(f"Mixing matrix must be {groups} x {groups}, got {mixing.shape}")
+    if np.any(mixing < 0):
+        raise ValueError("Mixing matrix must be non-negative")
+    return mixing
+
+
+def age_contact_matrix(groups, width=2.0, background=0.2):
+    """简单的年龄接触矩阵：每行和为 1，其中 1 - background 按年龄组之差的高斯核集中在相近年龄组，其余均匀分布"""
+    offsets = np.arange(groups)[:, None] - np.arange(groups)[None, :]
+    kernel = np.exp(-0.5 * (offsets / max(width, 1e-9)) ** 2)
+    kernel /= kernel.sum(axis=1, keepdims=True)
+    return (1 - background) * kernel + background / groups
+
+
+def read_mixing(path, regions):
+    """读取混合（接触）矩阵表（Excel 或 CSV）：首列为组名，其余列以组名为表头，按 regions 的顺序返回方阵"""
+    table = read_table(path)
+    table = table.set_index(table.columns[0])
+    table.index = table.index.astype(str)
+    table.columns = table.columns.astype(str)
+    names = [str(region) for region in regions]
+    missing = set(names) - set(table.index) | set(names) - set(table.columns)
+    if missing:
+        raise ValueError(f"Mixing matrix is missing regions: {sorted(missing)}")
+    return validate_mixing(table.loc[names, names].to_numpy(), len(names))
+
+
+def run_structured(initial, basic_repro, sim_days, mixing, replicates=1, seed=None, interval=31,
+                   rate_distributions=None, aggregation=None, callback=None, rate_multipliers=None):
+    """
+    分组模型的核心：initial 为 (状态数 × 组数) 的初始人数，mixing 为 (组数 × 组数) 的混合矩阵，
+    rate_multipliers 为 {转换率名: 长度为组数的倍数}（未给出的转换率在各组相同）。
+
+    转换率与 run_ensemble 相同（相同种子下每条轨迹每天的 s、c、r1、r2、d 相同，所有组共用），
+    每天按当天的日率更新一次各状态（与 run_ode 的方程相同的一天步长差分），
+    感染力按组以混合矩阵耦合。所有轨迹与组以 (轨迹数 × 组数) 的数组同步推进。
+    返回:
+    - records: (轨迹数 × 记录条数 × 状态数 × 组数) 的数组；days: 记录天
+    - params: 与 run_ensemble 相同的键，值为每条轨迹最后一天参数组成的数组
+    """
+    initial = np.asarray(initial, dtype=float)
+    groups = initial.shape[1]
+    mixing = validate_mixing(mixing, groups)
+    population = initial.sum(axis=0)
+    if np.any(population <= 0):
+        raise ValueError("Population must be positive in every group")
+    if replicates < 1:
+        raise ValueError("Replicates must be at least 1")
+    multipliers = {}
+    for name, values in (rate_multipliers or {}).items():
+        if name not in RATE_NAMES:
+            raise ValueError(f"Unknown rate: {name}")
+        values = np.asarray(values, dtype=float)
+        if values.shape != (groups,) or np.any(values < 0):
+            raise ValueError(f"Multipliers for rate {name} must be {groups} non-negative values")
+        multipliers[name] = values
+
+    block_days = max(1, min(RATE_BLOCK_DAYS, RATE_BLOCK_VALUES // replicates))
+    rate_blocks = _iter_annual_rates(replicate_seeds(seed, replicates), sim_days, rate_distributions, block_days)
+
+    # 当前状态：轨迹数 × 状态数 × 组数
+    state = np.repeat(initial[None], replicates, axis=0)
+    S, I, C, R, D = (state[:, k] for k in range(len(STATES)))
+    days = record_days(sim_days, interval, aggregation)
+    records = np.empty((replicates, len(days), len(STATES), groups))
+    snapshot = 0
+
+    for day in range(1, sim_days + 1):
+        k = (day - 1) % block_days
+        if k == 0:
+            annual, daily = _with_infection_rate(next(rate_blocks), basic_repro)
+        s, i, c, r1, r2, d = (daily[name][:, k, None] * multipliers.get(name, 1.0) for name in RATE_NAMES)
+
+        # 感染力：一次矩阵运算耦合所有组
+        force = (C / population) @ mixing.T
+        new_infections = i * S * force
+        new_clinical = c * I
+        new_recovered_from_infection = r1 * I
+        new_recovered_from_clinical = r2 * C
+        new_deaths = d * C
+        new_susceptible = s * R
+
+        S += new_susceptible - new_infections
+        I += new_infections - new_clinical - new_recovered_from_infection
+        C += new_clinical - new_recovered_from_clinical - new_deaths
+        R += new_recovered_from_infection + new_recovered_from_clinical - new_susceptible
+        D += new_deaths
+
+        if snapshot < len(days) and day == days[snapshot]:
+            records[:, snapshot] = state
+            snapshot += 1
+            if callback is not None:
+                callback(day, sim_days)
+
+    params = _pack_params(basic_repro, *(rates[:, k] for name in RATE_NAMES
+                                         for rates in (annual[name], daily[name])))
+    return records, days, params
+
+
+def records_to_frame(records, days, group_label, group_names):
+    """将 (轨迹数 × 记录条数 × 状态数 × 组数) 的记录展开为长表：Replicate、组、Days 及五个状态"""
+    replicates, n_days, n_states, groups = records.shape
+    data = pd.DataFrame(np.round(records).transpose(0, 3, 1, 2).reshape(-1, n_states), columns=STATES)
+    data.insert(0, "Days", np.tile(days, replicates * groups))
+    data.insert(0, group_label, np.tile(np.repeat(np.asarray(group_names), n_days), replicates))
+    data.insert(0, "Replicate", np.repeat(np.arange(replicates), groups * n_days))
+    return data
+
+
+def _run_table(table, columns, mixing, basic_repro, sim_days, **kwargs):
+    """按组表（columns 的首列为组名）构造初始人数与转换率倍数，运行 run_structured 并返回长表与参数"""
+    label = columns[0]
+    missing = set(columns) - set(table.columns)
+    if missing:
+        raise ValueError(f"{label} table is missing columns: {sorted(missing)}")
+    cases = table[["Infected", "Clinical", "Recovered", "Death"]].to_numpy(dtype=float)
+    susceptible = table["Population"].to_numpy(dtype=float) - cases.sum(axis=1)
+    if np.any(susceptible < 0):
+        raise ValueError(f"Initial cases exceed the population of a {label.lower()}")
+    initial = np.vstack([susceptible, cases.T])
+    multipliers = {name: table[name].to_numpy(dtype=float) for name in RATE_NAMES if name in table.columns}
+    records, days, params = run_structured(initial, basic_repro, sim_days, mixing, rate_multipliers=multipliers,
+                                           **kwargs)
+    return records_to_frame(records, days, label, table[label].astype(str).to_numpy()), params
+
+
+def run_metapopulation(regions, mixing, basic_repro, sim_days, replicates=1, seed=None, interval=31,
+                       rate_distributions=None, aggregation=None, callback=None):
+    """
+    多地区（集合种群）模拟。
+    - regions: 地区表 DataFrame，列为 REGION_COLUMNS（Region、Population 及各状态初始人数）
+    - mixing: 地区间混合矩阵（地区数 × 地区数），mixing[g, h] 为 g 地区居民与 h 地区接触的权重；
+      单位矩阵即各地区互不影响
+    其余参数同 run_ensemble。
+    返回:
+    - data: 长表 DataFrame，列为 Replicate、Region、Days 及五个状态
+    - params: 与 run_ensemble 相同
+    """
+    return _run_table(regions, REGION_COLUMNS, mixing, basic_repro, sim_days, replicates=replicates, seed=seed,
+                      interval=interval, rate_distributions=rate_distributions, aggregation=aggregation,
+                      callback=callback)
+
+
+def run_age_structured(ages, contacts, basic_repro, sim_days, replicates=1, seed=None, interval=31,
+                       rate_distributions=None, aggregation=None, callback=None):
+    """
+    按年龄分层的模拟。
+    - ages: 年龄组表 DataFrame，列为 AGE_COLUMNS，可选列 s、i、c、r1、r2、d 为各年龄组的转换率倍数
+      （如 i 为易感性、c 为发病、d 为病死的年龄差异）
+    - contacts: 年龄组间接触矩阵（组数 × 组数），contacts[a, b] 为 a 年龄组与 b 年龄组接触的权重
+    其余参数同 run_ensemble。
+    返回:
+    - data: 长表 DataFrame，列为 Replicate、Age group、Days 及五个状态
+    - params: 与 run_ensemble 相同（未乘年龄倍数的基准转换率）
+    """
+    return _run_table(ages, AGE_COLUMNS, contacts, basic_repro, sim_days, replicates=replicates, seed=seed,
+                      interval=interval, rate_distributions=rate_distributions, aggregation=aggregation,
+                      callback=callback)
+
+
+def default_regions(population, init_infected, init_clinical, init_recovered, init_death, count):
+    """将总人口平均分配到 count 个地区，初始病例全部放在第一个地区（用于演示地区间传播）"""
+    populations = np.full(count, population // count)
+    populations[0] += population - populations.sum()
+    cases = np.zeros((count, 4), dtype=int)
+    cases[0] = [init_infected, init_clinical, init_recovered, init_death]
+    return pd.DataFrame({
+        "Region": [f"Region {k + 1}" for k in range(count)],
+        "Population": populations,
+        "Infected": cases[:, 0],
+        "Clinical": cases[:, 1],
+        "Recovered": cases[:, 2],
+        "Death": cases[:, 3],
+    })
+
+
+def default_age_groups(population, init_infected, init_clinical, init_recovered, init_death, count=16, band_years=5):
+    """按 band_years 岁划分 count 个年龄组（最后一组为开放组），人口按年龄递减的简单分布分配，
+    初始病例按人口比例分配到各年龄组；各年龄组的转换率倍数均为 1"""
+    lower = np.arange(count) * band_years
+    names = [f"{a}-{a + band_years - 1}" for a in lower[:-1]] + [f"{lower[-1]}+"]
+    weights = np.exp(-lower / 60)
+    weights /= weights.sum()
+
+    def split(total):
+        counts = np.floor(total * weights).astype(int)
+        counts[0] += total - counts.sum()
+        return counts
+
+    table = pd.DataFrame({"Age group": names, "Population": split(population)})
+    for column, total in zip(AGE_COLUMNS[2:], (init_infected, init_clinical, init_recovered, init_death)):
+        table[column] = split(total)
+    return table
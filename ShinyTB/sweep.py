@@ -0,0 +1,240 @@
+"""R0 参数扫描：以真实数据首年状态为初值，对一组 R0 并行运行模拟，
+生成与 Rwork/sim_ca.xlsx 相同列的逐年汇总表，并同时计算各状态相对真实数据的 MSE。
+
+命令行示例（在 ShinyTB 目录下运行）:
+    python sweep.py --real ../Rwork/real_ca.xlsx --r0 0.1:2.1:0.2 --replicates 9 --out ../Rwork/sim_ca.xlsx
+"""
+import argparse
+import multiprocessing
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+from sim import STATES, run_ensemble, run_ode
+
+DAYS_PER_YEAR = 365
+# 模拟状态名与 real_ca.xlsx / StatAnalysis.R 中列名的对应关系
+REAL_COLUMNS = {
+    "Susceptible": "Susceptible",
+    "Infected": "Infection",
+    "Clinical": "Clinical",
+    "Recovered": "Recovered",
+    "Death": "Death",
+}
+# StatAnalysis.R 中比较的四个状态
+MSE_STATES = ["Infection", "Clinical", "Recovered", "Death"]
+
+
+def read_table(path):
+    """按扩展名读取 Excel 或 CSV 表格"""
+    if str(path).lower().endswith((".xlsx", ".xls")):
+        return pd.read_excel(path)
+    return pd.read_csv(path)
+
+
+def write_table(table, path):
+    """按扩展名写出 Excel 或 CSV 表格"""
+    if str(path).lower().endswith((".xlsx", ".xls")):
+        table.to_excel(path, index=False)
+    else:
+        table.to_csv(path, index=False)
+
+
+def parse_r0_grid(text):
+    """解析 R0 网格：'start:stop:step'（含 stop）或逗号分隔的数值列表"""
+    if ":" in text:
+        start, stop, step = (float(x) for x in text.split(":"))
+        return [float(x) for x in np.round(np.arange(start, stop + step / 2, step), 10)]
+    return [float(x) for x in text.split(",") if x.strip()]
+
+
+def initial_state(real):
+    """取真实数据首年作为初始状态"""
+    first = real.sort_values("Year").iloc[0]
+    return {
+        "population": int(first["Population"]),
+        "init_infected": int(first["Infection"]),
+        "init_clinical": int(first["Clinical"]),
+        "init_recovered": int(first["Recovered"]),
+        "init_death": int(first["Death"]),
+    }
+
+
+def simulate_yearly(basic_repro, init, years, replicates, seed, rate_distributions=None, engine="ensemble"):
+    """运行一个 R0 的集合模拟，返回逐年（每 365 天）取值的轨迹均值表，首行为初始状态。
+
+    engine="ode" 时改为以均值转换率积分确定性方程（不使用 replicates 与 seed）。
+    """
+    sim_days = DAYS_PER_YEAR * (len(years) - 1)
+    initial = [
+        init["population"] - (init["init_infected"] + init["init_clinical"] + init["init_recovered"] + init["init_death"]),
+        init["init_infected"], init["init_clinical"], init["init_recovered"], init["init_death"],
+    ]
+    rows = [initial]
+    if engine == "ode":
+        data, _ = run_ode(init["population"], init["init_infected"], init["init_clinical"],
+                          init["init_recovered"], init["init_death"], basic_repro, sim_days,
+                          t_eval=DAYS_PER_YEAR * np.arange(len(years)), rate_distributions=rate_distributions)
+        rows = data[STATES].to_numpy()
+    elif engine != "ensemble":
+        raise ValueError(f"Unknown engine: {engine}")
+    elif sim_days > 0:
+        data, _ = run_ensemble(init["population"], init["init_infected"], init["init_clinical"],
+                               init["init_recovered"], init["init_death"], basic_repro, sim_days,
+                               replicates=replicates, seed=seed, interval=DAYS_PER_YEAR,
+                               rate_distributions=rate_distributions)
+        rows.extend(data.groupby("Days")[STATES].mean().to_numpy())
+    table = pd.DataFrame(rows, columns=STATES).rename(columns=REAL_COLUMNS)
+    table.insert(0, "Year", list(years))
+    table.insert(0, "R0", basic_repro)
+    table["Population"] = table[list(REAL_COLUMNS.values())].sum(axis=1)
+    return table
+
+
+def _sweep_task(task):
+    return simulate_yearly(*task)
+
+
+# 进程级共享的进程池（校准、敏感性分析与批量运行共用，不在每次映射时创建与关闭）。
+# 以 forkserver（平台不支持时为 spawn）方式启动工作进程：应用中的调用来自 Shiny 工作线程，
+# 从多线程进程中 fork 可能因其他线程持有的锁而死锁
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _pool_context():
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        # 在 forkserver 中预先导入模拟模块，新工作进程不必各自导入 NumPy 与 pandas
+        context.set_forkserver_preload(["sim"])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def shared_pool(workers):
+    """返回至少有 workers 个工作进程的共享进程池（首次使用或需要更多进程时创建，原进程池中已提交的任务照常完成）"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers < workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool_workers = max(workers, os.cpu_count() or 1)
+            _pool = ProcessPoolExecutor(max_workers=_pool_workers, mp_context=_pool_context())
+        return _pool
+
+
+def _discard_pool(pool):
+    """工作进程异常退出后进程池不再可用，丢弃它，下次映射时重建"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def shutdown_pool():
+    """关闭共享进程池（应用退出时调用，可注册为 App.on_shutdown 回调）"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def parallel_map(func, tasks, processes=None):
+    """在共享进程池中按顺序映射任务，同时运行的任务不超过 processes 个；只有一个任务或一个进程时直接串行运行"""
+    tasks = list(tasks)
+    workers = min(processes or os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        return [func(task) for task in tasks]
+    pool = shared_pool(workers)
+    results = [None] * len(tasks)
+    running = {}
+    queued = iter(enumerate(tasks))
+    try:
+        while True:
+            for index, task in queued:
+                running[pool.submit(func, task)] = index
+                if len(running) >= workers:
+                    break
+            if not running:
+                return results
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise
+    except BaseException:
+        for future in running:
+            future.cancel()
+        raise
+
+
+def compute_mse(sim_table, real):
+    """按 R0 分组，以 Year 与真实数据对齐，计算各状态的均方误差（与 StatAnalysis.R 一致）"""
+    merged = sim_table.merge(real, on="Year", how="left", suffixes=("_sim", "_real"))
+    mse = {"R0": []}
+    for state in MSE_STATES:
+        mse[state] = []
+    for r0, group in merged.groupby("R0", sort=True):
+        mse["R0"].append(r0)
+        for state in MSE_STATES:
+            mse[state].append(np.nanmean((group[f"{state}_sim"] - group[f"{state}_real"]) ** 2))
+    return pd.DataFrame(mse)
+
+
+def run_sweep(r0_values, real, replicates=1, seed=None, processes=None, engine="ensemble"):
+    """对 R0 网格并行运行模拟。
+
+    参数:
+    - r0_values: R0 取值列表
+    - real: 真实数据 DataFrame（列 Year、Infection、Clinical、Recovered、Death、Population）
+    - replicates: 每个 R0 的轨迹条数，结果取均值
+    - seed: 根随机种子，每个 R0 使用其派生的独立种子
+    - processes: 进程数，默认使用全部 CPU 核心
+    - engine: "ensemble"（随机集合模拟）或 "ode"（均值转换率的确定性方程）
+    返回:
+    - table: 逐年汇总表，列为 R0、Year、Susceptible、Infection、Clinical、Recovered、Death、Population
+    - mse: 每个 R0 下各状态的 MSE 表
+    """
+    print(f"Running R0 sweep over {len(r0_values)} values...", flush=True)
+    years = sorted(real["Year"].unique())
+    init = initial_state(real)
+    seeds = np.random.SeedSequence(seed).spawn(len(r0_values))
+    tasks = [(r0, init, years, replicates, child, None, engine) for r0, child in zip(r0_values, seeds)]
+    table = pd.concat(parallel_map(_sweep_task, tasks, processes), ignore_index=True)
+    return table, compute_mse(table, real)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run an R0 sweep against real-world TB data.")
+    parser.add_argument("--real", default=os.path.join("..", "Rwork", "real_ca.xlsx"), help="real-world data (.xlsx or .csv)")
+    parser.add_argument("--r0", default="0.1:2.1:0.2", help="R0 grid, 'start:stop:step' or comma-separated values")
+    parser.add_argument("--replicates", type=int, default=1, help="replicates per R0 value")
+    parser.add_argument("--seed", type=int, default=None, help="root random seed")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--engine", choices=["ensemble", "ode"], default="ensemble", help="stochastic ensemble or deterministic ODE at mean rates")
+    parser.add_argument("--out", default="sim_ca.xlsx", help="yearly sweep table (.xlsx or .csv)")
+    parser.add_argument("--mse-out", default=None, help="optional MSE table (.xlsx or .csv)")
+    args = parser.parse_args(argv)
+
+    real = read_table(args.real)
+    table, mse = run_sweep(parse_r0_grid(args.r0), real, replicates=args.replicates,
+                           seed=args.seed, processes=args.processes, engine=args.engine)
+    write_table(table, args.out)
+    if args.mse_out:
+        write_table(mse, args.mse_out)
+    print(mse.to_string(index=False), flush=True)
+    for state in MSE_STATES:
+        best = mse.loc[mse[state].idxmin(), "R0"]
+        print(f"{state} Best R0: {best}", flush=True)
+
+
+if __name__ == "__main__":
+    main()